@@ -20,6 +20,7 @@ from .tools import get_closest_gimera
 from .tools import get_effective_state
 from .tools import _make_sure_hidden_gimera_dir
 from .cachedir import _get_cache_dir
+from . import lockfile
 
 
 def _check_sha_belongs_to_branch(main_repo, repo_yml):
@@ -62,10 +63,13 @@ def _apply(
     no_fetch=False,
     migrate_changes=False,
     raise_exception=False,
+    frozen=False,
 ):
     """
     :param repos: user input parameter from commandline
     :param update: bool - flag from command line
+    :param frozen: apply what gimera.lock says: repos that match it are left
+        alone, the others are applied at the locked sha
     """
     if raise_exception:
         os.environ["GIMERA_EXCEPTION_THAN_SYSEXIT"] = "1"
@@ -85,19 +89,61 @@ def _apply(
     if main_repo.path != closest_gimera:
         sub_path = closest_gimera
 
-    _internal_apply(
-        repos,
-        update,
-        force_type,
-        strict=strict,
-        recursive=recursive,
-        no_patches=no_patches,
-        remove_invalid_branches=remove_invalid_branches,
-        auto_commit=auto_commit,
-        no_fetch=no_fetch,
-        sub_path=sub_path,
-        migrate_changes=migrate_changes,
-    )
+    # on every way out, an error or a frozen apply with nothing to do
+    # included: the budget is not kept by the runs that went well only
+    try:
+        locked_shas = None
+        if frozen:
+            config = Config(force_type=force_type, recursive=recursive)
+            locked_shas = lockfile.verify(
+                main_repo, config, config.get_repos(repos), sub_path or main_repo.path
+            )
+            if not locked_shas:
+                return
+            repos = list(locked_shas)
+            update = False
+            # the patch files are as locked; lockfile.verify made sure there
+            # are no local edits that would need new ones
+            no_patches = True
+
+        _internal_apply(
+            repos,
+            update,
+            force_type,
+            strict=strict,
+            recursive=recursive,
+            no_patches=no_patches,
+            remove_invalid_branches=remove_invalid_branches,
+            auto_commit=auto_commit,
+            no_fetch=no_fetch,
+            sub_path=sub_path,
+            migrate_changes=migrate_changes,
+            locked_shas=locked_shas,
+        )
+    finally:
+        _enforce_cache_budget()
+
+
+def _enforce_cache_budget():
+    """Evict old cache entries if cache_max_bytes in ~/.gimera is exceeded.
+
+    After the apply, not before: the entries this run needed are the most
+    recently used ones then, and the apply itself is not slowed down.
+    """
+    from .cachemaint import enforce_budget
+
+    try:
+        enforce_budget()
+    except Exception as ex:
+        click.secho(f"Could not keep the cache within its budget: {ex}", fg="yellow")
+
+
+def _record_pin(effective_path, repo):
+    """Register the pin machine-wide, for `gimera cache gc`."""
+    from .cacheindex import record_pin
+
+    if repo.sha and repo.url:
+        record_pin(repo.url, repo.sha, effective_path, repo.path)
 
 
 def _commit_recursive_changes(main_repo, repo, effective_path, common_vars):
@@ -129,8 +175,13 @@ def _internal_apply(
     sub_path=None,
     no_fetch=None,
     migrate_changes=None,
+    locked_shas=None,
     **options,
 ):
+    """
+    :param locked_shas: path -> sha from gimera.lock (apply --frozen); the
+        repos are applied at that sha and gimera.yml is not written
+    """
     common_vars = common_vars or {}
     main_repo = _get_main_repo()
     effective_path = sub_path or main_repo.path
@@ -141,6 +192,11 @@ def _internal_apply(
         parent_config=parent_config,
     )
     repos = config.get_repos(repos)
+    for repo in repos:
+        if locked_shas and str(repo.path) in locked_shas:
+            # not through the setter: that writes gimera.yml
+            repo._sha = locked_shas[str(repo.path)]
+            repo.freeze_sha = True
     _fetch_repos_in_parallel(
         main_repo, repos, update=update, minimal_fetch=no_fetch, no_fetch=no_fetch
     )
@@ -193,6 +249,7 @@ def _internal_apply(
                     if not strict:
                         # not submodules inside integrated modules
                         force_type = REPO_TYPE_INT
+                _record_pin(effective_path, repo)
 
                 if recursive:
                     _apply_subgimera(
@@ -215,6 +272,21 @@ def _internal_apply(
                     main_repo.path,
                     [main_repo.path / relative_sub_path / repo.path for repo in repos],
                 )
+        if not parent_config and not locked_shas:
+            _write_lockfile(main_repo, config, repos, effective_path)
+
+
+def _write_lockfile(main_repo, config, repos, effective_path):
+    """Keep gimera.lock in step with what was applied - see lockfile.
+
+    Only for the gimera.yml the apply started from: the tree of an integrated
+    repo covers whatever its own gimera.yml put into it.
+    """
+    if not lockfile.wanted(config):
+        return
+    if lockfile.write(main_repo, config, repos, effective_path):
+        click.secho(f"Updated {lockfile.lock_path(config)}", fg="cyan")
+        lockfile.commit(config)
 
 
 def _apply_subgimera(
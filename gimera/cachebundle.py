@@ -0,0 +1,300 @@
+"""Seed golden caches from git bundles: gimera cache export / import
+
+A fresh CI runner starts with an empty cache and clones every repo over the
+network - many GB for an odoo project, and not at all on an air-gapped host.
+`gimera cache export DIR` writes the cache entries as git bundles into DIR,
+together with a manifest.json that maps entry names to URLs and bundle files.
+`gimera cache import DIR` turns them back into cache entries; the next apply
+only fetches what happened upstream since the export.
+
+Exporting into the same directory again is incremental: the new bundle of an
+entry holds only what the ones before it do not (`--not <their tips>`), and
+an entry that did not change gets none. Import applies them in order.
+
+A partial entry is bundled with `--filter=blob:none` - bundling it in full
+would fetch every missing blob from the remote first. The blobs it does hold
+(the snapshots gimera extracted) go into a pack file next to the bundle, so
+the imported entry can extract them without any network.
+"""
+
+import json
+import shutil
+import subprocess
+import time
+import uuid
+from pathlib import Path
+
+import click
+
+from .cachedir import cache_root
+from .cachedir import is_partial_clone
+from .consts import gitcmd as git
+from .tools import _raise_error
+
+MANIFEST = "manifest.json"
+VERSION = 1
+
+
+def _git(path, *args, input=None):
+    return subprocess.run(
+        git + list(args),
+        cwd=path,
+        input=input,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    ).stdout
+
+
+def load_manifest(directory):
+    path = Path(directory) / MANIFEST
+    if not path.exists():
+        return {"version": VERSION, "entries": {}}
+    try:
+        manifest = json.loads(path.read_text())
+    except json.JSONDecodeError as ex:
+        _raise_error(f"{path} is not valid JSON: {ex}")
+        return None
+    if manifest.get("version") != VERSION:
+        _raise_error(f"{path}: unknown manifest version {manifest.get('version')}")
+        return None
+    return manifest
+
+
+def _save_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST
+    tmp = path.with_name(f".{MANIFEST}.{uuid.uuid4()}")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp.rename(path)
+
+
+def _tips(path):
+    return sorted(
+        set(_git(path, "for-each-ref", "--format=%(objectname)").split())
+    )
+
+
+def _present(path, shas):
+    """The objects of `shas` that the entry has."""
+    if not shas:
+        return []
+    out = subprocess.run(
+        git + ["cat-file", "--batch-check"],
+        cwd=path,
+        input="\n".join(shas) + "\n",
+        capture_output=True,
+        encoding="utf8",
+    ).stdout
+    return [
+        line.split()[0] for line in out.splitlines() if not line.endswith("missing")
+    ]
+
+
+def _local_blobs(path):
+    """Blobs a partial entry holds - listing them never fetches."""
+    out = _git(
+        path,
+        "cat-file",
+        "--batch-all-objects",
+        "--batch-check=%(objectname) %(objecttype)",
+    )
+    return {
+        line.split()[0] for line in out.splitlines() if line.endswith(" blob")
+    }
+
+
+def _exported_blobs(directory, exports):
+    exported = set()
+    for export in exports:
+        if not export.get("blobs"):
+            continue
+        idx = Path(directory) / (export["blobs"] + ".idx")
+        with idx.open("rb") as f:
+            out = subprocess.run(
+                ["git", "show-index"], stdin=f, capture_output=True, encoding="utf8"
+            ).stdout
+        exported |= {line.split()[1] for line in out.splitlines()}
+    return exported
+
+
+def _url_of(entry):
+    if entry.get("url"):
+        return entry["url"]
+    try:
+        return _git(entry["path"], "config", "remote.origin.url").strip()
+    except subprocess.CalledProcessError:
+        return None
+
+
+def export_entry(entry, directory, manifest):
+    """Bundle what is new in `entry` since the last export; None if nothing."""
+    path = entry["path"]
+    name = entry["name"]
+    record = manifest["entries"].setdefault(
+        name, {"url": _url_of(entry), "exports": []}
+    )
+    partial = is_partial_clone(path)
+    record["partial"] = partial
+    try:
+        record["head"] = _git(path, "symbolic-ref", "HEAD").strip()
+    except subprocess.CalledProcessError:
+        record["head"] = None
+    tips = _tips(path)
+    known = _present(
+        path, sorted({sha for x in record["exports"] for sha in x["tips"]})
+    )
+    if not tips or set(tips) <= set(known):
+        return None
+
+    # numbered, so two exports within a second do not collide
+    stamp = f"{len(record['exports']) + 1:03d}-{time.strftime('%Y%m%dT%H%M%S')}"
+    bundle = f"{name}-{stamp}.bundle"
+    args = ["bundle", "create", "--quiet", str(Path(directory) / bundle), "--all"]
+    if partial:
+        args.append("--filter=blob:none")
+    if known:
+        args += ["--not"] + known
+    try:
+        _git(path, *args)
+    except subprocess.CalledProcessError as ex:
+        # refs moved, but only to commits an earlier bundle has
+        if "empty bundle" in (ex.stderr or ""):
+            return None
+        raise
+    export = {"bundle": bundle, "tips": tips, "blobs": None, "created": time.time()}
+
+    if partial:
+        blobs = sorted(
+            _local_blobs(path) - _exported_blobs(directory, record["exports"])
+        )
+        if blobs:
+            base = Path(directory) / f"{name}-{stamp}-blobs"
+            digest = _git(
+                path,
+                "pack-objects",
+                "--quiet",
+                str(base),
+                input="\n".join(blobs) + "\n",
+            )
+            export["blobs"] = f"{base.name}-{digest.strip()}"
+    record["exports"].append(export)
+    return export
+
+
+def export(directory, root=None, names=None):
+    """Write bundles of all (or the named) cache entries into `directory`."""
+    from .cachemaint import format_size
+    from .cachemaint import iter_entries
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(directory)
+    exported = []
+    for entry in iter_entries(root):
+        if names and entry["name"] not in names:
+            continue
+        started = time.time()
+        try:
+            result = export_entry(entry, directory, manifest)
+        except subprocess.CalledProcessError as ex:
+            click.secho(
+                f"Could not export {entry['name']}: {(ex.stderr or '').strip()}",
+                fg="red",
+            )
+            continue
+        if not result:
+            click.secho(f"{entry['name']}: up to date", fg="green")
+            continue
+        files = [result["bundle"]]
+        if result["blobs"]:
+            files.append(result["blobs"] + ".pack")
+        size = sum((directory / x).stat().st_size for x in files)
+        click.secho(
+            f"{entry['name']}: {', '.join(files)} ({format_size(size)}, "
+            f"{time.time() - started:.1f}s)",
+            fg="cyan",
+        )
+        exported.append(entry["name"])
+        # after every entry, so an interrupted export keeps what it wrote
+        _save_manifest(directory, manifest)
+    _save_manifest(directory, manifest)
+    return exported
+
+
+def import_entry(name, record, directory, root):
+    """Build the cache entry `name` from its bundles; False if it exists."""
+    from .cacheindex import record_read
+    from .cacheindex import record_write
+
+    golden_path = Path(root) / name
+    if golden_path.exists():
+        return False
+    directory = Path(directory)
+    tmp = golden_path.with_name(f"{name}.import-{uuid.uuid4()}")
+    tmp.mkdir(parents=True)
+    try:
+        _git(tmp, "init", "--bare", "--quiet")
+        # what `git clone --bare` leaves behind, so the entry behaves like one
+        if record.get("url"):
+            _git(tmp, "config", "remote.origin.url", record["url"])
+        if record.get("partial"):
+            _git(tmp, "config", "remote.origin.promisor", "true")
+            _git(tmp, "config", "remote.origin.partialclonefilter", "blob:none")
+        for export in record["exports"]:
+            bundle = directory / export["bundle"]
+            _git(tmp, "fetch", "--quiet", "--no-tags", str(bundle), "+refs/*:refs/*")
+            if export.get("blobs"):
+                pack_dir = tmp / "objects" / "pack"
+                digest = export["blobs"].rsplit("-", 1)[1]
+                for suffix in (".idx", ".pack"):
+                    shutil.copy(
+                        directory / (export["blobs"] + suffix),
+                        pack_dir / f"pack-{digest}{suffix}",
+                    )
+        if record.get("head"):
+            _git(tmp, "symbolic-ref", "HEAD", record["head"])
+        tmp.rename(golden_path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if record.get("url"):
+        record_read(golden_path, record["url"])
+    record_write(golden_path)
+    return True
+
+
+def import_(directory, root=None, names=None):
+    """Create the cache entries of an export that are not in the cache yet."""
+    from .cacheindex import entry_size
+    from .cachemaint import format_size
+
+    root = Path(root) if root else cache_root()
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(directory)
+    if not manifest["entries"]:
+        _raise_error(f"No {MANIFEST} with entries in {directory}")
+        return []
+    imported = []
+    for name, record in sorted(manifest["entries"].items()):
+        if names and name not in names:
+            continue
+        if not record.get("exports"):
+            continue
+        started = time.time()
+        try:
+            done = import_entry(name, record, directory, root)
+        except subprocess.CalledProcessError as ex:
+            click.secho(
+                f"Could not import {name}: {(ex.stderr or '').strip()}", fg="red"
+            )
+            continue
+        if not done:
+            click.secho(f"{name}: already in the cache, left alone", fg="yellow")
+            continue
+        click.secho(
+            f"{name}: imported ({format_size(entry_size(root / name))}, "
+            f"{time.time() - started:.1f}s)",
+            fg="green",
+        )
+        imported.append(name)
+    return imported
@@ -0,0 +1,380 @@
+"""`gimera cached`: one long-running process that owns the golden cache.
+
+Every gimera invocation starts cold - it imports click, inquirer and yaml,
+opens the cache repositories and negotiates with the remotes again. On a CI
+host that runs a dozen jobs at once, all of them race for the same cache
+entries and wait on each other's locks instead of sharing the work.
+
+With the daemon running, `_get_cache_dir` and `_fetch_repos_in_parallel` hand
+their cache work over a unix socket to it instead of doing it themselves:
+
+  * Writes to one cache entry are serialized in the daemon. Two jobs asking
+    for the same URL wait for one fetch, not for two.
+  * "Do you have this commit?" is answered by a `git cat-file --batch-check`
+    that stays open per entry, not by a new git process per question.
+  * Entries that were asked for recently are refreshed in the background, so
+    the next job usually finds the branch already fetched.
+
+The daemon is optional. Nothing changes when it is not running, and a client
+that cannot reach it - or gets an error back - does the work itself as
+before. So a crashed daemon costs speed, never a build.
+
+Protocol: one JSON object per line in each direction. A request carries an
+"op" plus its arguments, the answer has "ok" and either the result or
+"error".
+
+Extraction (`git archive` into the project) stays in the client on purpose:
+it streams straight into the target directory, and routing it through the
+daemon would only add a copy.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import click
+
+from .cachedir import cache_root
+from .cachedir import in_use_while
+from .consts import gitcmd as git
+
+SOCKET_ENV = "GIMERA_DAEMON_SOCKET"
+
+# Entries asked for within this many seconds count as hot and are refreshed
+# in the background.
+HOT_SECONDS = 3600
+DEFAULT_REFRESH_INTERVAL = 600
+# While a request is worked on the daemon sends an empty line this often, so
+# that a clone of an hour is not taken for a hung daemon.
+KEEPALIVE_SECONDS = 30
+
+
+def socket_path():
+    return Path(os.environ.get(SOCKET_ENV) or cache_root() / ".gimera-cached.sock")
+
+
+def is_running():
+    return request("ping") is not None
+
+
+def request(op, timeout=None, **params):
+    """Ask the daemon; None if there is none or it failed.
+
+    None means "do it yourself", and that is the only thing a caller has to
+    handle - the error is printed with --verbose but never raised. A daemon
+    that does not answer within `timeout` - by default the idle timeout of
+    git commands, GIMERA_GIT_IDLE_TIMEOUT - counts as failed, too: a hung
+    daemon must not hang the build. The timeout is for silence, not for the
+    whole request: the daemon's keepalives restart it.
+    """
+    from .tools import _git_limits
+    from .tools import verbose
+
+    if os.getenv("GIMERA_NO_DAEMON") == "1":
+        return None
+    if timeout is None:
+        timeout = _git_limits()[1]
+    path = socket_path()
+    if not path.exists():
+        return None
+    payload = dict(params, op=op)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall((json.dumps(payload) + "\n").encode("utf8"))
+            answer = _readline(sock)
+    except OSError as ex:
+        verbose(f"gimera cached not reachable at {path}: {ex}")
+        return None
+    if not answer:
+        return None
+    answer = json.loads(answer)
+    if not answer.get("ok"):
+        verbose(f"gimera cached could not {op}: {answer.get('error')}")
+        return None
+    return answer
+
+
+def _readline(sock):
+    """The answer line, skipping the empty keepalive lines before it."""
+    buffer = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return buffer.decode("utf8").strip()
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            if line.strip():
+                return line.decode("utf8").strip()
+
+
+def repo_params(repo_yml):
+    """What the daemon needs to know about a gimera.yml repo entry."""
+    return {
+        "url": repo_yml.url,
+        "branch": repo_yml.branch,
+        "sha": repo_yml.sha,
+        "type": repo_yml.type,
+        "path": str(repo_yml.path),
+    }
+
+
+class _RepoRequest(object):
+    """The part of a gimera.yml repo entry the cache functions look at."""
+
+    def __init__(self, data):
+        self.url = data["url"]
+        self.branch = data.get("branch")
+        self.sha = data.get("sha")
+        self.type = data.get("type")
+        self.path = data.get("path") or data["url"]
+
+
+class _BatchCheck(object):
+    """A `git cat-file --batch-check` kept open for one cache entry."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.proc = subprocess.Popen(
+            git + ["cat-file", "--batch-check"],
+            cwd=path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            encoding="utf8",
+        )
+
+    def contains(self, sha):
+        with self.lock:
+            self.proc.stdin.write(f"{sha}\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        if not line:
+            raise OSError("cat-file --batch-check went away")
+        return not line.rstrip().endswith("missing")
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+
+
+class CacheService(object):
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.server = None
+        self.refresh_interval = refresh_interval
+        self._locks = {}
+        self._checks = {}
+        self._hot = {}
+        self._guard = threading.Lock()
+        self._stop = threading.Event()
+
+    def _lock_for(self, path):
+        with self._guard:
+            return self._locks.setdefault(str(path), threading.Lock())
+
+    def _contains(self, path, sha):
+        with self._guard:
+            check = self._checks.get(str(path))
+            if not check:
+                check = self._checks[str(path)] = _BatchCheck(path)
+        try:
+            return check.contains(sha)
+        except OSError:
+            with self._guard:
+                self._checks.pop(str(path), None)
+            check.close()
+            return False
+
+    def _forget_checks(self, path):
+        # After a fetch the open cat-file has a stale view of the packs.
+        with self._guard:
+            check = self._checks.pop(str(path), None)
+        if check:
+            check.close()
+
+    def _remember(self, data):
+        with self._guard:
+            self._hot[data["url"]] = (time.time(), dict(data, sha=None))
+
+    def handle(self, data):
+        op = data.get("op")
+        method = getattr(self, f"op_{op}", None)
+        if not method:
+            raise ValueError(f"Unknown op: {op}")
+        return method(data) or {}
+
+    def op_ping(self, data):
+        return {"pid": os.getpid()}
+
+    def op_stop(self, data):
+        # shutdown() waits for serve_forever to return, which cannot happen
+        # while this very request is being handled
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {"pid": os.getpid()}
+
+    def op_ensure(self, data):
+        """Clone the entry if needed and make sure the sha is in it."""
+        from .cachedir import _get_cache_dir
+        from .cachedir import _make_cache_path
+        from .repo import Repo
+
+        repo_yml = _RepoRequest(data)
+        golden_path = _make_cache_path(repo_yml.url)
+        self._remember(data)
+        if repo_yml.sha and golden_path.exists():
+            if self._contains(golden_path, repo_yml.sha):
+                return {"path": str(golden_path), "sha": repo_yml.sha}
+
+        # pinned for this request only: the daemon outlives every apply
+        with self._lock_for(golden_path), in_use_while(golden_path.name):
+            with _get_cache_dir(
+                Repo(cache_root()),
+                repo_yml,
+                update=data.get("update"),
+                use_daemon=False,
+                pin=False,
+            ):
+                pass
+        self._forget_checks(golden_path)
+        return {"path": str(golden_path), "sha": repo_yml.sha}
+
+    def op_fetch(self, data):
+        from .cachedir import _get_cache_dir
+        from .cachedir import _make_cache_path
+        from .fetch import _fetch_branch
+        from .repo import Repo
+
+        repo_yml = _RepoRequest(data)
+        golden_path = _make_cache_path(repo_yml.url)
+        self._remember(data)
+        if not golden_path.exists():
+            return {"path": None}
+        if data.get("minimal"):
+            if repo_yml.sha:
+                present = self._contains(golden_path, repo_yml.sha)
+            else:
+                present = Repo(golden_path).contains_branch(repo_yml.branch)
+            if present:
+                return {"path": str(golden_path), "fetched": False}
+
+        with self._lock_for(golden_path), in_use_while(golden_path.name):
+            with _get_cache_dir(
+                Repo(cache_root()),
+                repo_yml,
+                no_action_if_not_exist=True,
+                use_daemon=False,
+                pin=False,
+            ) as cache_dir:
+                if cache_dir is None:
+                    return {"path": None}
+                _fetch_branch(
+                    Repo(cache_dir),
+                    repo_yml,
+                    filter_remote="origin",
+                    update=bool(data.get("update")),
+                )
+        self._forget_checks(golden_path)
+        return {"path": str(golden_path), "fetched": True}
+
+    def refresh_hot(self, now=None):
+        """Fetch every entry somebody asked for within the last hour."""
+        now = now or time.time()
+        with self._guard:
+            hot = [x for when, x in self._hot.values() if now - when < HOT_SECONDS]
+        for data in hot:
+            if self._stop.is_set():
+                return
+            try:
+                self.op_fetch(dict(data, minimal=False))
+            except Exception as ex:
+                click.secho(f"Background refresh of {data['url']} failed: {ex}", fg="yellow")
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh_hot()
+
+    def close(self):
+        self._stop.set()
+        with self._guard:
+            checks = list(self._checks.values())
+            self._checks.clear()
+        for check in checks:
+            check.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        done = threading.Event()
+        writing = threading.Lock()
+
+        def keepalive():
+            while not done.wait(KEEPALIVE_SECONDS):
+                with writing:
+                    try:
+                        self.wfile.write(b"\n")
+                    except OSError:
+                        return
+
+        threading.Thread(target=keepalive, daemon=True).start()
+        try:
+            data = json.loads(line)
+            answer = dict(self.server.service.handle(data), ok=True)
+        except BaseException as ex:
+            # _raise_error ends in sys.exit unless told otherwise - in here
+            # that would only end this one request, so report it instead.
+            answer = {"ok": False, "error": str(ex) or type(ex).__name__}
+        finally:
+            done.set()
+        with writing:
+            self.wfile.write((json.dumps(answer) + "\n").encode("utf8"))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    """Run the daemon in the foreground until interrupted."""
+    path = socket_path()
+    if is_running():
+        click.secho(f"gimera cached already runs at {path}", fg="yellow")
+        return
+    if path.exists():
+        # left behind by a daemon that was killed
+        path.unlink()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cache_root().mkdir(parents=True, exist_ok=True)
+
+    # The daemon is never interactive - there is nobody to answer.
+    os.environ["GIMERA_NON_INTERACTIVE"] = "1"
+    os.environ["GIT_TERMINAL_PROMPT"] = "0"
+    os.environ["GIMERA_EXCEPTION_THAN_SYSEXIT"] = "1"
+
+    service = CacheService(refresh_interval=refresh_interval)
+    server = _Server(str(path), _Handler)
+    server.service = service
+    service.server = server
+    refresher = threading.Thread(target=service._refresh_loop, daemon=True)
+    refresher.start()
+    click.secho(f"gimera cached serving {cache_root()} at {path}", fg="green")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        server.server_close()
+        if path.exists():
+            path.unlink()
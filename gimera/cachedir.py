@@ -1,12 +1,18 @@
+import atexit
 import os
+import re
 import time
 import uuid
 import click
+from concurrent.futures import ThreadPoolExecutor
 import shutil
+import socket
 import subprocess
+import threading
 from pathlib import Path
 from .consts import gitcmd as git
 from .consts import REPO_TYPE_INT
+from .consts import REPO_TYPE_SUB
 from .repo import Repo
 from .tools import prepare_dir
 from .tools import remember_cwd
@@ -14,9 +20,13 @@ from .tools import reformat_url
 from .tools import _raise_error
 from .tools import rmtree
 from .tools import replace_dir_with
-from .tools import temppath
+from .tools import file_age
+from .tools import verbose
 from .userconfig import explain_no_cache
 from .userconfig import is_no_cache
+from .userconfig import mirror_url
+from .userconfig import cache_layers
+from .userconfig import cache_peers
 
 # The golden cache is a bare clone, kept once. An older gimera also wrote a
 # gzipped tarball of the same packfile next to it - see _drop_legacy_tarfile.
@@ -32,6 +42,19 @@ def cache_root():
     )
 
 
+# <entry>.<uuid>, <entry>.compact-<uuid>, <pool>.init-<uuid>, ... - the
+# clones and rewrites that are still being built next to the entry they
+# will replace
+_TEMP_SUFFIX = re.compile(
+    r"\.([a-z]+-)?[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+)
+
+
+def is_temp_dir(path):
+    """Whether `path` is a cache entry under construction, not an entry."""
+    return bool(_TEMP_SUFFIX.search(Path(path).name))
+
+
 def _make_cache_path(url):
     try:
         urlsafe = reformat_url(url, "git")
@@ -43,12 +66,200 @@ def _make_cache_path(url):
     return cache_root() / urlsafe
 
 
+# Same ceiling as wait_git_lock: a lock older than that was left behind by a
+# process that got killed, not held by one that is still working. Used only
+# for lockfiles that do not name a holder this host can check.
+CACHE_LOCK_TIMEOUT = 3600
+CACHE_LOCK_STALE_AGE = 3600
+
+
+# entries whose cache_lock the current thread holds
+_locks_held = threading.local()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _lock_is_stale(lockfile):
+    """Whether the holder of `lockfile` is gone.
+
+    The holder writes "<pid> <host>" into it. On the same host the lock is
+    stale exactly when that process is dead, however long it has been held -
+    a fetch of an hour is not broken. Other hosts (a shared cache) and
+    lockfiles without a holder fall back to the age.
+    """
+    try:
+        pid, host = lockfile.read_text().split()
+        pid = int(pid)
+    except (OSError, ValueError):
+        pid, host = None, None
+    if pid and host == socket.gethostname():
+        return not _pid_alive(pid)
+    return file_age(lockfile) > CACHE_LOCK_STALE_AGE
+
+
+@contextmanager
+def cache_lock(golden_path, timeout=CACHE_LOCK_TIMEOUT):
+    """Exclusive use of one cache entry.
+
+    Taken by clones and fetches as well as by the maintenance that rewrites
+    the packs, so neither runs into the other. The lockfile sits next to the
+    entry (`<entry>.lock`), not inside it: it must survive the entry being
+    replaced or removed while it is held.
+
+    `timeout` is how long to wait for it. A lock whose holder died is
+    removed while waiting, see _lock_is_stale.
+
+    A thread that holds it already goes on: a fetch that has to rebuild the
+    entry clones it again under the same lock.
+    """
+    from .filelock import FileLock
+    from .filelock import FileLockException
+
+    held = _locks_held.__dict__.setdefault("paths", set())
+    if str(golden_path) in held:
+        yield
+        return
+    deadline = time.time() + timeout
+    while True:
+        lock = FileLock(str(golden_path), timeout=min(5, timeout))
+        lockfile = Path(lock.lockfile)
+        if lockfile.exists() and _lock_is_stale(lockfile):
+            click.secho(f"Removing stale lock {lockfile}", fg="yellow")
+            try:
+                lockfile.unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            lock.acquire()
+            break
+        except FileLockException:
+            if time.time() >= deadline:
+                raise
+    try:
+        os.write(lock.fd, f"{os.getpid()} {socket.gethostname()}\n".encode())
+    except OSError:
+        pass
+    with lock:
+        held.add(str(golden_path))
+        try:
+            yield
+        finally:
+            held.discard(str(golden_path))
+
+
+def in_use_dir():
+    """One file per running gimera process, listing the entries it uses."""
+    return cache_root() / ".in-use"
+
+
+_in_use_here = set()
+
+
+def _record_use(golden_path, repo_yml, pin=True):
+    """Note that this process reads the entry, for the LRU eviction.
+
+    Two records: the read time in the cache index, which unlike the fetch
+    markers of cachemaint.last_used also moves when a pin did not change, and
+    a pin for as long as this process lives, so that no eviction running in
+    parallel takes the entry away underneath us - without `pin` the caller
+    keeps it with in_use_while instead. Bookkeeping only - failing to write
+    it must never fail an apply.
+    """
+    from .cacheindex import record_read
+
+    record_read(
+        golden_path,
+        repo_yml.url,
+        used_as_submodule=repo_yml.type == REPO_TYPE_SUB,
+    )
+    if pin:
+        _pin_in_use(golden_path.name)
+
+
+def _pin_in_use(name):
+    """Keep evictions away from `name` for as long as this process lives."""
+    with _in_use_lock:
+        if name not in _in_use_here:
+            _in_use_here.add(name)
+            _write_in_use()
+
+
+# entry name -> requests reading it right now, see in_use_while
+_in_use_requests = {}
+_in_use_lock = threading.Lock()
+_release_registered = []
+
+
+@contextmanager
+def in_use_while(name):
+    """Keep evictions away from `name` for the duration of the block.
+
+    For a process that does not end after one apply - `cache serve` would
+    otherwise hold on to every entry a peer ever cloned.
+    """
+    with _in_use_lock:
+        _in_use_requests[name] = _in_use_requests.get(name, 0) + 1
+        _write_in_use()
+    try:
+        yield
+    finally:
+        with _in_use_lock:
+            _in_use_requests[name] -= 1
+            if not _in_use_requests[name]:
+                del _in_use_requests[name]
+            _write_in_use()
+
+
+def _write_in_use():
+    pins = in_use_dir() / str(os.getpid())
+    names = _in_use_here | set(_in_use_requests)
+    try:
+        if not names:
+            pins.unlink(missing_ok=True)
+            return
+        if not _release_registered:
+            atexit.register(_release_in_use)
+            _release_registered.append(True)
+        pins.parent.mkdir(parents=True, exist_ok=True)
+        pins.write_text("\n".join(sorted(names)) + "\n")
+    except OSError:
+        pass
+
+
+def _record_write(golden_path):
+    """Size and write time into the cache index, after a clone or fetch."""
+    from .cacheindex import record_write
+
+    # no_cache checkouts live in a temp directory and are no entries
+    if Path(golden_path).parent != cache_root():
+        return
+    record_write(golden_path)
+
+
+def _release_in_use():
+    try:
+        (in_use_dir() / str(os.getpid())).unlink()
+    except OSError:
+        pass
+    _in_use_here.clear()
+    _in_use_requests.clear()
+
+
 def _invalidate_cache_if_needed(golden_path):
     must_exist = ["HEAD", "refs", "objects", "config"]
     if golden_path.exists() and (any(
         not (golden_path / x).exists() for x in must_exist
     ) or os.getenv("GIMERA_CLEAR_CACHE") == "1"):
         click.secho(f"Removing cache directory:\n{golden_path}", fg="red")
+        dissociate_or_abort(golden_path)
         rmtree(golden_path)
 
     # No GIMERA_CLEAR_ZIP_CACHE any more: there is no second copy to clear.
@@ -58,6 +269,70 @@ def _invalidate_cache_if_needed(golden_path):
     _drop_legacy_tarfile(golden_path)
 
 
+def dissociate_borrowers(golden_path):
+    """Give every submodule clone that borrows from the entry its own objects.
+
+    With `submodule_reference` the clones in .git/modules only point at the
+    entry's objects (objects/info/alternates). Before the entry is removed or
+    rewritten they copy what they use - `repack -a -d` takes the borrowed
+    objects in - and the alternate is dropped. Returns False if one of them
+    could not be dissociated; the caller must then leave the entry alone.
+    """
+    from .cacheindex import borrowers
+    from .cacheindex import forget_borrower
+
+    objects = str((Path(golden_path) / "objects").resolve())
+    ok = True
+    for gitdir in borrowers(golden_path):
+        alternates = Path(gitdir) / "objects" / "info" / "alternates"
+        try:
+            lines = alternates.read_text().splitlines()
+        except OSError:
+            # the clone is gone, or was dissociated some other way
+            forget_borrower(golden_path, gitdir)
+            continue
+        lines = [x.strip() for x in lines if x.strip()]
+        rest = [x for x in lines if str(Path(x).resolve()) != objects]
+        if len(rest) == len(lines):
+            forget_borrower(golden_path, gitdir)
+            continue
+        try:
+            subprocess.run(
+                git + ["--git-dir", str(gitdir), "repack", "-a", "-d", "-q"],
+                capture_output=True,
+                encoding="utf8",
+                check=True,
+            )
+        except subprocess.CalledProcessError as ex:
+            click.secho(
+                f"Could not copy the objects of {gitdir} out of "
+                f"{golden_path}: {ex.stderr.strip()}",
+                fg="red",
+            )
+            ok = False
+            continue
+        if rest:
+            alternates.write_text("\n".join(rest) + "\n")
+        else:
+            alternates.unlink()
+        forget_borrower(golden_path, gitdir)
+        click.secho(f"{gitdir} no longer borrows from {golden_path}", fg="yellow")
+    return ok
+
+
+def dissociate_or_abort(golden_path):
+    """dissociate_borrowers before the entry is deleted, or stop here.
+
+    Deleting it anyway would leave the borrowing submodule clones without
+    their objects.
+    """
+    if not dissociate_borrowers(golden_path):
+        _raise_error(
+            f"Not removing {golden_path}: a submodule clone still borrows its "
+            "objects (see above). Fix or remove that clone and try again."
+        )
+
+
 def _wants_partial_clone(repo_yml):
     """Whether this repo's cache may omit file contents (blobs).
 
@@ -98,6 +373,140 @@ def is_partial_clone(path):
     return out.stdout.strip() == "true"
 
 
+def missing_blobs(path, shas):
+    """Blobs of the snapshots `shas` that a partial clone does not have."""
+    if not shas:
+        return []
+    out = subprocess.run(
+        git + ["rev-list", "--objects", "--missing=print"]
+        + [f"{sha}^{{tree}}" for sha in shas],
+        cwd=path,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    ).stdout
+    return [line[1:] for line in out.splitlines() if line.startswith("?")]
+
+
+def hydrate(path, shas, present_in=None, jobs=1):
+    """Fetch the file contents of the snapshots `shas` in one go.
+
+    What git would otherwise fetch lazily, one blob per round trip, when the
+    snapshot is first read. Same fetch as git's own lazy fetch, only for all
+    of them at once. With `present_in` (a partial clone that origin points
+    to) only the blobs that one has are asked for - anything else would make
+    its upload-pack go to the network. Returns the number of blobs fetched.
+    """
+    missing = missing_blobs(path, shas)
+    if missing and present_in:
+        absent = set(missing_blobs(present_in, shas))
+        missing = [x for x in missing if x not in absent]
+    _fetch_blobs(path, missing, jobs=jobs)
+    return len(missing)
+
+
+# Object ids per fetch request. Large enough that the round trips do not
+# matter, small enough that a failing batch does not cost the whole snapshot.
+PREFETCH_BATCH = 20000
+
+
+def _fetch_blobs(path, oids, jobs=1):
+    """Fetch `oids` from origin, in batches over up to `jobs` connections."""
+    if not oids:
+        return
+    size = min(PREFETCH_BATCH, -(-len(oids) // max(jobs, 1)))
+    batches = [oids[i : i + size] for i in range(0, len(oids), size)]
+
+    def fetch(batch):
+        subprocess.run(
+            git
+            + [
+                "-c",
+                "fetch.negotiationAlgorithm=noop",
+                "fetch",
+                "origin",
+                "--no-tags",
+                "--no-write-fetch-head",
+                "--recurse-submodules=no",
+                "--filter=blob:none",
+                "--stdin",
+            ],
+            cwd=path,
+            input="\n".join(batch) + "\n",
+            capture_output=True,
+            encoding="utf8",
+            check=True,
+        )
+
+    if jobs <= 1 or len(batches) == 1:
+        for batch in batches:
+            fetch(batch)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # list() so that a failed batch raises here
+        list(pool.map(fetch, batches))
+
+
+def _prefetch_jobs():
+    try:
+        return int(os.getenv("GIMERA_PREFETCH_JOBS", "4"))
+    except ValueError:
+        return 4
+
+
+def _pack_bytes(path):
+    total = 0
+    for pack in (Path(path) / "objects" / "pack").glob("*.pack"):
+        try:
+            total += pack.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def prefetch(path, commit, label):
+    """Fetch the missing files of `commit` before it is extracted.
+
+    On a partial cache `git archive` would fault every missing blob in on
+    its own - for a first extraction of odoo/odoo tens of thousands of
+    serial round trips. Listing them and fetching them in batches, several
+    connections at once (GIMERA_PREFETCH_JOBS, default 4, 0 turns it off),
+    is a matter of one download. A failure is only reported: the lazy fetch
+    of `git archive` still gets the files, just slower.
+    """
+    jobs = _prefetch_jobs()
+    if jobs <= 0 or not is_partial_clone(path):
+        return
+    from .cachemaint import format_size
+
+    try:
+        missing = missing_blobs(path, [commit])
+        if not missing:
+            return
+        click.secho(
+            f"  prefetching {len(missing)} file(s) of {label} "
+            f"over {min(jobs, len(missing))} connection(s) ...",
+            fg="cyan",
+        )
+        started = time.time()
+        before = _pack_bytes(path)
+        with cache_lock(path):
+            _fetch_blobs(path, missing, jobs=jobs)
+    except subprocess.CalledProcessError as ex:
+        click.secho(
+            f"  prefetch of {label} failed, git archive fetches the files "
+            f"one by one instead: {(ex.stderr or '').strip()}",
+            fg="yellow",
+        )
+        return
+    click.secho(
+        f"  prefetched {len(missing)} file(s), "
+        f"{format_size(_pack_bytes(path) - before)} in "
+        f"{time.time() - started:.1f}s",
+        fg="green",
+    )
+
+
 def _warn_if_filter_was_ignored(path, url):
     """A server without uploadpack.allowFilter silently sends everything.
 
@@ -114,7 +523,7 @@ def _warn_if_filter_was_ignored(path, url):
     )
 
 
-def _bare_clone(main_repo, url, dest, partial):
+def _bare_clone(main_repo, url, dest, partial, reference=None):
     """Clone the cache, filtered when allowed, and never fail because of that.
 
     Most servers that cannot filter just send everything and warn
@@ -122,15 +531,25 @@ def _bare_clone(main_repo, url, dest, partial):
     request outright would take the whole apply down over an optimization, so
     fall back to a plain clone once. A second failure is a real one and is
     left to the caller.
+
+    `reference` is the family pool to borrow from; the fallback goes without
+    it, because a full clone must not borrow from a partial pool.
     """
     base = ["clone", "--bare"]
     if not partial:
+        if reference:
+            base += ["--reference", str(reference)]
         Repo(main_repo.path).X(*(git + base + [url, dest]))
         return
 
     try:
         Repo(main_repo.path).X(
-            *(git + base + ["--filter=blob:none", url, dest])
+            *(
+                git
+                + base
+                + (["--reference", str(reference)] if reference else [])
+                + ["--filter=blob:none", url, dest]
+            )
         )
     except Exception as ex:
         click.secho(
@@ -152,6 +571,8 @@ def _bare_clone(main_repo, url, dest, partial):
 
 
 def _clone_or_restore(main_repo, url, golden_path, possible_temp_path, partial=False):
+    from .cachefamily import reference_for
+
     click.secho(
         f"Caching the repository {url} for quicker reuse",
         fg="yellow",
@@ -162,27 +583,210 @@ def _clone_or_restore(main_repo, url, golden_path, possible_temp_path, partial=F
         ):  # called from other situations where path may not exist anymore
             rmtree(_path)
             _path.mkdir(parents=True)
-            _bare_clone(main_repo, url, _path, partial)
+            reference = reference_for(url, partial)
+            if not (
+                _clone_from_layer(main_repo, url, golden_path.name, _path)
+                or _clone_from_sources(main_repo, url, _path, partial, reference)
+            ):
+                _bare_clone(main_repo, url, _path, partial, reference)
+
+
+def _share_with_family(golden_path, url, repack=False):
+    """Hand the entry's objects to its family's pool, if it has one.
+
+    Only an optimization: a failure leaves the entry as it is. A clone that
+    is not in place yet waits for its rename; the pool names it by the entry.
+    """
+    from .cachefamily import join
+
+    if Path(golden_path) != _make_cache_path(url):
+        return False
+    try:
+        return join(golden_path, url, repack=repack)
+    except subprocess.CalledProcessError as ex:
+        click.secho(
+            f"Could not share {golden_path.name} with its family: "
+            f"{(ex.stderr or '').strip()}",
+            fg="yellow",
+        )
+        return False
+
+
+def _layer_entry(name):
+    """The entry `name` in one of the read-only cache layers, or None."""
+    own = (cache_root() / name).resolve()
+    for layer in cache_layers():
+        candidate = layer / name
+        if (candidate / "HEAD").exists() and candidate.resolve() != own:
+            return candidate
+    return None
+
+
+def shares_layer(path):
+    """True if the entry borrows its history from a cache layer or from the
+    pool of its family (cachefamily).
+
+    Such an entry holds only what the other does not; rewriting it (compact,
+    gc) would copy the shared history into it.
+    """
+    return (Path(path) / "objects" / "info" / "alternates").exists()
+
+
+def _clone_from_layer(main_repo, url, name, dest):
+    """Start the entry as a borrower of the same entry in a cache layer.
+
+    A shared, read-only cache (NFS on every build node) is listed in
+    `cache_layers`. Instead of cloning, the own entry gets an alternate to
+    the layer's objects and a copy of its refs (`clone --shared`, no
+    network); fetches only store what the layer does not have. Nothing is
+    ever written into the layer. False if there is no such entry or it did
+    not work - then the entry is cloned as without layers.
+    """
+    source = _layer_entry(name)
+    if not source:
+        return False
+    click.secho(f"  sharing the history of {source}", fg="yellow")
+    try:
+        Repo(main_repo.path).X(
+            *(git + ["clone", "--bare", "--shared", "--quiet", str(source), dest])
+        )
+        repo = Repo(dest)
+        repo.X(*(git + ["config", "remote.origin.url", url]))
+        if is_partial_clone(source):
+            repo.X(*(git + ["config", "remote.origin.promisor", "true"]))
+            repo.X(
+                *(git + ["config", "remote.origin.partialclonefilter", "blob:none"])
+            )
+    except Exception as ex:
+        click.secho(f"Sharing {source} failed ({ex}), cloning {url}", fg="yellow")
+        if dest.exists():
+            rmtree(dest)
+        dest.mkdir(parents=True, exist_ok=True)
+        return False
+    return True
+
+
+def fetch_sources(url):
+    """Where to get `url` from before its canonical URL, as (label, url).
+
+    The mirror from ~/.gimera first, then the cache of every peer that runs
+    `gimera cache serve` - a peer serves its entries under their names.
+    """
+    sources = []
+    mirror = mirror_url(url)
+    if mirror:
+        sources.append(("mirror", mirror))
+    name = _make_cache_path(url).name
+    for peer in cache_peers():
+        sources.append((f"peer {peer}", f"{peer.rstrip('/')}/{name}"))
+    return sources
+
+
+def _clone_from_sources(main_repo, url, dest, partial, reference=None):
+    """Clone the cache of `url` from its mirror or a peer, if there is one.
+
+    origin is set back to `url` afterwards: the entry is the one of the
+    canonical URL, whatever it was filled from. False if there is no other
+    source or none worked - then the canonical URL is cloned as without.
+    """
+    for label, source in fetch_sources(url):
+        click.secho(f"  from {label}: {source}", fg="yellow")
+        try:
+            _bare_clone(main_repo, source, dest, partial, reference)
+            Repo(dest).X(*(git + ["remote", "set-url", "origin", url]))
+        except Exception as ex:
+            click.secho(f"Cloning from {label} failed ({ex})", fg="yellow")
+            if dest.exists():
+                rmtree(dest)
+            dest.mkdir(parents=True, exist_ok=True)
+            continue
+        return True
+    return False
+
+
+def _fetch_from_source(repo, label, source, refs):
+    """Fetch `refs` from a mirror or peer into the cache `repo`.
+
+    True if the fetch went through; whether it brought what was asked for is
+    for the caller to check - a mirror lags behind.
+    """
+    try:
+        repo.out(*(git + ["fetch", "--no-tags", source] + list(refs)))
+    except subprocess.CalledProcessError as ex:
+        click.secho(
+            f"Fetching from {label} failed: {(ex.stderr or '').strip()}",
+            fg="yellow",
+        )
+        return False
+    return True
 
 
 def _ensure_sha(repo_yml, effective_path, update):
+    """Fetch the pinned sha if the cache lacks it; True if it had to."""
     if not repo_yml.sha:
-        return
+        return False
     repo = Repo(effective_path)
     if repo.contain_commit(repo_yml.sha):
-        return
-    # fetch configured branch first (faster than fetchall for large repos;
-    # bare cache repos may have no refspec so --all only fetches HEAD)
+        return False
+    _fetch_missing_sha(repo, repo_yml, update)
+    return True
+
+
+def pin_ref(sha):
+    """The ref that keeps a commit fetched by its sha in the cache."""
+    return f"refs/gimera/pins/{sha}"
+
+
+def _sha_fetch_strategies(repo, repo_yml):
+    """Ways to get a missing commit, cheapest first, as (name, callable).
+
+    Most servers (GitHub, GitLab, anything speaking protocol v2) hand out a
+    commit reachable from one of their refs by its sha: one small round trip
+    for a pin to an old commit. Otherwise the configured branch (bare cache
+    repos may have no refspec, so a plain fetch would only get HEAD), then
+    the tags and only as last resort every head - on odoo/odoo that is a
+    huge transfer just to find one commit. A mirror or peer from ~/.gimera
+    goes before all of them; what they lack comes from the canonical URL.
+    A commit fetched by its sha gets a ref (pin_ref), else no branch or tag
+    holds it and the next repack or gc drops it again.
+    """
+    sha = repo_yml.sha
+    refspec = f"+{sha}:{pin_ref(sha)}"
+    for label, source in fetch_sources(repo_yml.url):
+        yield label, lambda label=label, source=source: _fetch_from_source(
+            repo, label, source, [refspec]
+        )
+    yield "sha", lambda: repo.X(
+        *(git + ["fetch", "--no-tags", "--no-write-fetch-head", "origin", refspec])
+    )
     if repo_yml.branch:
+        yield f"branch {repo_yml.branch}", lambda: repo.fetch(
+            remote="origin", ref=repo_yml.branch
+        )
+    yield "tags", lambda: repo.fetch(
+        remote="origin", ref=["+refs/tags/*:refs/tags/*"]
+    )
+    yield "all branches", repo.fetchall
+
+
+def _fetch_missing_sha(repo, repo_yml, update):
+    for strategy, fetch in _sha_fetch_strategies(repo, repo_yml):
+        started = time.time()
         try:
-            repo.fetch(remote="origin", ref=repo_yml.branch)
-        except Exception:
-            pass
-    if repo.contain_commit(repo_yml.sha):
-        return
-    repo.fetchall()
-    if repo.contain_commit(repo_yml.sha):
-        return
+            fetch()
+        except Exception as ex:
+            if strategy == "all branches":
+                # the last resort failing is a real error, as it always was
+                raise
+            verbose(f"Fetching {repo_yml.sha} by {strategy} failed: {ex}")
+            continue
+        if repo.contain_commit(repo_yml.sha):
+            click.secho(
+                f"  fetched {repo_yml.sha[:10]} for {repo_yml.path} by "
+                f"{strategy} in {time.time() - started:.1f}s",
+                fg="cyan",
+            )
+            return
     if not update:
         # check whether the SHA exists on a different branch
         try:
@@ -221,7 +825,14 @@ def _ensure_sha(repo_yml, effective_path, update):
 
 
 @contextmanager
-def _get_cache_dir(main_repo, repo_yml, no_action_if_not_exist=False, update=None):
+def _get_cache_dir(
+    main_repo,
+    repo_yml,
+    no_action_if_not_exist=False,
+    update=None,
+    use_daemon=True,
+    pin=True,
+):
     url = repo_yml.url
     if not url:
         _raise_error(f"Missing url for: {repo_yml.path}")
@@ -232,45 +843,59 @@ def _get_cache_dir(main_repo, repo_yml, no_action_if_not_exist=False, update=Non
     # Standes statt der kompletten Historie im Golden Cache. Fuer odoo/odoo
     # ist das der Unterschied zwischen ein paar hundert MB und ~18 GB -- auf
     # einer Kundenmaschine will die Historie niemand.
+    # Die flachen Staende liegen in einem eigenen Speicher, nach sha
+    # geschluesselt und ueber Laeufe und Projekte hinweg wiederverwendet -
+    # siehe shallowstore.
     if is_no_cache(url):
+        from .shallowstore import shallow_snapshot
+
         explain_no_cache(url)
-        TEMP_KEY = f"{repo_yml.url}_{repo_yml.sha or repo_yml.branch}"
-        with temppath(mkdir=False, reuse_key=TEMP_KEY) as path:
-            if not path.exists():
-                subprocess.run(["git", "clone", "--single-branch", "--depth=1", "--branch", repo_yml.branch, repo_yml.url, path], check=True)
-                if repo_yml.sha:
-                    Repo(path).X(*(git + ["fetch", "origin", repo_yml.sha]))
-                    Repo(path).X(*(git + ["checkout", repo_yml.sha]))
+        with shallow_snapshot(repo_yml, update=update) as path:
             yield path
-            return
+        return
 
     if no_action_if_not_exist and not golden_path.exists():
         yield None
         return
+    _record_use(golden_path, repo_yml, pin=pin)
+
+    # With `gimera cached` running, the daemon clones and fetches and we only
+    # read. It serializes the writes, so concurrent jobs share one fetch
+    # instead of racing for the lock.
+    if use_daemon and _ensured_by_daemon(repo_yml, golden_path, update):
+        yield golden_path
+        return
 
     possible_temp_path = Path(str(golden_path) + "." + str(uuid.uuid4()))
     try:
         golden_path.parent.mkdir(exist_ok=True, parents=True)
-        _invalidate_cache_if_needed(golden_path)
-
-        just_cloned = False
-        if not golden_path.exists():
-            _clone_or_restore(
-                main_repo,
-                url,
-                golden_path,
-                possible_temp_path,
-                partial=_wants_partial_clone(repo_yml),
-            )
-            just_cloned = True
+        # the clone and the fetch, not the reading that follows: a compaction
+        # or repack waits for them, and they for it
+        with cache_lock(golden_path):
+            _invalidate_cache_if_needed(golden_path)
+
+            just_cloned = False
+            if not golden_path.exists():
+                _clone_or_restore(
+                    main_repo,
+                    url,
+                    golden_path,
+                    possible_temp_path,
+                    partial=_wants_partial_clone(repo_yml),
+                )
+                just_cloned = True
 
-        effective_path = possible_temp_path if just_cloned else golden_path
-        _ensure_sha(repo_yml, effective_path, update)
+            effective_path = possible_temp_path if just_cloned else golden_path
+            if _ensure_sha(repo_yml, effective_path, update) and not just_cloned:
+                _record_write(golden_path)
 
         yield effective_path
 
         if just_cloned:
-            replace_dir_with(possible_temp_path, golden_path)
+            with cache_lock(golden_path):
+                replace_dir_with(possible_temp_path, golden_path)
+            _record_write(golden_path)
+            _share_with_family(golden_path, url, repack=True)
 
     finally:
         possible_temp_path = Path(possible_temp_path)
@@ -278,6 +903,25 @@ def _get_cache_dir(main_repo, repo_yml, no_action_if_not_exist=False, update=Non
             rmtree(possible_temp_path)
 
 
+def _ensured_by_daemon(repo_yml, golden_path, update):
+    from .cachedaemon import repo_params
+    from .cachedaemon import request
+
+    answer = request("ensure", update=update, **repo_params(repo_yml))
+    if not answer or not golden_path.exists():
+        return False
+    if repo_yml.sha and not answer.get("sha"):
+        # _ensure_sha in the daemon found the sha on another branch only
+        click.secho(
+            f"SHA {repo_yml.sha} for '{repo_yml.path}' was not found on "
+            f"configured branch '{repo_yml.branch}'.\n"
+            f"Switching to HEAD of '{repo_yml.branch}'.",
+            fg="yellow",
+        )
+        repo_yml.sha = None
+    return True
+
+
 def _legacy_tarfile(_path):
     """Where gimera <= 0.12.x kept a second copy of the golden cache."""
     return Path(str(_path) + ".tar.gz")
@@ -0,0 +1,274 @@
+"""Fork families: cache entries that share one object pool.
+
+odoo/odoo, OCA/OCB and every customer's odoo fork are separate cache
+entries, each a full (or partial) clone of the same history - 95% of their
+objects are the same. Listed as one family in ~/.gimera,
+
+    "families": {"odoo": ["odoo/odoo", "oca/ocb", "acme/odoo"]}
+
+they share a pool, a bare repo under `.families/<family>` in the cache:
+
+  * the pool fetches the refs of every member from the member itself (no
+    network) into refs/families/<entry name>/*, so it holds the objects of
+    all of them, each once;
+  * every member borrows from it through `objects/info/alternates`, and a
+    repack with `-l` drops what the pool has from the member's own packs;
+  * a new member is cloned with `--reference <pool>`: it downloads only what
+    no other member has, and fetches offer the pool's refs as common
+    history, so what one fork fetched the others do not fetch again.
+
+What a member fetches stays its own until `gimera cache maintain` pools it
+again - not in the middle of an apply. Commits that a project pins but no
+branch holds any more get a ref (cachedir.pin_ref) before the member's
+repack, which would drop them otherwise. The pool counts towards
+`cache_max_bytes`, charged to its members in equal shares (charge_pools).
+
+Nothing borrows from the pool without its refs covering it, so pruning the
+pool is safe - `gimera cache maintain` drops the refs of members that are
+gone and lets `git gc` (with its two weeks of grace for racing fetches)
+free their objects.
+
+A pool is partial or full, like its first member; a member of the other
+kind stays on its own. Mixing them would let a full entry borrow trees whose
+blobs nobody has.
+"""
+
+import shutil
+import subprocess
+import uuid
+from pathlib import Path
+
+import click
+
+from . import cacheindex
+from .cachedir import cache_lock
+from .cachedir import is_temp_dir
+from .cachedir import cache_root
+from .cachedir import is_partial_clone
+from .cachedir import pin_ref
+from .consts import gitcmd as git
+from .tools import verbose
+from .userconfig import family_of
+
+POOL_DIR = ".families"
+
+
+def _git(path, *args):
+    return subprocess.run(
+        git + list(args),
+        cwd=path,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    ).stdout
+
+
+def pool_path(family, root=None):
+    return (Path(root) if root else cache_root()) / POOL_DIR / family
+
+
+def _pool_is_partial(pool):
+    try:
+        return _git(pool, "config", "--bool", "gimera.partial").strip() == "true"
+    except subprocess.CalledProcessError:
+        return False
+
+
+def _has_refs(pool):
+    return bool(_git(pool, "for-each-ref", "--count=1").strip())
+
+
+def _ensure_pool(pool, partial):
+    if (pool / "HEAD").exists():
+        return
+    pool.parent.mkdir(parents=True, exist_ok=True)
+    tmp = pool.with_name(f"{pool.name}.init-{uuid.uuid4()}")
+    _git(pool.parent, "init", "--bare", "--quiet", str(tmp))
+    _git(tmp, "config", "gimera.partial", "true" if partial else "false")
+    # packed by `gimera cache maintain`, not in the middle of a fetch
+    _git(tmp, "config", "gc.auto", "0")
+    try:
+        tmp.rename(pool)
+    except OSError:
+        # another gimera created it in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def reference_for(url, partial):
+    """The pool a new clone of `url` can start from, or None."""
+    family = family_of(url)
+    if not family:
+        return None
+    pool = pool_path(family)
+    if not (pool / "HEAD").exists() or _pool_is_partial(pool) != partial:
+        return None
+    return pool if _has_refs(pool) else None
+
+
+def _add_alternate(path, pool):
+    alternates = Path(path) / "objects" / "info" / "alternates"
+    line = str(pool / "objects")
+    lines = alternates.read_text().splitlines() if alternates.exists() else []
+    if line in lines:
+        return
+    alternates.parent.mkdir(parents=True, exist_ok=True)
+    alternates.write_text("\n".join(lines + [line]) + "\n")
+
+
+def _ref_pins(path):
+    """Give the pinned commits of the entry a ref, see cachedir.pin_ref.
+
+    A commit fetched by its sha before pin refs existed, or one whose branch
+    was force-pushed away, is held by nothing else; `repack -a -d` would
+    drop it and the pool would never get it.
+    """
+    from .cachemaint import _pinned_shas
+
+    updates = []
+    for sha in sorted(_pinned_shas(path.parent, since=None).get(path.name, ())):
+        try:
+            full = _git(path, "rev-parse", "--verify", "-q", f"{sha}^{{commit}}")
+        except subprocess.CalledProcessError:
+            continue
+        full = full.strip()
+        updates.append(f"update {pin_ref(full)} {full}\n")
+    if updates:
+        subprocess.run(
+            git + ["update-ref", "--stdin"],
+            cwd=path,
+            input="".join(updates),
+            capture_output=True,
+            encoding="utf8",
+            check=True,
+        )
+
+
+def join(path, url, repack=True):
+    """Hand the objects of the entry at `path` to its family's pool.
+
+    Fetches the entry's refs into the pool and makes the entry borrow from
+    it; with `repack` the entry then drops its own copies. False if `url`
+    has no family or the entry cannot be pooled.
+    """
+    from .cachemaint import _LOCAL_UPLOAD_PACK
+
+    family = family_of(url)
+    if not family:
+        return False
+    path = Path(path)
+    name = path.name
+    partial = is_partial_clone(path)
+    pool = pool_path(family, root=path.parent)
+    _ensure_pool(pool, partial)
+    if _pool_is_partial(pool) != partial:
+        verbose(
+            f"{name} is {'a partial' if partial else 'a full'} clone, the pool "
+            f"of family {family} is not - not pooled"
+        )
+        return False
+
+    _ref_pins(path)
+    with cache_lock(pool):
+        fetch = ["fetch", "--quiet", "--no-tags", "--no-write-fetch-head"]
+        if partial:
+            # a filtered fetch goes to a promisor remote only
+            _git(pool, "config", f"remote.{name}.url", str(path))
+            _git(pool, "config", f"remote.{name}.promisor", "true")
+            _git(pool, "config", f"remote.{name}.partialclonefilter", "blob:none")
+            fetch += [
+                "--filter=blob:none",
+                f"--upload-pack={_LOCAL_UPLOAD_PACK}",
+                name,
+            ]
+        else:
+            fetch.append(str(path))
+        _git(pool, *fetch, f"+refs/*:refs/families/{name}/*")
+        _add_alternate(path, pool)
+
+    if repack:
+        with cache_lock(path):
+            # -l: whatever the pool has is left out
+            _git(path, "repack", "-a", "-d", "-l", "-q")
+    return True
+
+
+def members(pool):
+    """Names of the entries that have refs in the pool."""
+    refs = _git(pool, "for-each-ref", "--format=%(refname)", "refs/families/")
+    return sorted({ref.split("/")[2] for ref in refs.splitlines()})
+
+
+def _drop_member(pool, name):
+    refs = _git(
+        pool, "for-each-ref", "--format=delete %(refname)", f"refs/families/{name}/"
+    )
+    subprocess.run(
+        git + ["update-ref", "--stdin"],
+        cwd=pool,
+        input=refs,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    )
+    subprocess.run(
+        git + ["config", "--remove-section", f"remote.{name}"],
+        cwd=pool,
+        capture_output=True,
+    )
+
+
+def charge_pools(entries, root=None):
+    """Add every pool's size to its members in `entries`, in equal shares.
+
+    The share is also kept apart as "pool_share": evicting a member does not
+    free it - the pool only drops the member's refs at the next
+    `cache maintain`, and its gc keeps the objects for a while longer.
+    Returns the bytes of pools that have no member in `entries` - those
+    count all the same.
+    """
+    root = Path(root) if root else cache_root()
+    pools = root / POOL_DIR
+    if not pools.exists():
+        return 0
+    by_name = {x["name"]: x for x in entries}
+    unowned = 0
+    for pool in sorted(pools.iterdir()):
+        if not (pool / "HEAD").exists() or is_temp_dir(pool):
+            continue
+        size = cacheindex.entry_size(pool)
+        names = [x for x in members(pool) if x in by_name]
+        if not names:
+            unowned += size
+            continue
+        for name in names:
+            by_name[name]["size"] += size // len(names)
+            by_name[name]["pool_share"] = size // len(names)
+    return unowned
+
+
+def maintain_pools(root=None):
+    """Forget members that left the cache and gc every pool.
+
+    Returns {family: [names of dropped members]}.
+    """
+    root = Path(root) if root else cache_root()
+    pools = root / POOL_DIR
+    if not pools.exists():
+        return {}
+    dropped = {}
+    for pool in sorted(pools.iterdir()):
+        if not (pool / "HEAD").exists() or is_temp_dir(pool):
+            continue
+        with cache_lock(pool):
+            gone = [x for x in members(pool) if not (root / x / "HEAD").exists()]
+            for name in gone:
+                _drop_member(pool, name)
+            try:
+                _git(pool, "gc", "--quiet")
+            except subprocess.CalledProcessError as ex:
+                click.secho(
+                    f"  gc of pool {pool.name} failed: {(ex.stderr or '').strip()}",
+                    fg="yellow",
+                )
+        dropped[pool.name] = gone
+    return dropped
@@ -0,0 +1,348 @@
+"""What the golden cache holds, without walking it: cache_root()/.index.sqlite
+
+The directory names alone cannot answer the interesting questions.
+`_make_cache_path` mangles the URL beyond reconstruction, and the size of an
+entry takes a full `os.walk` - minutes for a 200 GB cache, on every
+`gimera cache list`. So gimera writes down what it knows at the moment it
+knows it:
+
+  * the original URL and whether the entry is a partial clone, whenever an
+    entry is used
+  * its size, after every clone and fetch, from `git count-objects` - which
+    reads the pack directory instead of stat'ing every loose file - and the
+    mtimes of objects/ and objects/pack it was measured at; a listing
+    measures again only the entries where those moved
+  * when it was last read and last written
+  * which commit every project on the machine has pinned, per repo path -
+    the snapshots whose file contents a partial cache must keep (cache gc)
+  * which submodule clones borrow objects from an entry via alternates, and
+    so must get their own copy before the entry goes away
+  * per host, which protocol (ssh or https) last won a hedged fetch, so the
+    next run starts with it
+
+The index is a cache of facts about the cache, never the truth: an entry
+without a row (written by an older gimera, copied in by hand) is measured the
+old way and then recorded. Failing to update it must never fail an apply, so
+the record_* functions swallow database errors.
+"""
+
+import os
+import sqlite3
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .cachedir import cache_root
+from .tools import verbose
+
+INDEX_NAME = ".index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    url TEXT,
+    path TEXT,
+    partial INTEGER,
+    size INTEGER,
+    last_read REAL,
+    last_write REAL,
+    used_as_submodule INTEGER NOT NULL DEFAULT 0,
+    size_stamp TEXT
+);
+CREATE TABLE IF NOT EXISTS pins (
+    project TEXT,
+    path TEXT,
+    url TEXT,
+    sha TEXT,
+    last_seen REAL,
+    PRIMARY KEY (project, path)
+);
+CREATE TABLE IF NOT EXISTS borrowers (
+    name TEXT,
+    gitdir TEXT,
+    PRIMARY KEY (name, gitdir)
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    protocol TEXT,
+    last_ok REAL
+);
+"""
+
+
+def index_path(root=None):
+    return Path(root or cache_root()) / INDEX_NAME
+
+
+@contextmanager
+def connect(root=None):
+    path = index_path(root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # gimera runs in parallel on CI hosts - wait for a writer instead of
+    # failing with "database is locked"
+    conn = sqlite3.connect(str(path), timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        _add_missing_columns(conn)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# columns added after the first release: an index written by an older gimera
+# gets them on the next connect
+_ADDED_COLUMNS = {"entries": {"size_stamp": "TEXT"}}
+
+
+def _add_missing_columns(conn):
+    for table, columns in _ADDED_COLUMNS.items():
+        present = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, kind in columns.items():
+            if column not in present:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+
+def size_stamp(path):
+    """Changes whenever git adds or drops a pack or a loose object directory.
+
+    Loose objects added to an existing directory do not move it; gimera
+    records the size after its own fetches anyway, and `maintain` packs
+    them.
+    """
+    parts = []
+    for sub in ("objects", "objects/pack"):
+        try:
+            parts.append(str(os.stat(Path(path) / sub).st_mtime_ns))
+        except OSError:
+            parts.append("-")
+    return ":".join(parts)
+
+
+def entry_size(path):
+    """Bytes of a cache entry, from git's own accounting where possible.
+
+    `count-objects -v` reports the packs and loose objects in KiB; what is
+    outside objects/ (refs, config, hooks) is small and walked.
+    """
+    path = Path(path)
+    try:
+        out = subprocess.run(
+            ["git", "count-objects", "-v"],
+            cwd=path,
+            capture_output=True,
+            encoding="utf8",
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        from .cachemaint import dir_size
+
+        return dir_size(path)
+    values = dict(
+        line.split(": ", 1) for line in out.splitlines() if ": " in line
+    )
+    kib = sum(
+        int(values.get(x, 0)) for x in ("size", "size-pack", "size-garbage")
+    )
+    total = kib * 1024
+    for root, dirs, files in os.walk(path, onerror=lambda e: None):
+        if Path(root) == path and "objects" in dirs:
+            dirs.remove("objects")
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _upsert(conn, name, **values):
+    conn.execute("INSERT OR IGNORE INTO entries (name) VALUES (?)", (name,))
+    if values:
+        assignments = ", ".join(f"{key} = ?" for key in values)
+        conn.execute(
+            f"UPDATE entries SET {assignments} WHERE name = ?",
+            list(values.values()) + [name],
+        )
+
+
+def _root_of(golden_path):
+    # the index sits next to the entries it describes
+    return Path(golden_path).parent
+
+
+def record_read(golden_path, url, used_as_submodule=False):
+    try:
+        with connect(_root_of(golden_path)) as conn:
+            values = {
+                "url": url,
+                "path": str(golden_path),
+                "last_read": time.time(),
+            }
+            if used_as_submodule:
+                values["used_as_submodule"] = 1
+            _upsert(conn, Path(golden_path).name, **values)
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def record_write(golden_path):
+    """After a clone or fetch: new size, partial flag and write time."""
+    from .cachedir import is_partial_clone
+
+    golden_path = Path(golden_path)
+    try:
+        with connect(_root_of(golden_path)) as conn:
+            _upsert(
+                conn,
+                golden_path.name,
+                path=str(golden_path),
+                size=entry_size(golden_path),
+                size_stamp=size_stamp(golden_path),
+                partial=int(is_partial_clone(golden_path)),
+                last_write=time.time(),
+            )
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def record_size(golden_path, size, partial=None):
+    """A size measured elsewhere (listing, maintenance) - no access."""
+    values = {"size": size, "size_stamp": size_stamp(golden_path)}
+    if partial is not None:
+        values["partial"] = int(partial)
+    try:
+        with connect(_root_of(golden_path)) as conn:
+            _upsert(conn, Path(golden_path).name, **values)
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def forget(golden_path):
+    try:
+        with connect(_root_of(golden_path)) as conn:
+            conn.execute(
+                "DELETE FROM entries WHERE name = ?", (Path(golden_path).name,)
+            )
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def rows(root=None):
+    """name -> row, for every entry the index knows."""
+    if not index_path(root).exists():
+        return {}
+    try:
+        with connect(root) as conn:
+            return {
+                row["name"]: dict(row)
+                for row in conn.execute("SELECT * FROM entries")
+            }
+    except sqlite3.Error as ex:
+        verbose(f"Could not read the cache index: {ex}")
+        return {}
+
+
+def record_pin(url, sha, project, path):
+    """What one gimera.yml pins right now; replaces the pin it had before."""
+    try:
+        with connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pins (project, path, url, sha, last_seen) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (str(project), str(path), url, sha, time.time()),
+            )
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def pins(root=None, since=None):
+    """Registered pins, dropping those older than `since` and those of
+    projects that are gone from disk."""
+    if not index_path(root).exists():
+        return []
+    try:
+        with connect(root) as conn:
+            if since is not None:
+                conn.execute("DELETE FROM pins WHERE last_seen < ?", (since,))
+            found = [dict(row) for row in conn.execute("SELECT * FROM pins")]
+            gone = [x for x in found if not Path(x["project"]).exists()]
+            for pin in gone:
+                conn.execute(
+                    "DELETE FROM pins WHERE project = ? AND path = ?",
+                    (pin["project"], pin["path"]),
+                )
+    except sqlite3.Error as ex:
+        verbose(f"Could not read the cache index: {ex}")
+        return []
+    return [x for x in found if x not in gone]
+
+
+def record_borrower(golden_path, gitdir):
+    try:
+        with connect(_root_of(golden_path)) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO borrowers (name, gitdir) VALUES (?, ?)",
+                (Path(golden_path).name, str(gitdir)),
+            )
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def borrowers(golden_path):
+    """Git dirs of the submodule clones that use the entry as alternate."""
+    root = _root_of(golden_path)
+    if not index_path(root).exists():
+        return []
+    try:
+        with connect(root) as conn:
+            return [
+                row["gitdir"]
+                for row in conn.execute(
+                    "SELECT gitdir FROM borrowers WHERE name = ?",
+                    (Path(golden_path).name,),
+                )
+            ]
+    except sqlite3.Error as ex:
+        verbose(f"Could not read the cache index: {ex}")
+        return []
+
+
+def forget_borrower(golden_path, gitdir):
+    try:
+        with connect(_root_of(golden_path)) as conn:
+            conn.execute(
+                "DELETE FROM borrowers WHERE name = ? AND gitdir = ?",
+                (Path(golden_path).name, str(gitdir)),
+            )
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def record_protocol(host, protocol):
+    try:
+        with connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO hosts (host, protocol, last_ok) "
+                "VALUES (?, ?, ?)",
+                (host, protocol, time.time()),
+            )
+    except sqlite3.Error as ex:
+        verbose(f"Could not update the cache index: {ex}")
+
+
+def preferred_protocol(host):
+    """"git" or "http" - what worked for `host` last time, or None."""
+    if not index_path().exists():
+        return None
+    try:
+        with connect() as conn:
+            row = conn.execute(
+                "SELECT protocol FROM hosts WHERE host = ?", (host,)
+            ).fetchone()
+    except sqlite3.Error as ex:
+        verbose(f"Could not read the cache index: {ex}")
+        return None
+    return row["protocol"] if row else None
@@ -26,13 +26,27 @@ reliably. Age is used as the proxy instead, and the user confirms.
 
 import os
 import shutil
+import subprocess
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 
 from .cachedir import _legacy_tarfile
+from .cachedir import cache_lock
+from .cachedir import _pid_alive
 from .cachedir import cache_root
+from .cachedir import dissociate_borrowers
+from .cachedir import in_use_dir
+from .cachedir import is_partial_clone
+from .cachedir import is_temp_dir
+from .cachedir import shares_layer
+from .cachefamily import charge_pools
+from .cachefamily import maintain_pools
+from .consts import gitcmd as git
+from . import cacheindex
 
 # Deliberately not tools.rmtree: that one calls sys.exit(-1) when it fails,
 # which would abandon the rest of the cleanup half-done.
@@ -77,14 +91,61 @@ def last_used(path):
     return newest
 
 
-def iter_entries(root=None):
-    """Every cache entry, with its size, age and leftover tarball."""
+def _measure(path):
+    if (path / "HEAD").exists():
+        return cacheindex.entry_size(path)
+    return dir_size(path)
+
+
+def _sizes(paths, known, recorded_will_do=False):
+    """name -> size; only entries the index has no current size for are
+    measured again, side by side, and recorded for next time.
+
+    With `recorded_will_do` any size the index has is taken as it is, and
+    only entries it has none for are measured.
+    """
+    sizes = {}
+    stale = []
+    for path in paths:
+        row = known.get(path.name) or {}
+        if row.get("size") is not None and (
+            recorded_will_do
+            or row.get("size_stamp") == cacheindex.size_stamp(path)
+        ):
+            sizes[path.name] = row["size"]
+        else:
+            stale.append(path)
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(8, len(stale))) as pool:
+            for path, size in zip(stale, pool.map(_measure, stale)):
+                sizes[path.name] = size
+                cacheindex.record_size(path, size)
+    return sizes
+
+
+def iter_entries(root=None, recorded_sizes=False):
+    """Every cache entry, with its size, age and leftover tarball.
+
+    Size, URL and access times come from the cache index. Entries it does
+    not know yet (written by an older gimera) or whose packs changed since
+    it measured them (git gc by hand) are measured, in parallel, and
+    recorded for next time - the latter not with `recorded_sizes`.
+    """
     root = Path(root) if root else cache_root()
     if not root.exists():
         return
-    for path in sorted(root.iterdir()):
-        if not path.is_dir():
-            continue
+    known = cacheindex.rows(root)
+    # .in-use, .trash: gimera's own bookkeeping, not entries; temp dirs are
+    # clones in progress that an eviction must not take away
+    paths = [
+        path
+        for path in sorted(root.iterdir())
+        if path.is_dir() and not path.name.startswith(".") and not is_temp_dir(path)
+    ]
+    sizes = _sizes(paths, known, recorded_will_do=recorded_sizes)
+    for path in paths:
+        row = known.get(path.name) or {}
+        size = sizes[path.name]
         tar = _legacy_tarfile(path)
         try:
             tar_size = tar.stat().st_size if tar.exists() else 0
@@ -93,10 +154,15 @@ def iter_entries(root=None):
         yield {
             "path": path,
             "name": path.name,
-            "size": dir_size(path),
+            "url": row.get("url"),
+            "size": size,
             "tarball": tar if tar_size else None,
             "tar_size": tar_size,
-            "last_used": last_used(path),
+            "last_used": max(
+                last_used(path),
+                row.get("last_read") or 0,
+                row.get("last_write") or 0,
+            ),
         }
 
 
@@ -131,7 +197,7 @@ def print_listing(root=None, now=None):
         return entries, strays
 
     click.secho(
-        f"{'SIZE':>10}  {'TARBALL':>10}  {'IDLE':>8}  NAME", bold=True
+        f"{'SIZE':>10}  {'TARBALL':>10}  {'IDLE':>8}  REPOSITORY", bold=True
     )
     for entry in sorted(entries, key=lambda x: x["size"], reverse=True):
         age = _age_days(entry["last_used"], now)
@@ -139,7 +205,7 @@ def print_listing(root=None, now=None):
             f"{format_size(entry['size']):>10}  "
             f"{(format_size(entry['tar_size']) if entry['tar_size'] else '-'):>10}  "
             f"{(f'{age:.0f}d' if age is not None else '?'):>8}  "
-            f"{entry['name']}"
+            f"{entry['url'] or entry['name']}"
         )
 
     total = sum(x["size"] for x in entries)
@@ -166,6 +232,7 @@ def print_listing(root=None, now=None):
             "`gimera cache clean`.",
             fg="yellow",
         )
+    _print_shallow_store(root)
     if strays:
         click.secho(
             f"{len(strays)} tarball(s) without a cache directory, "
@@ -176,6 +243,20 @@ def print_listing(root=None, now=None):
     return entries, strays
 
 
+def _print_shallow_store(root):
+    from .shallowstore import iter_snapshots
+    from .shallowstore import store_root
+
+    snapshots = list(
+        iter_snapshots(Path(root) / store_root().name if root else None)
+    )
+    if snapshots:
+        click.secho(
+            f"Shallow snapshots of no_cache repos: {len(snapshots)}, "
+            f"{format_size(sum(x['size'] for x in snapshots))}"
+        )
+
+
 def _safe_size(path):
     try:
         return path.stat().st_size
@@ -238,11 +319,15 @@ def _remove_entries(stale, unused_for, force):
     freed = 0
     for entry in stale:
         size = entry["size"]
+        if not dissociate_borrowers(entry["path"]):
+            click.secho(f"Kept {entry['name']}: still borrowed from", fg="red")
+            continue
         try:
             shutil.rmtree(entry["path"])
         except OSError as ex:
             click.secho(f"Could not remove {entry['path']}: {ex}", fg="red")
             continue
+        cacheindex.forget(entry["path"])
         click.secho(f"Removed {entry['name']}", fg="yellow")
         freed += size
     return freed
@@ -257,3 +342,590 @@ def _remove_file(path):
         return 0
     click.secho(f"Removed {path.name} ({format_size(size)})", fg="yellow")
     return size
+
+
+def _git_out(path, *args):
+    return subprocess.run(
+        git + list(args),
+        cwd=path,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    ).stdout
+
+
+def _pack_count(path):
+    return len(list((path / "objects" / "pack").glob("*.pack")))
+
+
+def _probe(path):
+    """Seconds for a full walk of the history.
+
+    The same kind of work `merge-base --is-ancestor` and `rev-list` do in
+    apply, so it shows what the commit-graph buys.
+    """
+    started = time.time()
+    try:
+        _git_out(path, "rev-list", "--count", "--all")
+    except subprocess.CalledProcessError:
+        return None
+    return time.time() - started
+
+
+def _maintenance_steps(path, prune_refs):
+    """(label, git arguments) in the order they run.
+
+    Partial caches get no incremental repack: `multi-pack-index repack` writes
+    the new pack without its `.promisor` marker, and a partial clone whose
+    trees point at blobs outside promisor packs is one that `git fsck` calls
+    broken. The multi-pack-index alone already spares the per-pack lookups.
+    """
+    steps = [("pack refs", ["pack-refs", "--all", "--prune"])]
+    if prune_refs:
+        steps.append(("prune stale refs", ["remote", "prune", "origin"]))
+    steps.append(
+        (
+            "commit-graph",
+            ["commit-graph", "write", "--reachable", "--changed-paths"],
+        )
+    )
+    steps.append(("multi-pack-index", ["multi-pack-index", "write"]))
+    if not is_partial_clone(path):
+        steps.append(("expire packs", ["multi-pack-index", "expire"]))
+        steps.append(
+            (
+                "incremental repack",
+                ["multi-pack-index", "repack", f"--batch-size={_batch_size(path)}"],
+            )
+        )
+        steps.append(("expire packs", ["multi-pack-index", "expire"]))
+    return steps
+
+
+def _batch_size(path):
+    """What `git maintenance`'s incremental-repack task would pick.
+
+    Everything but the largest pack, capped at 2 GB: the small packs of the
+    weekly fetches get folded together, the big initial clone is left alone.
+    """
+    sizes = sorted(
+        x.stat().st_size for x in (path / "objects" / "pack").glob("*.pack")
+    )
+    return min(sum(sizes[:-1]), 2 * 1024**3)
+
+
+def _activity_times(path):
+    times = {}
+    for candidate in [path] + [path / x for x in _ACTIVITY_MARKERS]:
+        try:
+            stat = candidate.stat()
+        except OSError:
+            continue
+        times[candidate] = (stat.st_atime, stat.st_mtime)
+    return times
+
+
+def _restore_activity_times(path, times):
+    """Maintenance is not use: keep last_used where it was.
+
+    pack-refs rewrites packed-refs and empties refs/, which would otherwise
+    make every maintained entry look freshly used to `clean --unused-for`.
+    """
+    newest = max((mtime for _, mtime in times.values()), default=0)
+    for candidate in [path] + [path / x for x in _ACTIVITY_MARKERS]:
+        # a marker that only came into existence now (packed-refs after the
+        # first pack-refs) gets the age of the entry, not the age of today
+        atime, mtime = times.get(candidate, (newest, newest))
+        try:
+            os.utime(candidate, (atime, mtime))
+        except OSError:
+            continue
+
+
+def maintain_entry(path, prune_refs=True, lock_timeout=None):
+    """Run the maintenance steps on one entry, under its cache lock."""
+    report = {
+        "name": path.name,
+        "size_before": dir_size(path),
+        "packs_before": _pack_count(path),
+        "probe_before": _probe(path),
+        "steps": [],
+        "errors": [],
+    }
+    times = _activity_times(path)
+    started = time.time()
+    lock_args = {"timeout": lock_timeout} if lock_timeout is not None else {}
+    with cache_lock(path, **lock_args):
+        for label, args in _maintenance_steps(path, prune_refs):
+            step_started = time.time()
+            try:
+                _git_out(path, *args)
+            except subprocess.CalledProcessError as ex:
+                # One failing step (typically pruning without network) must
+                # not keep the others from running.
+                report["errors"].append(f"{label}: {(ex.stderr or '').strip()}")
+                continue
+            report["steps"].append((label, time.time() - step_started))
+    _restore_activity_times(path, times)
+    report["duration"] = time.time() - started
+    report["size_after"] = dir_size(path)
+    cacheindex.record_size(path, report["size_after"])
+    report["packs_after"] = _pack_count(path)
+    report["probe_after"] = _probe(path)
+    return report
+
+
+def _format_seconds(value):
+    return "?" if value is None else f"{value:.2f}s"
+
+
+def maintain(root=None, names=None, prune_refs=True, lock_timeout=None):
+    """commit-graph, multi-pack-index and incremental repack for every entry.
+
+    Golden caches are only ever fetched into. After months of that the packs
+    pile up and walks over the history get slow; this is what git itself
+    would do in `git maintenance`, applied to caches nobody runs it for.
+    Members of a fork family are pooled first, the pools gc'd last - see
+    cachefamily. Returns the per-entry reports.
+    """
+    reports = []
+    for entry in iter_entries(root):
+        if names and entry["name"] not in names:
+            continue
+        if not (entry["path"] / "HEAD").exists():
+            continue
+        click.secho(f"Maintaining {entry['name']} ...", fg="cyan")
+        _pool(entry)
+        report = maintain_entry(
+            entry["path"], prune_refs=prune_refs, lock_timeout=lock_timeout
+        )
+        reports.append(report)
+        for label, seconds in report["steps"]:
+            click.secho(f"  {label:<20} {seconds:.2f}s")
+        for error in report["errors"]:
+            click.secho(f"  {error}", fg="yellow")
+        click.secho(
+            f"  size {format_size(report['size_before'])} -> "
+            f"{format_size(report['size_after'])}, "
+            f"packs {report['packs_before']} -> {report['packs_after']}, "
+            f"history walk {_format_seconds(report['probe_before'])} -> "
+            f"{_format_seconds(report['probe_after'])}, "
+            f"took {report['duration']:.1f}s",
+            fg="green",
+        )
+    for family, gone in maintain_pools(root).items():
+        click.secho(
+            f"Pool of family {family}: "
+            + (f"dropped {', '.join(gone)}" if gone else "nothing dropped"),
+            fg="green",
+        )
+    if not reports:
+        click.secho("Nothing to maintain.", fg="green")
+    return reports
+
+
+def _pool(entry):
+    """Bring a member of a fork family (back) into its pool - see cachefamily."""
+    from .cachefamily import join
+
+    url = entry["url"]
+    if not url:
+        try:
+            url = _git_out(entry["path"], "config", "remote.origin.url").strip()
+        except subprocess.CalledProcessError:
+            return
+    try:
+        if join(entry["path"], url):
+            click.secho("  pooled with its family")
+    except subprocess.CalledProcessError as ex:
+        click.secho(f"  pooling failed: {(ex.stderr or '').strip()}", fg="yellow")
+
+
+def entries_in_use(root=None, ignore_pid=None):
+    """Names of the entries a running gimera process has pinned.
+
+    Pin files of processes that are gone (killed, crashed) are removed on
+    the way - they pin nothing any more.
+    """
+    root = Path(root) if root else cache_root()
+    names = set()
+    pins_dir = root / in_use_dir().name
+    if not pins_dir.exists():
+        return names
+    for pins in pins_dir.iterdir():
+        try:
+            pid = int(pins.name)
+        except ValueError:
+            continue
+        if pid == ignore_pid:
+            continue
+        if not _pid_alive(pid):
+            try:
+                pins.unlink()
+            except OSError:
+                pass
+            continue
+        try:
+            names.update(x for x in pins.read_text().splitlines() if x)
+        except OSError:
+            continue
+    return names
+
+
+def _trash_dir(root):
+    return root / ".trash"
+
+
+def _move_to_trash(path, root):
+    """Take the entry out of the cache now, delete its files later.
+
+    A rename within the same filesystem is instant however large the entry
+    is, and from that moment on no gimera finds it any more. The actual
+    deletion runs in the background (_empty_trash).
+    """
+    if not dissociate_borrowers(path):
+        return False
+    trash = _trash_dir(root)
+    try:
+        trash.mkdir(parents=True, exist_ok=True)
+        path.rename(trash / f"{path.name}.{uuid.uuid4()}")
+    except OSError as ex:
+        click.secho(f"Could not evict {path}: {ex}", fg="red")
+        return False
+    cacheindex.forget(path)
+    return True
+
+
+def _removal_running(path):
+    try:
+        pid = int(Path(f"{path}.pid").read_text())
+    except (OSError, ValueError):
+        return False
+    return _pid_alive(pid)
+
+
+def _empty_trash(root):
+    """rm -rf everything in the trash, detached from this process.
+
+    Each item is renamed to `<name>.deleting` before its removal starts, and
+    the pid of that goes next to it: a later run starts no second removal
+    while the first one is still at it, and picks up one that was killed.
+    """
+    trash = _trash_dir(root)
+    if not trash.exists():
+        return
+    for path in sorted(trash.iterdir()):
+        if path.suffix == ".pid":
+            # its removal finished, but was killed before it took this along
+            if not path.with_suffix("").exists():
+                path.unlink(missing_ok=True)
+            continue
+        if not path.name.endswith(".deleting"):
+            deleting = path.with_name(f"{path.name}.deleting")
+            try:
+                path.rename(deleting)
+            except OSError:
+                # another gimera renamed it first
+                continue
+            path = deleting
+        elif _removal_running(path):
+            continue
+        proc = subprocess.Popen(
+            ["sh", "-c", 'rm -rf "$1" && rm -f "$1.pid"', "sh", str(path)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        Path(f"{path}.pid").write_text(str(proc.pid))
+
+
+def _is_locked(path):
+    return Path(f"{path}.lock").exists()
+
+
+def enforce_budget(root=None, budget=None):
+    """Evict least recently used entries until the cache fits the budget.
+
+    The budget is `cache_max_bytes` in ~/.gimera; without it nothing happens.
+    Unlike `clean --unused-for` this runs without asking: the user set the
+    limit, and an evicted entry only costs a fresh clone. Entries pinned by a
+    running gimera or locked by one (maintenance) are never evicted, even if
+    the budget stays exceeded. Returns the number of bytes freed.
+    """
+    from .userconfig import cache_max_bytes
+
+    root = Path(root) if root else cache_root()
+    budget = cache_max_bytes() if budget is None else budget
+    if not budget or not root.exists():
+        return 0
+    _empty_trash(root)
+    # after every apply: the sizes gimera recorded after its own clones and
+    # fetches are close enough, nothing is measured that has one
+    entries = list(iter_entries(root, recorded_sizes=True))
+    # the family pools are outside the entries, charged to their members
+    unowned = charge_pools(entries, root)
+    total = sum(x["size"] for x in entries) + unowned
+    if total <= budget:
+        return 0
+
+    in_use = entries_in_use(root, ignore_pid=os.getpid())
+    freed = 0
+    for entry in sorted(entries, key=lambda x: x["last_used"]):
+        if total - freed <= budget:
+            break
+        if entry["name"] in in_use or _is_locked(entry["path"]):
+            continue
+        if _move_to_trash(entry["path"], root):
+            # its share of a family pool stays until the pool is gc'ed
+            own = entry["size"] - entry.get("pool_share", 0)
+            freed += own
+            click.secho(
+                f"Evicted {entry['name']} ({format_size(own)}) "
+                f"from the cache, over budget of {format_size(budget)}",
+                fg="yellow",
+            )
+    _empty_trash(root)
+    if total - freed > budget:
+        click.secho(
+            f"The cache is {format_size(total - freed)}, still over its budget "
+            f"of {format_size(budget)}: the rest is in use.",
+            fg="yellow",
+        )
+    return freed
+
+
+# Lets the local upload-pack serve a filtered clone and single blobs. Only
+# for the conversion: the config is dropped before the entry goes live.
+_LOCAL_UPLOAD_PACK = (
+    "git -c uploadpack.allowFilter=true -c uploadpack.allowAnySHA1InWant=true "
+    "upload-pack"
+)
+
+
+def _compactable(entry, known, in_use, force):
+    """None if the entry may be compacted, else why not."""
+    path = entry["path"]
+    if not (path / "HEAD").exists():
+        return "not a git repository"
+    if is_partial_clone(path):
+        return "already partial"
+    if shares_layer(path):
+        return "shares its history with a cache layer or family pool"
+    row = known.get(entry["name"]) or {}
+    if row.get("used_as_submodule"):
+        # `git submodule update` clones out of the cache, and a partial clone
+        # cannot serve that - see cachedir._wants_partial_clone
+        return "used by a submodule"
+    if not row.get("url") and not force:
+        return "not known whether submodules use it (--force to compact anyway)"
+    if entry["name"] in in_use:
+        return "in use by a running gimera"
+    return None
+
+
+def _keep_shas(path, keep, keep_head=True):
+    """The snapshots whose file contents survive: HEAD and the --keep ones."""
+    shas = []
+    for rev in (["HEAD"] if keep_head else []) + list(keep or []):
+        try:
+            shas.append(
+                _git_out(
+                    path, "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"
+                ).strip()
+            )
+        except subprocess.CalledProcessError:
+            click.secho(
+                f"  {rev} is not in the cache, nothing kept for it", fg="yellow"
+            )
+    return shas
+
+
+def compact_entry(path, keep=None, lock_timeout=None, keep_head=True):
+    """Turn a cache entry into a partial clone of itself.
+
+    git 2.39 has no `repack --filter`, so the partial clone is cloned out of
+    the entry with --filter=blob:none, gets the blobs of the kept snapshots
+    from it in one fetch, and then takes its place. Until the swap nothing
+    touches the original, so a failure leaves it as it was. Works the same
+    on an entry that is partial already, which is what `gc` does. Returns
+    the report, or None if it failed.
+    """
+    from .cachedir import hydrate
+    from .tools import replace_dir_with
+
+    upstream = _git_out(path, "config", "--get", "remote.origin.url").strip()
+    report = {"name": path.name, "size_before": dir_size(path)}
+    times = _activity_times(path)
+    started = time.time()
+    tmp = Path(f"{path}.compact-{uuid.uuid4()}")
+    lock_args = {"timeout": lock_timeout} if lock_timeout is not None else {}
+    with cache_lock(path, **lock_args):
+        # blobs are about to go that a borrowing submodule clone may need
+        if not dissociate_borrowers(path):
+            return None
+        try:
+            subprocess.run(
+                git
+                + [
+                    "clone",
+                    "--bare",
+                    "--quiet",
+                    "--filter=blob:none",
+                    f"--upload-pack={_LOCAL_UPLOAD_PACK}",
+                    f"file://{path}",
+                    str(tmp),
+                ],
+                capture_output=True,
+                encoding="utf8",
+                check=True,
+            )
+            _git_out(tmp, "config", "remote.origin.uploadpack", _LOCAL_UPLOAD_PACK)
+            # clone --bare takes branches and tags only
+            _git_out(tmp, "fetch", "--quiet", "origin", "+refs/*:refs/*")
+            report["blobs_kept"] = hydrate(
+                tmp,
+                _keep_shas(tmp, keep, keep_head=keep_head),
+                present_in=path if is_partial_clone(path) else None,
+            )
+            _git_out(tmp, "config", "--unset", "remote.origin.uploadpack")
+            _git_out(tmp, "config", "remote.origin.url", upstream)
+        except subprocess.CalledProcessError as ex:
+            click.secho(
+                f"Could not compact {path.name}: {(ex.stderr or '').strip()}",
+                fg="red",
+            )
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+        replace_dir_with(tmp, path)
+    _restore_activity_times(path, times)
+    report["duration"] = time.time() - started
+    report["size_after"] = cacheindex.entry_size(path)
+    cacheindex.record_size(path, report["size_after"], partial=True)
+    return report
+
+
+def compact(root=None, names=None, keep=None, force=False, lock_timeout=None):
+    """Convert full cache entries of integrated repos into partial clones.
+
+    Entries cloned before partial clones existed, or with GIMERA_FULL_CLONE=1,
+    keep the file contents of their whole history. Only blobs of HEAD and of
+    the snapshots passed as `keep` stay; everything else comes back from the
+    remote when a snapshot is checked out. The snapshots some project pins
+    (cacheindex.record_pin) keep theirs too. Returns the per-entry reports.
+    """
+    root = Path(root) if root else cache_root()
+    known = cacheindex.rows(root)
+    in_use = entries_in_use(root, ignore_pid=os.getpid())
+    pinned = _pinned_shas(root, since=None)
+    reports = []
+    for entry in iter_entries(root):
+        if names and entry["name"] not in names:
+            continue
+        reason = _compactable(entry, known, in_use, force)
+        if reason:
+            if names:
+                click.secho(f"Skipping {entry['name']}: {reason}", fg="yellow")
+            continue
+        click.secho(f"Compacting {entry['name']} ...", fg="cyan")
+        # whatever a project pins is what the next apply extracts
+        kept = list(keep or []) + sorted(
+            x
+            for x in pinned.get(entry["name"], ())
+            if _has_commit(entry["path"], x)
+        )
+        report = compact_entry(
+            entry["path"], keep=kept, lock_timeout=lock_timeout
+        )
+        if not report:
+            continue
+        reports.append(report)
+        click.secho(
+            f"  size {format_size(report['size_before'])} -> "
+            f"{format_size(report['size_after'])}, "
+            f"kept {report['blobs_kept']} blobs, "
+            f"took {report['duration']:.1f}s",
+            fg="green",
+        )
+    if not reports:
+        click.secho("Nothing to compact.", fg="green")
+    else:
+        freed = sum(x["size_before"] - x["size_after"] for x in reports)
+        click.secho(f"Freed {format_size(freed)}.", fg="green")
+    return reports
+
+
+def _pinned_shas(root, since):
+    """Cache entry name -> shas pinned by some project since `since`."""
+    from .cachedir import _make_cache_path
+
+    by_entry = {}
+    for pin in cacheindex.pins(root, since=since):
+        name = _make_cache_path(pin["url"]).name
+        by_entry.setdefault(name, set()).add(pin["sha"])
+    return by_entry
+
+
+def gc(root=None, names=None, days=30, lock_timeout=None):
+    """Drop file contents of partial caches that no current pin needs.
+
+    Every `git archive` leaves the blobs of its snapshot in the cache, so a
+    partial cache grows with every pin bump. Only the snapshots of pins that
+    some project registered (cacheindex.record_pin) within the last `days`
+    days keep theirs; the rest come back from the remote if ever needed
+    again. Entries without any registered pin are left alone - those are a
+    case for `clean`, not for this. Returns the per-entry reports.
+    """
+    root = Path(root) if root else cache_root()
+    pinned = _pinned_shas(root, since=time.time() - days * 86400)
+    in_use = entries_in_use(root, ignore_pid=os.getpid())
+    reports = []
+    for entry in iter_entries(root):
+        if names and entry["name"] not in names:
+            continue
+        if not is_partial_clone(entry["path"]) or shares_layer(entry["path"]):
+            continue
+        if entry["name"] in in_use:
+            click.secho(f"Skipping {entry['name']}: in use", fg="yellow")
+            continue
+        shas = pinned.get(entry["name"])
+        if not shas:
+            if names:
+                click.secho(
+                    f"Skipping {entry['name']}: no pin registered within "
+                    f"{days} days",
+                    fg="yellow",
+                )
+            continue
+        present = [x for x in shas if _has_commit(entry["path"], x)]
+        click.secho(
+            f"Collecting {entry['name']} ({len(present)} pinned snapshots) ...",
+            fg="cyan",
+        )
+        report = compact_entry(
+            entry["path"], keep=present, lock_timeout=lock_timeout,
+            keep_head=False,
+        )
+        if not report:
+            continue
+        reports.append(report)
+        click.secho(
+            f"  size {format_size(report['size_before'])} -> "
+            f"{format_size(report['size_after'])}, "
+            f"kept {report['blobs_kept']} blobs, "
+            f"took {report['duration']:.1f}s",
+            fg="green",
+        )
+    if not reports:
+        click.secho("Nothing to collect.", fg="green")
+    else:
+        freed = sum(x["size_before"] - x["size_after"] for x in reports)
+        click.secho(f"Freed {format_size(freed)}.", fg="green")
+    return reports
+
+
+def _has_commit(path, sha):
+    try:
+        _git_out(path, "cat-file", "-e", f"{sha}^{{commit}}")
+    except subprocess.CalledProcessError:
+        return False
+    return True
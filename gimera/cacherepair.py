@@ -0,0 +1,225 @@
+"""Repair a cache entry whose fetch failed, instead of recloning it.
+
+A failed or unverified fetch used to delete the whole entry and clone it
+again - for odoo/odoo many GB, usually because of one lock file a killed
+git left behind or one ref that a crash truncated to zero bytes. The tiers
+below go from cheap to expensive; each runs only if git's error output
+points at what it repairs, after each one the fetch is retried, and the
+first that makes it work wins:
+
+  1. stale locks: *.lock files in the git dir older than STALE_LOCK_AGE
+  2. broken refs: refs that cannot be read or point to missing objects
+  3. branch: drop the local branch and its remote-tracking ref, refetch;
+     put back as they were if that fails too
+  4. derived data: commit-graph and multi-pack-index, rebuilt by git later
+
+A failure that is not about the local repository at all - the network,
+the remote, credentials - is reported right away and touches nothing.
+Only if git named a damaged object and no tier helped is the entry
+recloned; the fetch is not held up by a `git fsck` of the whole store.
+"""
+
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import click
+
+from .consts import gitcmd as git
+from .tools import _raise_error
+from .tools import file_age
+
+# git holds its lock files for the duration of one command; a fetch's ref
+# locks for a fraction of a second. Ten minutes is dead for sure.
+STALE_LOCK_AGE = 600
+
+
+def _git(path, *args, check=True):
+    return subprocess.run(
+        git + list(args),
+        cwd=path,
+        capture_output=True,
+        encoding="utf8",
+        check=check,
+    )
+
+
+def git_dir(path):
+    path = Path(path)
+    try:
+        return Path(_git(path, "rev-parse", "--absolute-git-dir").stdout.strip())
+    except subprocess.CalledProcessError:
+        return path / ".git" if (path / ".git").is_dir() else path
+
+
+def remove_stale_locks(path, branch=None, remote_name=None):
+    gitdir = git_dir(path)
+    # where git puts the locks a fetch trips over; objects/ can hold a
+    # hundred thousand files and no lock that matters here
+    candidates = list(gitdir.glob("*.lock"))
+    candidates += list((gitdir / "refs").rglob("*.lock"))
+    removed = []
+    for lockfile in candidates:
+        # gimera's own locks are wait_git_lock's business
+        if lockfile.name.startswith("gimera.lock") or not lockfile.is_file():
+            continue
+        try:
+            if file_age(lockfile) <= STALE_LOCK_AGE:
+                continue
+            lockfile.unlink()
+        except OSError:
+            continue
+        removed.append(lockfile)
+    return bool(removed)
+
+
+def _delete_ref(path, gitdir, refname):
+    loose = gitdir / refname
+    if loose.is_file():
+        loose.unlink()
+    # a packed ref, or one that is fine and only points nowhere
+    _git(path, "update-ref", "-d", "--no-deref", refname, check=False)
+
+
+def remove_broken_refs(path, branch=None, remote_name=None):
+    gitdir = git_dir(path)
+    listing = _git(
+        path, "for-each-ref", "--format=%(objectname) %(refname)", check=False
+    )
+    broken = re.findall(r"ignoring broken ref (\S+)", listing.stderr)
+    refs = dict(
+        reversed(line.split(" ", 1)) for line in listing.stdout.splitlines()
+    )
+    if refs:
+        checked = subprocess.run(
+            git + ["cat-file", "--batch-check"],
+            cwd=path,
+            input="\n".join(set(refs.values())) + "\n",
+            capture_output=True,
+            encoding="utf8",
+        ).stdout
+        missing = {
+            line.split()[0] for line in checked.splitlines() if line.endswith("missing")
+        }
+        broken += [ref for ref, sha in refs.items() if sha in missing]
+    for refname in broken:
+        click.secho(f"  dropping broken ref {refname}", fg="yellow")
+        _delete_ref(path, gitdir, refname)
+    return bool(broken)
+
+
+def drop_branch(path, branch=None, remote_name=None):
+    """Returns a function that puts the refs back, for when the refetch
+    fails as well - a cache without its branch is worse than before."""
+    if not branch:
+        return False
+    gitdir = git_dir(path)
+    saved = {}
+    for refname in (f"refs/heads/{branch}", f"refs/remotes/{remote_name}/{branch}"):
+        sha = _git(path, "rev-parse", "--verify", "-q", refname, check=False)
+        if sha.returncode == 0:
+            saved[refname] = sha.stdout.strip()
+        _delete_ref(path, gitdir, refname)
+
+    def restore():
+        for refname, sha in saved.items():
+            _git(path, "update-ref", refname, sha, check=False)
+
+    return restore
+
+
+def drop_derived_data(path, branch=None, remote_name=None):
+    objects = git_dir(path) / "objects"
+    dropped = False
+    for derived in (
+        objects / "info" / "commit-graph",
+        objects / "info" / "commit-graphs",
+        objects / "pack" / "multi-pack-index",
+    ):
+        if derived.is_dir():
+            shutil.rmtree(derived, ignore_errors=True)
+        elif derived.exists():
+            derived.unlink()
+        else:
+            continue
+        dropped = True
+    return dropped
+
+
+# What git says when a tier's part of the repository is in the way.
+_LOCK_ERRORS = r"\.lock\b"
+_REF_ERRORS = (
+    r"broken ref|bad object refs/|invalid sha1 pointer|not a valid object"
+    r"|cannot lock ref|unable to (?:update|resolve) (?:local )?ref"
+    r"|did not send all necessary objects"
+)
+_DERIVED_ERRORS = r"commit-graph|multi-pack-index|midx"
+# ... and when an object itself is damaged: nothing short of a reclone
+_OBJECT_ERRORS = (
+    r"is corrupt|inflate|packfile .* cannot be accessed|object file .* is empty"
+    r"|missing (?:blob|tree|commit) [0-9a-f]{7}|bad object [0-9a-f]{40}"
+    r"|unable to read [0-9a-f]{40}|failed to read object|index-pack failed"
+)
+
+TIERS = [
+    ("stale locks", _LOCK_ERRORS, remove_stale_locks),
+    ("broken refs", _REF_ERRORS, remove_broken_refs),
+    ("refetch branch", _REF_ERRORS, drop_branch),
+    ("commit-graph", _DERIVED_ERRORS, drop_derived_data),
+]
+
+
+def is_local_error(stderr):
+    """True if a failed fetch's output is about the local repository."""
+    patterns = [x[1] for x in TIERS] + [_OBJECT_ERRORS]
+    return any(re.search(x, stderr or "") for x in patterns)
+
+
+def recover(path, refetch, branch=None, remote_name="origin", errors=None):
+    """Walk the tiers until `refetch()` returns True.
+
+    `errors` holds the stderr of each failed fetch, the last one first
+    decides which tiers apply; `refetch` adds to it. Returns the name of the
+    tier that did it, None if git reported damaged objects and the entry has
+    to be recloned. An error if the cause is not local, or if nothing helped
+    and no object is damaged.
+    """
+    errors = errors if errors is not None else []
+
+    def last_error():
+        return errors[-1] if errors else ""
+
+    if not is_local_error(last_error()):
+        _raise_error(
+            f"Fetching {branch} into {path} failed, and not because of the "
+            f"cache - it is kept. Check the remote, the network and the "
+            f"credentials."
+        )
+        return None
+    started = time.time()
+    for name, pattern, repair in TIERS:
+        if not re.search(pattern, last_error()):
+            continue
+        done = repair(path, branch=branch, remote_name=remote_name)
+        if not done:
+            continue
+        click.secho(f"  {path}: repaired {name}, fetching again", fg="yellow")
+        if refetch():
+            click.secho(
+                f"  {path}: recovered by {name} "
+                f"in {time.time() - started:.1f}s - no reclone needed",
+                fg="green",
+            )
+            return name
+        if callable(done):
+            done()
+    if re.search(_OBJECT_ERRORS, "\n".join(errors)):
+        click.secho(f"  {path}: object store is corrupt", fg="red")
+        return None
+    _raise_error(
+        f"Fetching {branch} into {path} failed and no repair helped; git "
+        f"reported no damaged object, so the cache is kept."
+    )
+    return None
@@ -0,0 +1,181 @@
+"""Serve the golden cache to other machines: gimera cache serve
+
+A build cluster clones odoo/odoo once per node, from GitHub, although the
+node next to it has it already. `gimera cache serve` offers the entries of
+this machine's cache read-only over git's smart HTTP protocol - every entry
+under its name, http://node-1:9419/github.com-odoo-odoo - and the other
+nodes list it in `peers` in their ~/.gimera. They clone and fetch from the
+peers first and from upstream only what none of them has (cachedir
+fetch_sources); a peer that does not have an entry answers 404 and is
+skipped.
+
+The protocol work is done by `git http-backend`, run as a CGI per request.
+Pushes are refused. Filtered clones and requests by sha are allowed, so a
+peer's partial entry and a pinned commit both work.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import click
+
+from .cachedir import in_use_while
+from .cachedir import cache_root
+
+DEFAULT_PORT = 9419
+
+# handed to upload-pack through http-backend's environment
+_UPLOAD_PACK_CONFIG = {
+    "uploadpack.allowFilter": "true",
+    "uploadpack.allowAnySHA1InWant": "true",
+}
+
+_CHUNK = 64 * 1024
+
+
+def _read_body(handler):
+    """The request body; git sends large ones chunked."""
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        body = bytearray()
+        while True:
+            size = int(handler.rfile.readline().split(b";")[0].strip(), 16)
+            if not size:
+                handler.rfile.readline()
+                return bytes(body)
+            body += handler.rfile.read(size)
+            handler.rfile.readline()
+    length = int(handler.headers.get("Content-Length") or 0)
+    return handler.rfile.read(length) if length else b""
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    root = None
+    server_version = "gimera-cache"
+
+    def do_GET(self):
+        self._serve()
+
+    def do_POST(self):
+        self._serve()
+
+    def log_message(self, format, *args):
+        if os.getenv("GIMERA_VERBOSE") == "1":
+            super().log_message(format, *args)
+
+    def _serve(self):
+        path, _, query = self.path.partition("?")
+        if "receive-pack" in path or "receive-pack" in query:
+            self.send_error(403, "read-only")
+            return
+        name = path.lstrip("/").split("/", 1)[0]
+        entry = self.root / name
+        if not name or name.startswith(".") or not (entry / "HEAD").exists():
+            self.send_error(404, "not in this cache")
+            return
+        # not evicted while a peer clones from it
+        with in_use_while(name):
+            self._run_backend(path, query)
+
+    def _run_backend(self, path, query):
+        env = dict(os.environ)
+        env.update(
+            {
+                "GIT_PROJECT_ROOT": str(self.root),
+                "GIT_HTTP_EXPORT_ALL": "1",
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "REQUEST_METHOD": self.command,
+                "REMOTE_ADDR": self.client_address[0],
+                "CONTENT_TYPE": self.headers.get("Content-Type", ""),
+                "GIT_PROTOCOL": self.headers.get("Git-Protocol", ""),
+                "HTTP_CONTENT_ENCODING": self.headers.get("Content-Encoding", ""),
+                "GIT_CONFIG_COUNT": str(len(_UPLOAD_PACK_CONFIG)),
+            }
+        )
+        for i, (key, value) in enumerate(_UPLOAD_PACK_CONFIG.items()):
+            env[f"GIT_CONFIG_KEY_{i}"] = key
+            env[f"GIT_CONFIG_VALUE_{i}"] = value
+        body = _read_body(self) if self.command == "POST" else b""
+        env["CONTENT_LENGTH"] = str(len(body))
+
+        proc = subprocess.Popen(
+            ["git", "http-backend"],
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        # the pack is streamed out while git still writes it; a clone of
+        # odoo/odoo does not fit into memory
+        writer = threading.Thread(target=self._feed, args=(proc.stdin, body))
+        writer.start()
+        try:
+            self._relay(proc.stdout)
+        finally:
+            writer.join()
+            proc.stdout.close()
+            proc.wait()
+
+    @staticmethod
+    def _feed(stdin, body):
+        try:
+            stdin.write(body)
+        except BrokenPipeError:
+            pass
+        finally:
+            stdin.close()
+
+    def _relay(self, stdout):
+        status = "200 OK"
+        headers = []
+        while True:
+            line = stdout.readline().decode("latin-1").rstrip("\r\n")
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            if key.lower() == "status":
+                status = value.strip()
+            else:
+                headers.append((key, value.strip()))
+        code, _, message = status.partition(" ")
+        self.send_response(int(code), message or None)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            shutil.copyfileobj(stdout, self.wfile, _CHUNK)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(bind="127.0.0.1", port=DEFAULT_PORT, root=None):
+    handler = type(
+        "Handler",
+        (CacheRequestHandler,),
+        {"root": Path(root) if root else cache_root()},
+    )
+    server = ThreadingHTTPServer((bind, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(bind="127.0.0.1", port=DEFAULT_PORT, root=None):
+    server = make_server(bind, port, root)
+    host, port = server.server_address[:2]
+    click.secho(
+        f"Serving {server.RequestHandlerClass.root} read-only on "
+        f"http://{host}:{port}/ - list it in 'peers' in ~/.gimera "
+        "of the other machines.",
+        fg="green",
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -11,6 +11,8 @@ from .config import Config
 from .patches import _apply_patchfile
 from .patches import _technically_make_patch
 from .patches import _if_ignored_move_to_separate_dir
+from .patches import _is_untracked_dir
+from .patches import _diff_against_upstream
 
 
 def _commit(repo, branch, message, preview):
@@ -38,16 +40,24 @@ def _commit(repo, branch, message, preview):
         gitrepo.X(*(git + ["checkout", "-f", branch]))
 
         # If the repo path is gitignored/untracked in the main repo, the main
-        # repo offers no diff base — _if_ignored_move_to_separate_dir builds a
-        # temp repo at the configured upstream state and rsyncs the local
-        # changes over it, so the patch is the actual delta against upstream.
-        with _if_ignored_move_to_separate_dir(
-            None, main_repo, repo, common_vars
-        ) as (patch_repo, _is_temp_path):
-            src_path = patch_repo.path / repo.path
-            # the temp repo received a copy of the main .gitignore
-            with patch_repo.temporary_unignore(src_path):
-                patch_content = _technically_make_patch(patch_repo, src_path)
+        # repo offers no diff base — the local directory is diffed against the
+        # pinned upstream tree in the golden cache instead. Where that cannot
+        # be done, _if_ignored_move_to_separate_dir builds a temp repo at the
+        # configured upstream state and rsyncs the local changes over it, so
+        # the patch is the actual delta against upstream.
+        diffed = None
+        if _is_untracked_dir(main_repo, repo):
+            diffed = _diff_against_upstream(main_repo, repo)
+        if diffed:
+            patch_content = diffed[1]
+        else:
+            with _if_ignored_move_to_separate_dir(
+                None, main_repo, repo, common_vars
+            ) as (patch_repo, _is_temp_path):
+                src_path = patch_repo.path / repo.path
+                # the temp repo received a copy of the main .gitignore
+                with patch_repo.temporary_unignore(src_path):
+                    patch_content = _technically_make_patch(patch_repo, src_path)
 
         patchfile = gitrepo.path / "1.patch"
         patchfile.write_text(patch_content)
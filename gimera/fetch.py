@@ -9,7 +9,15 @@ from .submodule import _has_repo_latest_commit
 from .consts import gitcmd as git
 from .repo import Repo
 from .cachedir import _get_cache_dir
+from .cachedir import cache_lock
+from .cachedir import _record_write
+from .cachedir import dissociate_or_abort
+from .cachedir import fetch_sources
+from .cacherepair import recover
 from .tools import verbose
+from .userconfig import is_no_cache
+from .userconfig import hedge_delay
+from . import hedge
 from .tools import wait_git_lock
 from .tools import _raise_error
 from .tools import try_rm_tree
@@ -34,6 +42,12 @@ def _fetch_repos_in_parallel(
                 return
             click.secho(f"Fetching {repo_yml.url}", fg="cyan")
             results["urls"].add(repo_yml.url)
+            if is_no_cache(repo_yml.url):
+                # shallow snapshots are fetched by sha when used, and never
+                # updated in place - see shallowstore
+                return
+            if _fetched_by_daemon(repo_yml, minimal_fetch, update):
+                return
             with _get_cache_dir(
                 main_repo, repo_yml, no_action_if_not_exist=True
             ) as cache_dir:
@@ -52,7 +66,11 @@ def _fetch_repos_in_parallel(
                     if do_fetch:
                         with wait_git_lock(cache_dir):
                             _fetch_branch(
-                                repo, repo_yml, filter_remote="origin", no_fetch=False
+                                repo,
+                                repo_yml,
+                                filter_remote="origin",
+                                no_fetch=False,
+                                update=update,
                             )
 
         except Exception as ex:
@@ -86,19 +104,45 @@ def _fetch_repos_in_parallel(
             raise Exception(results["errors"])
 
 
-def _fetch_branch(repo, repo_yml, no_fetch=False, filter_remote=None, **options):
+def _fetched_by_daemon(repo_yml, minimal_fetch, update=False):
+    """Let `gimera cached` fetch, if it runs - see cachedaemon."""
+    from .cachedaemon import repo_params
+    from .cachedaemon import request
+
+    answer = request(
+        "fetch",
+        minimal=bool(minimal_fetch),
+        update=bool(update),
+        **repo_params(repo_yml),
+    )
+    return bool(answer and answer.get("path"))
+
+
+def _fetch_branch(
+    repo, repo_yml, no_fetch=False, filter_remote=None, update=False, **options
+):
     url = repo_yml.url
 
     fetch_exception = None
     if no_fetch:
         return
+    delay = hedge_delay()
     with assert_exception_no_exit():
         for remote in repo.remotes:
             try:
                 url = remote.url
+                if delay:
+                    url = hedge.pick_url(url, repo_yml.branch, delay)
                 _set_url_and_fetch(
-                    repo, repo_yml, remote.name, url, filter_remote=filter_remote
+                    repo,
+                    repo_yml,
+                    remote.name,
+                    url,
+                    filter_remote=filter_remote,
+                    update=update,
                 )
+                if delay:
+                    hedge.remember(url)
             except Exception as ex:
                 fetch_exception = ex
                 for combination in [
@@ -114,7 +158,10 @@ def _fetch_branch(repo, repo_yml, no_fetch=False, filter_remote=None, **options)
                                 remote.name,
                                 url_http,
                                 filter_remote=filter_remote,
+                                update=update,
                             )
+                            if delay:
+                                hedge.remember(url_http)
                             break
                         except Exception:
                             raise fetch_exception
@@ -122,46 +169,87 @@ def _fetch_branch(repo, repo_yml, no_fetch=False, filter_remote=None, **options)
                     raise fetch_exception
 
 
-def _set_url_and_fetch(
-    repo, repo_yml, remote_name, url, filter_remote=None, trycount=0
-):
-    repo.set_remote_url(remote_name, url)
-    branch = repo_yml.branch
-    todo_branches = [branch]
-    success = False
-
+def _fetch_and_verify(repo, remote_name, branch, errors=None):
+    """Fetch `branch` from a remote or URL and point the local branch at it;
+    True if it does. git's error output goes to `errors` if given."""
     with wait_git_lock(repo.path):
         try:
-            repo.out(*(git + ["fetch", remote_name] + todo_branches))
+            repo.out(*(git + ["fetch", remote_name, branch]))
             # FETCH_HEAD contains the sha we just fetched — no need for
             # another network round-trip via git ls-remote.
-            fetched_sha = repo.out(
-                *(git + ["rev-parse", "FETCH_HEAD"])
-            ).strip()
-            for branch in todo_branches:
-                repo.X(*(git + ["update-ref", f"refs/heads/{branch}", fetched_sha]))
-            success = True
+            fetched_sha = repo.out(*(git + ["rev-parse", "FETCH_HEAD"])).strip()
+            repo.out(*(git + ["update-ref", f"refs/heads/{branch}", fetched_sha]))
         except subprocess.CalledProcessError as ex:
             click.secho(ex.stderr, fg="red")
+            if errors is not None:
+                errors.append(ex.stderr or "")
+            return False
+
+    # Verify the local branch now points to the fetched sha (local check only)
+    local_sha = repo.out(
+        *(git + ["rev-parse", branch]), allow_error=True,
+    ).strip()
+    return local_sha == fetched_sha
+
+
+def _remote_head(repo, remote_name, branch):
+    """The sha `branch` has on the remote, None if it does not answer."""
+    try:
+        out = repo.out(*(git + ["ls-remote", remote_name, f"refs/heads/{branch}"]))
+    except subprocess.CalledProcessError:
+        return None
+    return out.split()[0] if out.strip() else None
+
+
+def _set_url_and_fetch(
+    repo, repo_yml, remote_name, url, filter_remote=None, trycount=0, update=False
+):
+    # not while maintenance rewrites the packs, see cache_lock
+    with cache_lock(repo.path):
+        repo.set_remote_url(remote_name, url)
+        branch = repo_yml.branch
+
+        errors = []
+
+        def refetch():
+            return _fetch_and_verify(repo, remote_name, branch, errors=errors)
+
+        # mirror and peers are tried first, and only by URL: origin stays
+        # canonical. `apply -u` wants the head of origin, not the state of a
+        # mirror that lags behind: if they differ, origin fetches the rest.
+        sources = fetch_sources(repo_yml.url)
+        head = _remote_head(repo, remote_name, branch) if update and sources else None
+        for label, source in sources:
+            if _fetch_and_verify(repo, source, branch):
+                if head and repo.out(*(git + ["rev-parse", branch])) != head:
+                    click.secho(
+                        f"{branch} of {repo_yml.url} on {label} is behind, "
+                        "fetching from origin",
+                        fg="yellow",
+                    )
+                    continue
+                verbose(f"Fetched {branch} of {repo_yml.url} from {label}")
+                _record_write(repo.path)
+                return
 
-    if success:
-        # Verify the local branch now points to the fetched sha (local check only)
-        local_sha = repo.out(
-            *(git + ["rev-parse", repo_yml.branch]), allow_error=True,
-        ).strip()
-        if local_sha != fetched_sha:
-            success = False
+        if refetch() or (
+            trycount == 0
+            and recover(repo.path, refetch, branch, remote_name, errors=errors)
+        ):
+            # what came in goes to the family pool at the next `cache
+            # maintain` (cachemaint._pool), not while the apply waits
+            _record_write(repo.path)
+            return
 
-    if not success:
         if trycount == 0:
             click.secho(
                 (
                     f"This the absolutely LAST RESORT: deleting now {repo.path} as "
-                    "fetching the origin and updating the branches did not update the "
-                    "local branches."
+                    "its object store is corrupt."
                 )
             )
 
+            dissociate_or_abort(repo.path)
             try_rm_tree(repo.path)
             with _get_cache_dir(repo, repo_yml) as path:
                 pass
@@ -172,6 +260,7 @@ def _set_url_and_fetch(
                 url,
                 filter_remote=filter_remote,
                 trycount=trycount + 1,
+                update=update,
             )
         else:
             _raise_error(
@@ -90,6 +90,185 @@ def cache_clean(unused_for, force):
     clean(unused_for=unused_for, force=force)
 
 
+@cache.command(
+    name="maintain",
+    help=(
+        "Write commit-graphs and multi-pack-indexes, fold small packs "
+        "together and prune stale refs in the golden cache. Runs unattended "
+        "and under the cache lock, so it can go into cron, e.g. "
+        "'0 3 * * 0 gimera cache maintain'."
+    ),
+)
+@click.argument("names", nargs=-1)
+@click.option(
+    "--no-prune-refs",
+    is_flag=True,
+    help="Do not ask the remotes which branches are gone (needs network).",
+)
+@click.option(
+    "--lock-timeout",
+    type=int,
+    default=None,
+    metavar="SECONDS",
+    help="How long to wait for an entry another gimera is working on.",
+)
+def cache_maintain(names, no_prune_refs, lock_timeout):
+    from .cachemaint import maintain
+
+    maintain(names=names, prune_refs=not no_prune_refs, lock_timeout=lock_timeout)
+
+
+@cache.command(
+    name="compact",
+    help=(
+        "Convert full cache entries of integrated repos into partial clones "
+        "(--filter=blob:none), keeping the file contents of HEAD and of "
+        "--keep only. Entries used by submodules are left alone."
+    ),
+)
+@click.argument("names", nargs=-1)
+@click.option(
+    "--keep",
+    multiple=True,
+    metavar="SHA",
+    help="Also keep the file contents of this commit or branch. Repeatable.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Also compact entries the cache index knows nothing about.",
+)
+@click.option(
+    "--lock-timeout",
+    type=int,
+    default=None,
+    metavar="SECONDS",
+    help="How long to wait for an entry another gimera is working on.",
+)
+def cache_compact(names, keep, force, lock_timeout):
+    from .cachemaint import compact
+
+    compact(names=names, keep=keep, force=force, lock_timeout=lock_timeout)
+
+
+@cache.command(
+    name="gc",
+    help=(
+        "Drop file contents from partial cache entries that no project "
+        "pinned within --days days. Every apply registers its pins."
+    ),
+)
+@click.argument("names", nargs=-1)
+@click.option(
+    "--days",
+    type=int,
+    default=30,
+    show_default=True,
+    help="Pins not seen by an apply for this long no longer count.",
+)
+@click.option(
+    "--lock-timeout",
+    type=int,
+    default=None,
+    metavar="SECONDS",
+    help="How long to wait for an entry another gimera is working on.",
+)
+def cache_gc(names, days, lock_timeout):
+    from .cachemaint import gc
+
+    gc(names=names, days=days, lock_timeout=lock_timeout)
+
+
+@cache.command(
+    name="export",
+    help=(
+        "Write the cache entries as git bundles plus a manifest.json into "
+        "DIRECTORY, for 'gimera cache import' on another machine. Exporting "
+        "into the same directory again only adds what changed."
+    ),
+)
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.argument("names", nargs=-1)
+def cache_export(directory, names):
+    from .cachebundle import export
+
+    export(directory, names=names)
+
+
+@cache.command(
+    name="import",
+    help=(
+        "Create cache entries from the bundles 'gimera cache export' wrote "
+        "into DIRECTORY. Entries already in the cache are left alone; the "
+        "next apply fetches what is newer upstream."
+    ),
+)
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.argument("names", nargs=-1)
+def cache_import(directory, names):
+    from .cachebundle import import_
+
+    import_(directory, names=names)
+
+
+@cache.command(
+    name="serve",
+    help=(
+        "Serve the golden cache read-only over HTTP, for other machines "
+        "that list this one in 'peers' in their ~/.gimera. Runs in the "
+        "foreground."
+    ),
+)
+@click.option(
+    "--bind",
+    default="127.0.0.1",
+    show_default=True,
+    help="Address to listen on; 0.0.0.0 for the whole network.",
+)
+@click.option("--port", type=int, default=9419, show_default=True)
+def cache_serve(bind, port):
+    from .cacheserve import serve
+
+    serve(bind=bind, port=port)
+
+
+@cli.command(
+    name="cached",
+    help=(
+        "Run the cache daemon: one process that owns the golden cache and "
+        "answers fetch requests of all gimera runs on this machine over a "
+        "unix socket. Runs in the foreground; gimera uses it whenever it is "
+        "up and works without it as before."
+    ),
+)
+@click.option(
+    "--refresh-interval",
+    type=int,
+    default=600,
+    metavar="SECONDS",
+    help="How often recently used entries are fetched in the background.",
+)
+@click.option("--status", is_flag=True, help="Tell whether the daemon runs.")
+@click.option("--stop", is_flag=True, help="Stop a running daemon.")
+def cached(refresh_interval, status, stop):
+    from .cachedaemon import request
+    from .cachedaemon import serve
+    from .cachedaemon import socket_path
+
+    if status or stop:
+        answer = request("stop" if stop else "ping")
+        if not answer:
+            click.secho(f"gimera cached is not running ({socket_path()})", fg="yellow")
+            if status:
+                sys.exit(1)
+            return
+        verb = "stopped" if stop else "running"
+        click.secho(f"gimera cached {verb}, pid {answer['pid']}", fg="green")
+        return
+    serve(refresh_interval=refresh_interval)
+
+
 @cli.command(name="clean", help="Removes all git-dirty items")
 def clean():
     Cmd = GitCommands()
@@ -256,6 +435,15 @@ def _get_available_repos(ctx, param, incomplete):
     "--no-cache", is_flag=True,
     help="Disable the gimera cache for this run.",
 )
+@click.option(
+    "--lock", is_flag=True,
+    help="Write gimera.lock; once it exists, every apply keeps it up to date.",
+)
+@click.option(
+    "--frozen", is_flag=True,
+    help="Apply what gimera.lock says: repos that match it are skipped, the "
+         "others get the locked sha; fail if gimera.yml or the patches differ.",
+)
 def apply(
     repos,
     update,
@@ -279,6 +467,8 @@ def apply(
     clear_cache,
     clear_zip_cache,
     no_cache,
+    lock,
+    frozen,
 ):
     import shutil
 
@@ -310,6 +500,10 @@ def apply(
         )
     if no_cache:
         os.environ['GIMERA_NO_CACHE'] = "1"
+    if lock and frozen:
+        _raise_error("Please set either --lock or --frozen")
+    if lock:
+        os.environ['GIMERA_WRITE_LOCK'] = "1"
     ttype = None
     ttype = REPO_TYPE_INT if all_integrated else ttype
     ttype = REPO_TYPE_SUB if all_submodule else ttype
@@ -336,6 +530,7 @@ def apply(
             no_fetch=no_fetch,
             migrate_changes=migrate_changes,
             raise_exception=raise_exception,
+            frozen=frozen,
         )
     except Exception as ex:
         from . import snapshot
@@ -419,6 +614,38 @@ def check_all_submodules_initialized():
         sys.exit(-1)
 
 
+@cli.command(
+    name="verify",
+    help=(
+        "Check that the vendored directories are unchanged: against "
+        "gimera.lock, or else the pinned commit in the cache. Changes nothing; "
+        "exits non-zero if any repo is modified, missing or cannot be checked."
+    ),
+)
+@click.argument("repos", nargs=-1, default=None, shell_complete=_get_available_repos)
+@click.option("--json", "as_json", is_flag=True, help="One JSON object per repo.")
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Repos hashed at the same time.",
+)
+def verify(repos, as_json, jobs):
+    from . import verify as verify_module
+
+    config = Config()
+    results = verify_module.verify(
+        _get_main_repo(),
+        config,
+        config.get_repos(list(_expand_repos(repos))),
+        jobs=jobs,
+    )
+    if not verify_module.report(results, as_json=as_json):
+        sys.exit(1)
+
+
 def _check_all_submodules_initialized():
     root = Path(os.getcwd())
 
@@ -0,0 +1,153 @@
+"""Hedged fetches: do not wait minutes for a hanging protocol.
+
+Without it a fetch tries the configured URL, and only after that failed the
+same repo over the other protocol (ssh <-> https). A hanging ssh agent or a
+firewall that drops port 22 without answering costs the full timeout - per
+repo. With `hedge_delay` in ~/.gimera (or GIMERA_HEDGE_DELAY) a cheap
+`git ls-remote` over the configured protocol starts first; if it has not
+answered after that many seconds, the other protocol starts as well. The
+first to answer wins and the real fetch goes there.
+
+The winner is remembered per host in the cache index, and the next run
+probes it first. That still is a race, only a short one: a protocol that
+won yesterday and hangs today costs `hedge_delay` seconds, not the git
+timeout of every repo. Within one run each host is raced once; the other
+repos of that host go to the answer straight away.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+import click
+
+from .consts import gitcmd as git
+from .tools import get_url_type
+from .tools import reformat_url
+from .tools import verbose
+
+# Nobody waits for an answer longer than this; then the fetch goes the
+# serial way as without hedging.
+HEDGE_TIMEOUT = 120
+
+_OTHER = {"git": "http", "http": "git"}
+
+# host -> protocol that answered in this run, see pick_url
+_answered = {}
+_answered_lock = threading.Lock()
+
+
+def host_of(url):
+    from .userconfig import _normalize
+
+    return _normalize(url).split("/")[0]
+
+
+def candidates(url):
+    """`url` and the same repo over the other protocol, preferred first."""
+    from .cacheindex import preferred_protocol
+
+    try:
+        kind = get_url_type(url)
+    except NotImplementedError:
+        return [url]
+    if kind not in _OTHER:
+        return [url]
+    urls = [url, reformat_url(url, _OTHER[kind])]
+    if preferred_protocol(host_of(url)) == _OTHER[kind]:
+        urls.reverse()
+    return urls
+
+
+def _probe(url, branch):
+    return subprocess.Popen(
+        git + ["ls-remote", "--exit-code", url, f"refs/heads/{branch}"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+        # own process group: ssh below git goes down with it
+        start_new_session=True,
+    )
+
+
+def _kill(proc):
+    if proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        proc.kill()
+    proc.wait()
+
+
+def race(urls, branch, delay, timeout=HEDGE_TIMEOUT):
+    """The first of `urls` whose remote answers; the next one starts when
+    the ones before did not answer within `delay` seconds, or failed."""
+    pending = list(urls)
+    running = {}
+    started = time.time()
+    next_start = started
+    try:
+        while pending or running:
+            now = time.time()
+            if pending and (now >= next_start or not running):
+                url = pending.pop(0)
+                running[url] = _probe(url, branch)
+                next_start = now + delay
+            for url, proc in list(running.items()):
+                returncode = proc.poll()
+                if returncode is None:
+                    continue
+                del running[url]
+                if returncode == 0:
+                    verbose(f"{url} answered after {time.time() - started:.1f}s")
+                    return url
+            if now - started > timeout:
+                return None
+            time.sleep(0.05)
+        return None
+    finally:
+        for proc in running.values():
+            _kill(proc)
+
+
+def pick_url(url, branch, delay):
+    """The URL to fetch `branch` from: whichever protocol answers first.
+
+    The protocol remembered for the host starts first, the other one only
+    after `delay`. The answer holds for the host for the rest of the run, so
+    that fetching a hundred repos from one host does not probe a hundred
+    times; should a fetch fail, _fetch_branch goes on to the other protocol
+    anyway.
+    """
+    urls = candidates(url)
+    if len(urls) == 1:
+        return url
+    host = host_of(url)
+    with _answered_lock:
+        kind = _answered.get(host)
+    if kind:
+        return next(x for x in urls if get_url_type(x) == kind)
+    winner = race(urls, branch, delay)
+    if winner is None:
+        return url
+    with _answered_lock:
+        _answered[host] = get_url_type(winner)
+    if winner != url:
+        click.secho(f"{url} is slow or unreachable, using {winner}", fg="yellow")
+    return winner
+
+
+def remember(url):
+    """After a successful fetch from `url`: use its protocol next time."""
+    from .cacheindex import record_protocol
+
+    try:
+        kind = get_url_type(url)
+    except NotImplementedError:
+        return
+    if kind in _OTHER:
+        record_protocol(host_of(url), kind)
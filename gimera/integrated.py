@@ -18,6 +18,8 @@ from .tools import get_effective_state
 from .tools import get_nearest_repo
 from .tools import verbose
 from .cachedir import _get_cache_dir
+from .cachedir import prefetch
+from . import manifest
 
 
 def _keep_out_of_parent_repo(parent_repo, repo_yml, dest_path):
@@ -50,7 +52,10 @@ def _keep_out_of_parent_repo(parent_repo, repo_yml, dest_path):
     return parent_repo.check_ignore(path)
 
 
-def _dest_matches_commit(repo, parent_repo, dest_path, commit):
+def _dest_matches_commit(
+    repo, parent_repo, dest_path, commit, main_repo=None, keep_out=False,
+    patches=None,
+):
     """Is the vendored directory already at the given commit?
 
     The question cannot be answered from gimera.yml: the sha in there is the
@@ -63,6 +68,10 @@ def _dest_matches_commit(repo, parent_repo, dest_path, commit):
     commit and the tree of the vendored directory as committed in the parent
     repo are equal exactly when the files are identical.
 
+    A directory kept out of the parent repo has no tree there; it is compared
+    against the manifest written when it was extracted and patched, by a stat
+    pass. `patches` are the hashes of the patch files that apply now.
+
     Returns False whenever that cannot be established -- an unnecessary extract
     costs a little time, a skipped one costs correctness.
     """
@@ -71,6 +80,11 @@ def _dest_matches_commit(repo, parent_repo, dest_path, commit):
     except Exception:
         return False
 
+    if keep_out:
+        return bool(main_repo) and manifest.matches(
+            main_repo, dest_path, remote_tree, patches=patches
+        )
+
     try:
         relpath = dest_path.relative_to(parent_repo.path)
     except ValueError:
@@ -141,6 +155,10 @@ def _update_integrated_module(
                     "Please commit or purge before!"
                 )
 
+        # stat and blob of the extracted files, for the manifest of a
+        # directory the parent repo does not track
+        extracted = None
+        already_patched = False
         with wait_git_lock(cache_dir):
             commit = repo_yml.sha or repo_yml.branch if not update else repo_yml.branch
 
@@ -150,16 +168,36 @@ def _update_integrated_module(
                 # Fast path: use git archive + rsync instead of worktree for speed.
                 # Extract to a temp dir, then rsync --delete to dest. This is much
                 # faster than rmtree+extract because rsync only transfers the diff.
+                from .lockfile import patch_hashes
+
                 new_sha = repo.out(*(git + ["rev-parse", commit]))
                 has_patches = bool(repo_yml.patches)
-                up_to_date = _dest_matches_commit(repo, parent_repo, dest_path, commit)
-                if up_to_date and dest_path.exists() and not update and not has_patches:
+                up_to_date = _dest_matches_commit(
+                    repo,
+                    parent_repo,
+                    dest_path,
+                    commit,
+                    main_repo=main_repo,
+                    keep_out=keep_out,
+                    patches=patch_hashes(repo_yml) if keep_out else None,
+                )
+                # the manifest of a kept-out directory covers its patches:
+                # if it matches, they are applied already
+                already_patched = up_to_date and keep_out and has_patches
+                if (
+                    up_to_date
+                    and dest_path.exists()
+                    and not update
+                    and (not has_patches or already_patched)
+                ):
                     click.secho(
                         f"  {repo_yml.path} already at {new_sha[:10]} — skipping extract",
                         fg="green",
                     )
                 else:
+                    prefetch(cache_dir, commit, repo_yml.path)
                     click.secho(f"  extracting {repo_yml.path} ...", fg="cyan")
+                    manifest.forget(main_repo, dest_path)
                     import tempfile
                     tmpdir = Path(tempfile.mkdtemp())
                     try:
@@ -195,6 +233,8 @@ def _update_integrated_module(
                     finally:
                         # Clean up temp dir in background to avoid blocking
                         subprocess.Popen(["rm", "-rf", str(tmpdir)])
+                    if keep_out:
+                        extracted = manifest.snapshot(repo, new_sha, dest_path)
                     msgs = [f"Updating submodule {repo_yml.path}"]
                     if not keep_out:
                         click.secho(f"  committing {repo_yml.path} ...", fg="cyan")
@@ -202,6 +242,8 @@ def _update_integrated_module(
                             dest_path, "\n".join(msgs), force=True
                         )
             else:
+                prefetch(cache_dir, commit, repo_yml.path)
+                manifest.forget(main_repo, dest_path)
                 with repo.worktree(commit) as worktree:
                     new_sha = worktree.hex
                     msgs = [f"Updating submodule {repo_yml.path}"] + _apply_merges(
@@ -233,8 +275,10 @@ def _update_integrated_module(
                 pass
 
         # apply patches:
-        if os.getenv("GIMERA_DO_NOT_APPLY_PATCHES") != "1":
+        if os.getenv("GIMERA_DO_NOT_APPLY_PATCHES") != "1" and not already_patched:
             _apply_patches(repo_yml)
+        if extracted is not None:
+            _write_manifest(main_repo, repo_yml, dest_path, cache_dir, new_sha, extracted)
         msg = f"updated {REPO_TYPE_INT} submodule: {repo_yml.path}"
         repo_yml.sha = new_sha
         if repo_yml.config.config_file in parent_repo.all_dirty_files_absolute:
@@ -274,6 +318,18 @@ def _update_integrated_module(
             )
 
 
+def _write_manifest(main_repo, repo_yml, dest_path, cache_dir, sha, extracted):
+    from .lockfile import patch_hashes
+
+    if os.getenv("GIMERA_DO_NOT_APPLY_PATCHES") == "1" and repo_yml.patches:
+        # not what a later apply with patches would produce
+        return
+    tree = Repo(cache_dir).out(*(git + ["rev-parse", f"{sha}^{{tree}}"])).strip()
+    manifest.write(
+        main_repo, dest_path, sha, tree, extracted, patches=patch_hashes(repo_yml)
+    )
+
+
 def _apply_merges(repo, repo_yml):
     if not repo_yml.merges:
         return []
@@ -0,0 +1,404 @@
+"""gimera.lock: what an apply resolved, so that CI can skip resolving it again.
+
+Every apply resolves branches, merges and patches anew, and even without -u
+it looks into the cache to check that a pinned sha belongs to its branch.
+On a config that did not change, all of that reproduces what is on disk
+already. The lock file, next to gimera.yml, records per repo what came out:
+
+    version: 1
+    repos:
+      addons/web:
+        config: <sha256 of the repo's entry in gimera.yml>
+        sha: <the commit that was applied>
+        upstream_tree: <tree of that commit>
+        patches:
+          patches/web/0001-fix.patch: <sha256 of the file>
+        tree: <tree of the vendored directory on disk>
+
+`gimera apply --frozen` compares the entry in gimera.yml and the patch
+files against the lock; a difference there fails the apply before it
+changed anything. A repo whose directory on disk has the locked tree is left
+alone - no fetch, no patching, not even a cache lookup. The others - on a
+fresh CI checkout the submodules and the directories that are not committed
+- are applied at the locked sha, and gimera.yml stays as it is.
+
+The file is written by `gimera apply --lock` and kept up to date by every
+apply once it exists; entries whose config, sha and patches did not change
+are kept as they are. It is committed like gimera.yml, unless it is
+gitignored.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import click
+import yaml
+
+from . import manifest
+from .consts import REPO_TYPE_SUB
+from .consts import gitcmd as git
+from .repo import Repo
+from .tools import _raise_error
+from .tools import get_nearest_repo
+from .tools import is_forced
+from .tools import verbose
+
+LOCKFILE = "gimera.lock"
+VERSION = 1
+
+def lock_path(config):
+    return config.config_file.parent / LOCKFILE
+
+
+def wanted(config):
+    return lock_path(config).exists() or os.getenv("GIMERA_WRITE_LOCK") == "1"
+
+
+def load(config):
+    """path -> entry from gimera.lock; None if there is none."""
+    path = lock_path(config)
+    if not path.exists():
+        return None
+    try:
+        data = yaml.safe_load(path.read_text()) or {}
+    except yaml.YAMLError as ex:
+        _raise_error(f"{path} is not valid YAML: {ex}")
+        return None
+    if data.get("version") != VERSION:
+        _raise_error(f"{path}: unknown lock file version {data.get('version')}")
+        return None
+    return data.get("repos") or {}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint(repo_yml):
+    """Hash of what in gimera.yml decides what gets applied.
+
+    Without the sha: apply writes the resolved one back, and a repo that
+    follows its branch has none. That one is compared on its own.
+    """
+    values = repo_yml.as_dict()
+    values["type"] = repo_yml.type
+    values["ignored_patchfiles"] = repo_yml.ignored_patchfiles
+    return _sha256(json.dumps(values, sort_keys=True, default=str).encode())
+
+
+def patch_hashes(repo_yml):
+    root = repo_yml.config.config_file.parent
+    hashes = {}
+    for patchdir in repo_yml.patches:
+        if not patchdir.path_absolute.exists():
+            continue
+        for file in sorted(patchdir.path_absolute.rglob("*.patch")):
+            hashes[os.path.relpath(file, root)] = _sha256(file.read_bytes())
+    return hashes
+
+
+def _git(path, *args, env=None, input=None):
+    return subprocess.run(
+        git + list(args),
+        cwd=path,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+        env=env,
+        input=input,
+    ).stdout.strip()
+
+
+def _submodule_tree(dest):
+    if not (dest / ".git").exists():
+        return None
+    # a modified checkout is not what the lock describes
+    if _git(dest, "status", "--porcelain", "--untracked-files=no"):
+        return None
+    return _git(dest, "rev-parse", "HEAD^{tree}")
+
+
+def _git_path(parent, name):
+    return Path(
+        _git(parent, "rev-parse", "--path-format=absolute", "--git-path", name)
+    )
+
+
+@contextmanager
+def _scratch_git(parent):
+    """Env for git commands on `parent` that leave its index and objects alone.
+
+    A temporary index, and a temporary object directory that borrows the
+    parent's objects: blobs and trees git writes while hashing go there.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        objects = Path(tmpdir) / "objects"
+        objects.mkdir()
+        yield dict(
+            os.environ,
+            GIT_INDEX_FILE=str(Path(tmpdir) / "index"),
+            GIT_OBJECT_DIRECTORY=str(objects),
+            GIT_ALTERNATE_OBJECT_DIRECTORIES=str(_git_path(parent, "objects")),
+        ), _git_path(parent, "index")
+
+
+def _directory_tree(parent, relpath):
+    """Tree hash of a tracked directory as it is on disk.
+
+    The parent's index is copied first: git then only hashes the files whose
+    stat data changed, not all of them.
+    """
+    with _scratch_git(parent) as (env, index):
+        if index.exists():
+            # copy2: with the index's mtime git keeps rehashing the files
+            # that are as new as the index, see racy-git
+            shutil.copy2(index, env["GIT_INDEX_FILE"])
+        _git(parent, "add", "-A", "--", str(relpath), env=env)
+        return _git(parent, "write-tree", f"--prefix={relpath}/", env=env)
+
+
+def _untracked_tree(main_repo, parent, dest):
+    """Tree hash of a directory the parent does not track.
+
+    The index knows nothing about it, so the blobs come from its manifest,
+    where the stat data vouches for them, and are hashed here otherwise.
+    """
+    algorithm = _git(parent, "rev-parse", "--show-object-format")
+    blobs = manifest.current_blobs(main_repo, dest, algorithm)
+    with _scratch_git(parent) as (env, index):
+        _git(
+            parent,
+            *["update-index", "-z", "--index-info"],
+            env=env,
+            input="".join(
+                f"{mode} {blob}\t{relpath}\0"
+                for relpath, (mode, blob) in sorted(blobs.items())
+            ),
+        )
+        return _git(parent, "write-tree", "--missing-ok", env=env)
+
+
+def vendored_tree(main_repo, repo_yml, working_dir):
+    """The tree of what is at the repo's path now; None if there is nothing."""
+    from .integrated import _keep_out_of_parent_repo
+
+    dest = Path(working_dir) / repo_yml.path
+    if not dest.exists():
+        return None
+    try:
+        if repo_yml.type == REPO_TYPE_SUB:
+            return _submodule_tree(dest)
+        parent = Repo(get_nearest_repo(main_repo.path, dest))
+        if _keep_out_of_parent_repo(parent, repo_yml, dest):
+            return _untracked_tree(main_repo, parent.path, dest)
+        return _directory_tree(parent.path, dest.relative_to(parent.path))
+    except subprocess.CalledProcessError as ex:
+        verbose(f"No tree for {repo_yml.path}: {(ex.stderr or '').strip()}")
+        return None
+
+
+def _upstream_tree(main_repo, repo_yml, working_dir):
+    """Tree of the pinned sha, if it is at hand; None otherwise.
+
+    Only looks: the cache entry is read where it is, not through
+    _get_cache_dir - that one records the use, may ask the daemon, fetches a
+    missing sha and clones what is not cached.
+    """
+    from .cachedir import _make_cache_path
+
+    if not repo_yml.sha:
+        return None
+    if repo_yml.type == REPO_TYPE_SUB:
+        where = Path(working_dir) / repo_yml.path
+    else:
+        where = _make_cache_path(repo_yml.url)
+    if not where.exists():
+        return None
+    try:
+        return _git(where, "rev-parse", "--verify", "-q", f"{repo_yml.sha}^{{tree}}")
+    except subprocess.CalledProcessError:
+        return None
+
+
+def entry(main_repo, repo_yml, working_dir):
+    return {
+        "config": fingerprint(repo_yml),
+        "sha": repo_yml.sha,
+        "upstream_tree": _upstream_tree(main_repo, repo_yml, working_dir),
+        "patches": patch_hashes(repo_yml),
+        "tree": vendored_tree(main_repo, repo_yml, working_dir),
+    }
+
+
+def write(main_repo, config, repos, working_dir):
+    """Record the applied `repos`; True if gimera.lock changed.
+
+    An entry whose config, sha and patches are as locked is kept: applying
+    them again put the locked tree there, so neither the cache nor the
+    directory is looked at.
+    """
+    path = lock_path(config)
+    before = path.read_text() if path.exists() else None
+    locked = dict(load(config) or {})
+    for repo_yml in repos:
+        previous = locked.get(str(repo_yml.path))
+        if (
+            previous
+            and previous.get("tree")
+            and previous.get("sha") == repo_yml.sha
+            and not config_drift(repo_yml, previous)
+        ):
+            continue
+        locked[str(repo_yml.path)] = entry(main_repo, repo_yml, working_dir)
+    configured = {str(x.path) for x in config.repos}
+    locked = {k: v for k, v in locked.items() if k in configured}
+    text = yaml.dump({"version": VERSION, "repos": locked}, default_flow_style=False)
+    if text == before:
+        return False
+    path.write_text(text)
+    return True
+
+
+def commit(config):
+    """Commit gimera.lock alone, as gimera does with gimera.yml."""
+    path = lock_path(config)
+    repo = Repo(config.config_file.parent)
+    if repo.check_ignore(path):
+        return
+    repo.X(*(git + ["add", path]))
+    staged = subprocess.run(
+        git + ["diff", "--cached", "--quiet", "--", str(path)], cwd=repo.path
+    ).returncode
+    if staged:
+        repo.X(
+            *(
+                git
+                + ["commit", "--no-verify", "-m", f"gimera: update {LOCKFILE}"]
+                + ["--", path]
+            )
+        )
+
+
+def config_drift(repo_yml, locked):
+    """Why the lock entry no longer describes `repo_yml`, files on disk aside."""
+    if not locked:
+        return [f"not in {LOCKFILE}"]
+    reasons = []
+    if locked.get("config") != fingerprint(repo_yml):
+        reasons.append("its entry in gimera.yml changed")
+    if repo_yml.sha and repo_yml.sha != locked.get("sha"):
+        reasons.append(f"gimera.yml pins {repo_yml.sha[:10]}")
+    if locked.get("patches", {}) != patch_hashes(repo_yml):
+        reasons.append("patch files changed")
+    return reasons
+
+
+def drift(main_repo, repo_yml, working_dir, locked):
+    """Why `repo_yml` does not match its lock entry; empty if it does."""
+    reasons = config_drift(repo_yml, locked)
+    if reasons:
+        return reasons
+    tree = vendored_tree(main_repo, repo_yml, working_dir)
+    if not locked.get("tree") or tree != locked["tree"]:
+        reasons.append(
+            "not on disk" if tree is None else "the files on disk differ"
+        )
+    return reasons
+
+
+def local_changes(main_repo, repo_yml, working_dir):
+    """Files edited at the repo's path since gimera put them there.
+
+    Tracked directories and submodules by git status, kept-out directories
+    by the manifest of the last extract - without one there is nothing to
+    tell an edit from an older version by.
+    """
+    from .integrated import _keep_out_of_parent_repo
+
+    dest = Path(working_dir) / repo_yml.path
+    if not dest.exists():
+        return []
+    if repo_yml.type == REPO_TYPE_SUB:
+        return [str(x) for x in Repo(dest).all_dirty_files]
+    parent = Repo(get_nearest_repo(main_repo.path, dest))
+    if _keep_out_of_parent_repo(parent, repo_yml, dest):
+        recorded = manifest.load(main_repo, dest)
+        return manifest.changed_files(recorded, dest) if recorded else []
+    return [
+        str(Path(x).relative_to(dest))
+        for x in parent.all_dirty_files_absolute
+        if str(x).startswith(f"{dest}/")
+    ]
+
+
+def verify(main_repo, config, repos, working_dir):
+    """--frozen: path -> locked sha of the repos that need to be applied.
+
+    Fails if gimera.yml or the patch files are not what gimera.lock says;
+    repos whose directory has the locked tree are left out. Fails as well
+    if applying would overwrite local edits: --frozen makes no patches of
+    them, so they would be lost.
+    """
+    locked = load(config)
+    if locked is None:
+        _raise_error(
+            f"--frozen needs {lock_path(config)}; write it with "
+            "`gimera apply --lock`."
+        )
+        return {}
+    drifted = {}
+    to_apply = {}
+    for repo_yml in repos:
+        entry = locked.get(str(repo_yml.path))
+        reasons = config_drift(repo_yml, entry)
+        if reasons:
+            drifted[repo_yml.path] = reasons
+        elif drift(main_repo, repo_yml, working_dir, entry):
+            to_apply[str(repo_yml.path)] = entry["sha"]
+        else:
+            verbose(f"{repo_yml.path} matches {LOCKFILE}")
+    if drifted:
+        _raise_error(
+            f"Not what {LOCKFILE} says:\n"
+            + "\n".join(
+                f"  {path}: {', '.join(reasons)}" for path, reasons in drifted.items()
+            )
+            + f"\nApply without --frozen to update {LOCKFILE}."
+        )
+        return {}
+    edited = {}
+    if not is_forced():
+        for repo_yml in repos:
+            if str(repo_yml.path) in to_apply:
+                changed = local_changes(main_repo, repo_yml, working_dir)
+                if changed:
+                    edited[repo_yml.path] = changed
+    if edited:
+        _raise_error(
+            "--frozen would overwrite local changes:\n"
+            + "\n".join(
+                f"  {path}: {', '.join(changed[:5])}"
+                + (f" and {len(changed) - 5} more" if len(changed) > 5 else "")
+                for path, changed in edited.items()
+            )
+            + "\nApply without --frozen to make patches of them, "
+            "or set GIMERA_FORCE=1 to drop them."
+        )
+        return {}
+    if to_apply:
+        click.secho(
+            f"Applying {len(to_apply)} repo(s) at the sha in {LOCKFILE}: "
+            + ", ".join(to_apply),
+            fg="cyan",
+        )
+    else:
+        click.secho(
+            f"{len(repos)} repo(s) match {LOCKFILE} - nothing to do.", fg="green"
+        )
+    return to_apply
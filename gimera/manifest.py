@@ -0,0 +1,246 @@
+"""What gimera put into a directory that the parent repo does not track.
+
+A gitignored or `dont_commit` directory - odoo/enterprise on odoo.sh - is
+invisible to the parent repo: no tree in HEAD to compare the pin against, no
+`git status` that reports local edits. So every apply extracted it anew and
+rsynced it with --checksum, and make_patches had to rebuild the upstream
+state in a temp repo just to learn that nothing changed.
+
+After the extract (and the patches) gimera writes a manifest instead, to
+.gimera/manifests/<path>.json in the main repo:
+
+    {"version": 1, "commit": ..., "tree": <tree of the commit>,
+     "patches": {<patch file>: <sha256>}, "written_ns": ...,
+     "files": {"models/x.py": [size, mtime_ns, inode, blob], ...}}
+
+The blob is git's hash of the content, taken from the upstream tree where
+the file came from there unchanged. Later, a stat pass tells whether the
+directory is still that: files whose size, mtime and inode are as recorded
+are not read at all. Only the others are hashed - like git's index, a file
+modified in the same instant the manifest was written counts as changed
+until hashed. Byte-compiled Python files do not count.
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import stat
+import subprocess
+import time
+from pathlib import Path
+
+from .consts import gitcmd as git
+from .tools import safe_relative_to
+from .tools import verbose
+
+VERSION = 1
+
+_NOT_VENDORED = ["*.pyc", "*__pycache__*"]
+
+
+def manifest_path(main_repo, dest_path):
+    """Where the manifest of `dest_path` goes; None outside the main repo."""
+    relpath = safe_relative_to(Path(dest_path), Path(main_repo.path))
+    if not relpath:
+        return None
+    return Path(main_repo.path) / ".gimera" / "manifests" / f"{relpath}.json"
+
+
+def load(main_repo, dest_path):
+    path = manifest_path(main_repo, dest_path)
+    if not path:
+        return None
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != VERSION:
+        return None
+    return data
+
+
+def forget(main_repo, dest_path):
+    """Drop the manifest; done before the directory is rewritten."""
+    path = manifest_path(main_repo, dest_path)
+    if path and path.exists():
+        path.unlink()
+
+
+def _files(dest_path):
+    """Relative path -> lstat of every file below `dest_path`."""
+    dest_path = Path(dest_path)
+    result = {}
+    for root, dirs, files in os.walk(dest_path):
+        dirs[:] = [x for x in dirs if x != ".git"]
+        for name in files:
+            path = Path(root) / name
+            relpath = path.relative_to(dest_path).as_posix()
+            if any(fnmatch.fnmatch(relpath, x) for x in _NOT_VENDORED):
+                continue
+            result[relpath] = path.lstat()
+        # symlinks to directories are not walked into, but are files to git
+        for name in dirs:
+            path = Path(root) / name
+            if path.is_symlink():
+                result[path.relative_to(dest_path).as_posix()] = path.lstat()
+        dirs[:] = [x for x in dirs if not (Path(root) / x).is_symlink()]
+    return result
+
+
+def _stat(st):
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _blob_hash(path, algorithm="sha1"):
+    """git's object id of the file's content, as `git hash-object` has it."""
+    path = Path(path)
+    data = os.readlink(path).encode() if path.is_symlink() else path.read_bytes()
+    digest = hashlib.new(algorithm)
+    digest.update(b"blob %d\0" % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _algorithm(blob):
+    return "sha256" if len(blob) == 64 else "sha1"
+
+
+def upstream_blobs(repo, commit):
+    """path -> blob of every file in `commit`."""
+    out = subprocess.run(
+        git + ["ls-tree", "-r", "-z", "--full-tree", commit],
+        cwd=repo.path,
+        capture_output=True,
+        check=True,
+    ).stdout.decode("utf8", errors="surrogateescape")
+    blobs = {}
+    for line in filter(None, out.split("\0")):
+        meta, path = line.split("\t", 1)
+        mode, kind, blob = meta.split()
+        if kind == "blob":
+            blobs[path] = blob
+    return blobs
+
+
+def snapshot(repo, commit, dest_path):
+    """Stat and blob of every file right after `commit` was extracted.
+
+    The content is known without reading it: it is the upstream blob.
+    """
+    blobs = upstream_blobs(repo, commit)
+    algorithm = _algorithm(next(iter(blobs.values()), ""))
+    return {
+        relpath: _stat(st)
+        + [blobs.get(relpath) or _blob_hash(Path(dest_path) / relpath, algorithm)]
+        for relpath, st in _files(dest_path).items()
+    }
+
+
+def write(main_repo, dest_path, commit, tree, extracted, patches=None):
+    """Record `dest_path` as it is now.
+
+    `extracted` is the `snapshot` taken after the extract; files that
+    changed since - patched ones - are hashed again.
+    """
+    path = manifest_path(main_repo, dest_path)
+    if not path:
+        return
+    algorithm = _algorithm(next((x[3] for x in extracted.values()), ""))
+    files = {}
+    for relpath, st in _files(dest_path).items():
+        known = extracted.get(relpath)
+        if known and known[:3] == _stat(st):
+            files[relpath] = known
+        else:
+            blob = _blob_hash(Path(dest_path) / relpath, algorithm)
+            files[relpath] = _stat(st) + [blob]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}")
+    tmp.write_text(
+        json.dumps(
+            {
+                "version": VERSION,
+                "commit": commit,
+                "tree": tree,
+                "patches": patches or {},
+                "written_ns": time.time_ns(),
+                "files": files,
+            }
+        )
+    )
+    tmp.replace(path)
+    verbose(f"Wrote manifest of {len(files)} files for {dest_path}")
+
+
+# mtime granularity of the coarsest file systems around
+_RACY_NS = 2 * 10**9
+
+
+def _vouched(known, st, racy_from):
+    """Does the manifest's entry stand for the file without reading it?"""
+    size, mtime_ns, inode, blob = known
+    return [size, mtime_ns, inode] == _stat(st) and mtime_ns < racy_from
+
+
+def changed_files(manifest, dest_path):
+    """Relative paths that differ from the manifest: edited, added, removed."""
+    recorded = manifest["files"]
+    racy_from = manifest["written_ns"] - _RACY_NS
+    changed = []
+    on_disk = _files(dest_path)
+    for relpath, st in on_disk.items():
+        known = recorded.get(relpath)
+        if not known:
+            changed.append(relpath)
+            continue
+        if known[0] != st.st_size:
+            changed.append(relpath)
+            continue
+        if _vouched(known, st, racy_from):
+            continue
+        # touched, copied back, or written in the same instant: read it
+        if _blob_hash(Path(dest_path) / relpath, _algorithm(known[3])) != known[3]:
+            changed.append(relpath)
+    changed += [x for x in recorded if x not in on_disk]
+    return sorted(changed)
+
+
+def _mode(st):
+    if stat.S_ISLNK(st.st_mode):
+        return "120000"
+    return "100755" if st.st_mode & 0o111 else "100644"
+
+
+def current_blobs(main_repo, dest_path, algorithm="sha1"):
+    """Relative path -> (mode, blob) of every file in `dest_path` now.
+
+    Nothing is written to an object store. Files the manifest vouches for
+    are not read, the others are hashed here.
+    """
+    manifest = load(main_repo, dest_path) or {"files": {}, "written_ns": 0}
+    recorded = manifest["files"]
+    racy_from = manifest["written_ns"] - _RACY_NS
+    result = {}
+    for relpath, st in _files(dest_path).items():
+        known = recorded.get(relpath)
+        if known and _vouched(known, st, racy_from):
+            blob = known[3]
+        else:
+            blob = _blob_hash(Path(dest_path) / relpath, algorithm)
+        result[relpath] = (_mode(st), blob)
+    return result
+
+
+def matches(main_repo, dest_path, tree, patches=None):
+    """Is `dest_path` exactly what gimera put there for `tree`?
+
+    False if there is no manifest, it is for another tree or other patches,
+    or a file differs.
+    """
+    manifest = load(main_repo, dest_path)
+    if not manifest or manifest.get("tree") != tree:
+        return False
+    if manifest.get("patches", {}) != (patches or {}):
+        return False
+    return not changed_files(manifest, dest_path)
@@ -1,5 +1,6 @@
 import re
 import os
+import fnmatch
 from inquirer import errors
 import shutil
 import sys
@@ -9,6 +10,7 @@ from .repo import Repo
 from datetime import datetime
 from contextlib import contextmanager
 from .consts import gitcmd as git
+from . import manifest
 from .tools import confirm
 from .tools import temppath
 from .tools import path1inpath2
@@ -43,9 +45,20 @@ def make_patches(working_dir, main_repo, repo_yml, common_vars):
 
     # Fast path: if the directory is git-ignored, check for local modifications
     # before doing the expensive temp-repo dance. If no files changed on disk
-    # compared to what's there, skip patch creation entirely.
+    # compared to what's there, skip patch creation entirely. With a manifest
+    # from the last extract that is a stat pass, so it runs non-interactively
+    # too; without one the check is left to the temp repo.
     subrepo_path = main_repo.path / repo_yml.path
-    if main_repo.check_ignore(repo_yml.path) and subrepo_path.exists():
+    recorded = manifest.load(main_repo, subrepo_path) if subrepo_path.exists() else None
+    if recorded:
+        # extracted by gimera into a directory the main repo does not track:
+        # a stat pass against the manifest tells whether anything changed
+        changed = manifest.changed_files(recorded, subrepo_path)
+        if not changed:
+            verbose(f"{repo_yml.path} is as gimera put it there - no patch")
+            return
+        verbose(f"{repo_yml.path}: {len(changed)} file(s) changed locally")
+    elif main_repo.check_ignore(repo_yml.path) and subrepo_path.exists():
         # For ignored dirs we cannot rely on git status. Instead we just skip
         # make_patches when running non-interactively, because the expensive
         # _if_ignored_move_to_separate_dir would create a full temp repo just
@@ -53,6 +66,12 @@ def make_patches(working_dir, main_repo, repo_yml, common_vars):
         if os.getenv("GIMERA_NON_INTERACTIVE") == "1":
             return
 
+    if _is_untracked_dir(main_repo, repo_yml):
+        diffed = _diff_against_upstream(main_repo, repo_yml)
+        if diffed:
+            _make_patch_from_diff(main_repo, repo_yml, *diffed)
+            return
+
     with _if_ignored_move_to_separate_dir(
         working_dir, main_repo, repo_yml, common_vars
     ) as (main_repo, is_temp_path):
@@ -67,32 +86,56 @@ def make_patches(working_dir, main_repo, repo_yml, common_vars):
             if not _start_question(repo_yml, changed_files, main_repo=main_repo):
                 return
 
-            with _temporarily_add_untracked_files(main_repo, untracked_files):
-                subdir_path = Path(main_repo.path) / repo_yml.path
-                with main_repo.temporary_unignore(subdir_path):
-                    patch_content = _technically_make_patch(main_repo, subdir_path)
-
-                    if not repo_yml.patches:
-                        if os.getenv("GIMERA_FORCE") == "1":
-                            return
-                        if os.getenv("GIMERA_NON_INTERACTIVE") != "1" and not is_temp_path:
-                            repo_yml = _ask_user_to_create_path_directory(repo_yml)
-                        if not repo_yml.patches:
-                            _raise_error(
-                                "Please define at least one directory, "
-                                f"where patches are stored for {repo_yml.path}"
-                            )
-
-                with _prepare_patchdir(repo_yml) as (patch_dir, patch_filename):
-                    _write_patch_content(
-                        main_repo,
-                        repo_yml,
-                        subrepo,
-                        subrepo_path,
-                        patch_dir,
-                        patch_filename,
-                        patch_content,
-                    )
+            subdir_path = Path(main_repo.path) / repo_yml.path
+            with main_repo.temporary_unignore(subdir_path):
+                patch_content = _technically_make_patch(main_repo, subdir_path)
+                repo_yml = _with_patch_dir(repo_yml, ask=not is_temp_path)
+                if not repo_yml:
+                    return
+
+            with _prepare_patchdir(repo_yml) as (patch_dir, patch_filename):
+                _write_patch_content(
+                    main_repo,
+                    repo_yml,
+                    subrepo,
+                    subrepo_path,
+                    patch_dir,
+                    patch_filename,
+                    patch_content,
+                )
+
+
+def _make_patch_from_diff(main_repo, repo_yml, changed_files, patch_content):
+    if not changed_files:
+        return
+    if not _start_question(repo_yml, changed_files, main_repo=main_repo):
+        return
+    repo_yml = _with_patch_dir(repo_yml)
+    if not repo_yml:
+        return
+    with _prepare_patchdir(repo_yml) as (patch_dir, patch_filename):
+        # left uncommitted, like the patches the temp repo handed back
+        patch_dir.path_absolute.mkdir(parents=True, exist_ok=True)
+        (patch_dir.path_absolute / patch_filename).write_text(patch_content)
+
+
+def _with_patch_dir(repo_yml, ask=True):
+    """`repo_yml` with a patch directory to write to.
+
+    None if there is none and GIMERA_FORCE says to drop the changes.
+    """
+    if repo_yml.patches:
+        return repo_yml
+    if os.getenv("GIMERA_FORCE") == "1":
+        return None
+    if ask and os.getenv("GIMERA_NON_INTERACTIVE") != "1":
+        repo_yml = _ask_user_to_create_path_directory(repo_yml)
+    if not repo_yml.patches:
+        _raise_error(
+            "Please define at least one directory, "
+            f"where patches are stored for {repo_yml.path}"
+        )
+    return repo_yml
 
 
 def _ask_user_to_create_path_directory(repo_yml):
@@ -143,6 +186,140 @@ def _temporarily_move_gimera(repo_yml, to_path):
         repo_yml._sha = remember_sha
 
 
+def _is_untracked_dir(main_repo, repo_yml):
+    """Does the main repo offer no diff base for the vendored directory?"""
+    if not (main_repo.path / repo_yml.path).exists():
+        return False
+    if main_repo.check_ignore(repo_yml.path):
+        return True
+    # untracked (never committed to the main repo) — same problem as
+    # ignored: the main repo offers no diff base, `git add` would record
+    # every file as new instead of the delta against upstream
+    # allow_error: a failing ls-files just means "treat as untracked",
+    # which routes through the (always correct) temp-repo path
+    tracked = main_repo.out(
+        *(git + ["ls-files", "--", str(repo_yml.path)]), allow_error=True
+    ).strip()
+    return not tracked
+
+
+def _patchfiles_in_order(repo_yml):
+    """The patch files as _apply_patches applies them."""
+    files = {}
+    for patchdir in repo_yml.patches:
+        if not patchdir.path_absolute.exists():
+            continue
+        for file in sorted(patchdir.path_absolute.rglob("*.patch")):
+            if not repo_yml.ignore_patchfile(file):
+                files.setdefault(file, patchdir)
+    return sorted(files.items(), key=lambda x: x[0].name)
+
+
+def _ignore_patterns_below(gitignore, relpath):
+    """The patterns of the main repo's .gitignore as seen from `relpath`.
+
+    The diff runs with the module as work tree. Patterns that match at any
+    depth stay as they are; anchored ones are kept only if they point below
+    `relpath`, and are then anchored there.
+    """
+    prefix = Path(relpath).parts
+    result = []
+    for line in gitignore.splitlines():
+        pattern = line.strip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        negate = "!" if pattern.startswith("!") else ""
+        pattern = pattern[len(negate):]
+        parts = pattern.strip("/").split("/")
+        if len(parts) == 1 and not pattern.startswith("/") or parts[0] == "**":
+            result.append(negate + pattern)
+            continue
+        head, rest = parts[: len(prefix)], parts[len(prefix):]
+        # the module itself or a dir above it: that is why it is untracked
+        if not rest or "**" in head:
+            continue
+        if all(fnmatch.fnmatchcase(x, y) for x, y in zip(prefix, head)):
+            trailing = "/" if pattern.endswith("/") else ""
+            result.append(f"{negate}/{'/'.join(rest)}{trailing}")
+    return result
+
+
+def _diff_against_upstream(main_repo, repo_yml):
+    """Local changes of an untracked vendored directory, without a temp repo.
+
+    The base is the pinned commit in the golden cache with the patch files
+    applied - in a temporary index, by `git apply --cached`. The directory
+    itself is then added to that index as GIT_WORK_TREE, and the diff is
+    taken between the two. New objects go to a temporary object directory
+    that borrows from the cache, so the cache is not written to.
+
+    Returns (changed files, patch), or None if this cannot stand in for the
+    temp repo: no pin, merges, a patch being edited, patches that live in
+    the module or are applied from elsewhere, or a patch file that only
+    `patch` with its fuzz and strip guessing gets to apply.
+    """
+    from .cachedir import _get_cache_dir
+
+    if not repo_yml.sha or repo_yml.merges or repo_yml.edit_patchfile:
+        return None
+    if any(
+        x.chdir or path1inpath2(x._path, Path(repo_yml.path)) for x in repo_yml.patches
+    ):
+        return None
+
+    dest_path = main_repo.path / repo_yml.path
+    with _get_cache_dir(main_repo, repo_yml) as cache_dir, temppath() as tmp:
+        exclude = tmp / "exclude"
+        gitignore = main_repo.path / ".gitignore"
+        exclude.write_text(
+            "\n".join(
+                ["*.pyc", "__pycache__/"]
+                + _ignore_patterns_below(
+                    gitignore.read_text() if gitignore.exists() else "",
+                    repo_yml.path,
+                )
+            )
+            + "\n"
+        )
+        (tmp / "objects").mkdir()
+        env = dict(
+            os.environ,
+            GIT_DIR=str(cache_dir),
+            GIT_WORK_TREE=str(dest_path),
+            GIT_INDEX_FILE=str(tmp / "index"),
+            GIT_OBJECT_DIRECTORY=str(tmp / "objects"),
+            GIT_ALTERNATE_OBJECT_DIRECTORIES=str(Path(cache_dir) / "objects"),
+        )
+
+        def _git(*args):
+            return subprocess.run(
+                git + ["-c", "core.bare=false", "-c", "core.quotepath=false"]
+                + list(args),
+                cwd=dest_path,
+                env=env,
+                capture_output=True,
+                encoding="utf8",
+                check=True,
+            ).stdout
+
+        try:
+            _git("read-tree", f"{repo_yml.sha}^{{tree}}")
+            for file, _patchdir in _patchfiles_in_order(repo_yml):
+                _git("apply", "--cached", str(file))
+            base = _git("write-tree").strip()
+            _git("-c", f"core.excludesFile={exclude}", "add", "-A", ".")
+            changed = _git("diff", "--cached", "--name-only", "-z", base)
+            patch_content = _git("diff", "--cached", "--binary", base)
+        except subprocess.CalledProcessError as ex:
+            verbose(
+                f"No direct diff for {repo_yml.path}, using a temp repo: "
+                f"{(ex.stderr or '').strip()}"
+            )
+            return None
+    changed_files = [Path(repo_yml.path) / x for x in changed.split("\0") if x]
+    return changed_files, patch_content
+
+
 @contextmanager
 def _if_ignored_move_to_separate_dir(working_dir, main_repo, repo_yml, common_vars):
     """
@@ -151,26 +328,13 @@ def _if_ignored_move_to_separate_dir(working_dir, main_repo, repo_yml, common_va
 
     also transfer the parent .gitignore file, so that e.g. pyc files are 
     ignored
+
+    Only where _diff_against_upstream cannot do without the temp repo.
     """
     from .cachedir import _get_cache_dir
     from .integrated import _update_integrated_module
 
-    def _needs_separate_dir():
-        if not (main_repo.path / repo_yml.path).exists():
-            return False
-        if main_repo.check_ignore(repo_yml.path):
-            return True
-        # untracked (never committed to the main repo) — same problem as
-        # ignored: the main repo offers no diff base, `git add` would record
-        # every file as new instead of the delta against upstream
-        # allow_error: a failing ls-files just means "treat as untracked",
-        # which routes through the (always correct) temp-repo path
-        tracked = main_repo.out(
-            *(git + ["ls-files", "--", str(repo_yml.path)]), allow_error=True
-        ).strip()
-        return not tracked
-
-    if _needs_separate_dir():
+    if _is_untracked_dir(main_repo, repo_yml):
         with temppath() as path:
             subprocess.check_call(
                 (git + ["init", "--initial-branch=main", "."]), cwd=path
@@ -410,24 +574,6 @@ def _write_patch_content(
         )
 
 
-@contextmanager
-def _temporarily_add_untracked_files(repo, untracked_files):
-    for untracked_file in untracked_files:
-        # add with empty blob to index, appears like that then:
-        #
-        # Changes not staged for commit:
-        # (use "git add <file>..." to update what will be committed)
-        # (use "git restore <file>..." to discard changes in working directory)
-        #         modified:   roles2/sub1/file2.txt
-        #         new file:   roles2/sub1/file3.txt
-        repo.X(*(git + ["add", "-f", "-N", untracked_file]))
-
-    yield
-
-    for to_reset in untracked_files:
-        repo.X(*(git + ["reset", to_reset]))
-
-
 @contextmanager
 def _prepare(main_repo, repo_yml):
     subrepo_path = main_repo.path / repo_yml.path
@@ -492,18 +638,43 @@ def _clone_directory_and_add_patch_file(
 
 
 def _technically_make_patch(repo, path):
-    repo.X(*(git + ["add", path]))
-    repo.X(*(git + ["commit", "-m", "for patch", "--no-verify"]))
-
-    # core.quotepath=false → non-ASCII filenames stay as readable UTF-8
-    # instead of octal-escaped `"a/\303\274.txt"`, so the round-trip apply
-    # (and human review) is cleaner.
-    patch_content = Repo(path).out(
-        *(git + ["-c", "core.quotepath=false", "format-patch", "HEAD~1",
-                 "--stdout", "--relative"])
+    """The changes below `path` against HEAD, as a patch relative to `path`.
+
+    Staged in a throw-away index, not in the repo's own: no commit, no reset,
+    no hooks, and the real index is not rewritten for a huge directory - so
+    several repos can be patched at the same time. The throw-away index is a
+    copy of the real one (or HEAD, if there is none), so only files whose stat
+    data changed are hashed.
+    """
+    index = Path(
+        repo.out(
+            *(git + ["rev-parse", "--path-format=absolute", "--git-path", "index"])
+        )
     )
-    repo.X(*(git + ["reset", "HEAD~1"]))
-    return patch_content
+    with temppath() as tmp:
+        env = {"GIT_INDEX_FILE": str(tmp / "index")}
+        if index.exists():
+            # copy2: the index keeps its mtime, so git still treats entries
+            # written in the same second as the index as racy and rehashes them
+            shutil.copy2(index, tmp / "index")
+        else:
+            repo.out(*(git + ["read-tree", "HEAD"]), env=env)
+        repo.out(*(git + ["add", "--", path]), env=env)
+
+        # core.quotepath=false → non-ASCII filenames stay as readable UTF-8
+        # instead of octal-escaped `"a/\303\274.txt"`, so the round-trip apply
+        # (and human review) is cleaner.
+        # Not through Repo.out: that strips the final newline, and a patch
+        # without it is malformed.
+        return subprocess.run(
+            git + ["-c", "core.quotepath=false", "diff", "--cached", "--binary",
+                   "--relative", "HEAD"],
+            cwd=path,
+            env=dict(os.environ, **env),
+            capture_output=True,
+            encoding="utf8",
+            check=True,
+        ).stdout
 
 
 def _apply_patches(repo_yml):
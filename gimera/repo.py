@@ -595,16 +595,17 @@ class Repo(GitCommands):
         ]
         return any(x.exists() for x in candidates)
 
-    def submodule_add(self, branch, url, rel_path):
+    def submodule_add(self, branch, url, rel_path, reference=None):
         commands = git + [
             "submodule",
             "add",
             "--force",
             "-b",
             str(branch),
-            url,
-            rel_path,
         ]
+        if reference:
+            commands += ["--reference", str(reference)]
+        commands += [url, rel_path]
         try:
             self.out(*commands)
         except subprocess.CalledProcessError as ex:
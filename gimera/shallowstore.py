@@ -0,0 +1,197 @@
+"""Shallow snapshots of no_cache repos, kept across runs: cache_root()/.shallow
+
+A repo listed in `no_cache` (or everything, with GIMERA_NO_CACHE=1) never
+gets its history into the golden cache. It used to be cloned at depth 1 into
+a temp directory for every single apply, so a hosting machine downloaded
+odoo/odoo again each time anything changed.
+
+Here every snapshot is one directory per (url, sha), fetched at depth 1 by
+its sha and nothing else. The next apply of the same pin - from this project
+or any other on the machine - finds it. The store has its own budget
+(`no_cache_max_bytes` in ~/.gimera, 10 GB by default), separate from the
+golden cache's: least recently used snapshots go first, snapshots a running
+gimera uses never.
+
+A snapshot is never fetched into afterwards; a new pin is a new snapshot.
+That is why fetch.py leaves no_cache repos alone and the sha of a branch is
+resolved with `ls-remote` instead.
+"""
+
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import click
+
+from .cachedir import CACHE_LOCK_TIMEOUT
+from .cachedir import _make_cache_path
+from .cachedir import _pin_in_use
+from .cachedir import cache_lock
+from .cachedir import cache_root
+from .cacheindex import entry_size
+from .consts import gitcmd as git
+from .tools import _raise_error
+
+
+def store_root():
+    return cache_root() / ".shallow"
+
+
+def _tmp_root():
+    # in-flight fetches; outside the store so no eviction sees them
+    return store_root() / ".tmp"
+
+
+def snapshot_path(url, sha):
+    return store_root() / f"{_make_cache_path(url).name}@{sha}"
+
+
+def _git(path, *args):
+    return subprocess.run(
+        git + list(args),
+        cwd=path,
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    ).stdout
+
+
+def _resolve(repo_yml, update):
+    """The sha to check out: the pin, or the branch head for an update."""
+    if repo_yml.sha and not update:
+        return repo_yml.sha
+    try:
+        out = subprocess.run(
+            git + ["ls-remote", repo_yml.url, f"refs/heads/{repo_yml.branch}"],
+            capture_output=True,
+            encoding="utf8",
+            check=True,
+        ).stdout
+    except subprocess.CalledProcessError as ex:
+        _raise_error(f"Could not reach {repo_yml.url}: {ex.stderr.strip()}")
+        return None
+    if not out.strip():
+        _raise_error(f"Branch {repo_yml.branch} not found at {repo_yml.url}")
+        return None
+    return out.split()[0]
+
+
+def _fetch_snapshot(url, sha, branch, path):
+    """Exactly one commit at depth 1, moved into place when complete."""
+    click.secho(f"Fetching {url} at {sha[:10]} (shallow)", fg="yellow")
+    tmp = _tmp_root() / f"{path.name}.{uuid.uuid4()}"
+    tmp.mkdir(parents=True)
+    try:
+        _git(tmp, "init", "--bare", "--quiet")
+        _git(tmp, "remote", "add", "origin", url)
+        _git(tmp, "fetch", "--quiet", "--depth=1", "--no-tags", "origin", sha)
+        # rev-parse <branch> and `submodule add --branch` must work on it;
+        # in here the branch is this one commit
+        if branch:
+            _git(tmp, "update-ref", f"refs/heads/{branch}", sha)
+            _git(tmp, "update-ref", f"refs/remotes/origin/{branch}", sha)
+            _git(tmp, "symbolic-ref", "HEAD", f"refs/heads/{branch}")
+        else:
+            _git(tmp, "update-ref", "--no-deref", "HEAD", sha)
+        tmp.rename(path)
+    except subprocess.CalledProcessError as ex:
+        shutil.rmtree(tmp, ignore_errors=True)
+        _raise_error(
+            f"Could not fetch {sha} from {url}: {(ex.stderr or '').strip()}"
+        )
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+@contextmanager
+def shallow_snapshot(repo_yml, update=None):
+    sha = _resolve(repo_yml, update)
+    path = snapshot_path(repo_yml.url, sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _pin_in_use(path.name)
+    fetched = False
+    with cache_lock(path):
+        if not (path / "HEAD").exists():
+            _fetch_snapshot(repo_yml.url, sha, repo_yml.branch, path)
+            fetched = True
+    # the directory's mtime is the LRU clock of the store
+    os.utime(path)
+    if fetched:
+        enforce_budget()
+    yield path
+
+
+def iter_snapshots(root=None):
+    root = Path(root) if root else store_root()
+    if not root.exists():
+        return
+    for path in root.iterdir():
+        if not path.is_dir() or path.name.startswith("."):
+            continue
+        try:
+            used = path.stat().st_mtime
+        except OSError:
+            continue
+        yield {
+            "path": path,
+            "name": path.name,
+            "size": entry_size(path),
+            "last_used": used,
+        }
+
+
+def _drop_stale_tmp(root):
+    tmp = root / _tmp_root().name
+    if not tmp.exists():
+        return
+    for path in tmp.iterdir():
+        try:
+            age = time.time() - path.stat().st_mtime
+        except OSError:
+            continue
+        if age > CACHE_LOCK_TIMEOUT:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def enforce_budget(root=None, budget=None):
+    """Drop least recently used snapshots until the store fits its budget.
+
+    Runs right after a new snapshot came in. Snapshots pinned by any running
+    gimera, this one included, stay. Returns the number of bytes freed.
+    """
+    from .cachemaint import entries_in_use
+    from .cachemaint import format_size
+    from .userconfig import no_cache_max_bytes
+
+    root = Path(root) if root else store_root()
+    budget = no_cache_max_bytes() if budget is None else budget
+    _drop_stale_tmp(root)
+    snapshots = list(iter_snapshots(root))
+    total = sum(x["size"] for x in snapshots)
+    if total <= budget:
+        return 0
+    in_use = entries_in_use(root.parent)
+    freed = 0
+    for snapshot in sorted(snapshots, key=lambda x: x["last_used"]):
+        if total - freed <= budget:
+            break
+        if snapshot["name"] in in_use:
+            continue
+        try:
+            shutil.rmtree(snapshot["path"])
+        except OSError as ex:
+            click.secho(f"Could not remove {snapshot['path']}: {ex}", fg="red")
+            continue
+        freed += snapshot["size"]
+        click.secho(
+            f"Removed shallow snapshot {snapshot['name']} "
+            f"({format_size(snapshot['size'])}), over budget of "
+            f"{format_size(budget)}",
+            fg="yellow",
+        )
+    return freed
@@ -1,4 +1,5 @@
 import os
+import subprocess
 from pathlib import Path
 from .consts import gitcmd as git
 from .tools import _raise_error, safe_relative_to, is_empty_dir
@@ -6,6 +7,11 @@ from .repo import Repo
 from contextlib import contextmanager
 from .cachedir import _get_cache_dir
 from .cachedir import is_partial_clone
+from .cachedir import hydrate
+from .cachedir import _prefetch_jobs
+from .cachedir import cache_root
+from .cachedir import cache_lock
+from .userconfig import submodule_reference
 from .consts import REPO_TYPE_SUB
 import click
 from .tools import rmtree
@@ -114,8 +120,10 @@ def _fetch_latest_commit_in_submodule(
 
     if sha:
         if not subrepo.contain_commit(sha):
-            with _temporary_switch_remote_to_cachedir(main_repo, repo_yml, relpath):
-                subrepo.X(*(git + ["fetch", "--all"]))
+            with _temporary_switch_remote_to_cachedir(
+                main_repo, repo_yml, relpath
+            ) as cache_dir:
+                subrepo.X(*(git + _serve_options(cache_dir) + ["fetch", "--all"]))
 
         if not subrepo.contain_commit(sha):
             _raise_error(
@@ -146,8 +154,17 @@ def _fetch_latest_commit_in_submodule(
     subrepo.X(*(git + ["clean", "-xdff"]))
     if not repo_yml.sha or update:
         subrepo.X(*(git + ["checkout", "-f", repo_yml.branch]))
-        with _temporary_switch_remote_to_cachedir(repo, repo_yml, relpath):
-            subrepo.pull(repo_yml=repo_yml)
+        with _temporary_switch_remote_to_cachedir(
+            repo, repo_yml, relpath
+        ) as cache_dir:
+            # Repo.pull, with the options a partial cache needs
+            subrepo.X(
+                *(
+                    git
+                    + _serve_options(cache_dir)
+                    + ["pull", "--no-edit", "--no-rebase", "origin", repo_yml.branch]
+                )
+            )
         _commit_submodule()
 
     # show new commits when updating
@@ -175,22 +192,147 @@ def _fetch_latest_commit_in_submodule(
 @contextmanager
 def _temporary_switch_remote_to_cachedir(main_repo, repo_yml, relpath):
     with _get_cache_dir(main_repo, repo_yml) as cache_dir:
-        # A partial clone cannot serve a clone: its upload-pack aborts with
-        # "could not fetch ... from promisor remote" because it does not hold
-        # the blobs. Submodule repos never get a filtered cache themselves,
-        # but the same URL may be integrated in another project and share the
-        # cache directory. Then we fetch from the real remote - slower than
-        # the local cache, and it works.
-        if is_partial_clone(cache_dir):
-            yield
+        # A partial clone cannot serve a plain clone: its upload-pack aborts
+        # with "could not fetch ... from promisor remote" because it does not
+        # hold the blobs. Submodule repos never get a filtered cache
+        # themselves, but the same URL may be integrated in another project
+        # and share the cache directory. Then the blobs of the pinned commit
+        # are fetched into the cache in one batch and the submodule is cloned
+        # from it as a partial clone as well (see _update_options and
+        # _serve_options).
+        if is_partial_clone(cache_dir) and not _serve_from_partial_cache(
+            cache_dir, main_repo, repo_yml, relpath
+        ):
+            yield None
             return
         main_repo.X(*(git + ["submodule", "set-url", relpath, f"file://{cache_dir}"]))
         try:
-            yield
+            yield cache_dir
         finally:
             main_repo.X(*(git + ["submodule", "set-url", relpath, repo_yml.url]))
 
 
+def _checkout_shas(main_repo, repo_yml, relpath):
+    """The commits a submodule update will check out: pin and gitlink."""
+    shas = [repo_yml.sha] if repo_yml.sha else []
+    try:
+        out = main_repo.out(*(git + ["ls-files", "-s", "--", str(relpath)]))
+    except Exception:
+        out = ""
+    for line in out.splitlines():
+        mode, sha = line.split()[:2]
+        if mode == "160000" and sha not in shas:
+            shas.append(sha)
+    if not shas and repo_yml.branch:
+        shas.append(repo_yml.branch)
+    return shas
+
+
+def _commits_between(cache_dir, shas):
+    """The commits from the recorded gitlink up to the pin, both included.
+
+    What a look at the history of the bump (log -p, diff old new) reads in
+    the partial clone of the submodule; each would otherwise be a lazy fetch
+    of its own.
+    """
+    if len(shas) < 2:
+        return shas
+    new, old = shas[:2]
+    try:
+        out = subprocess.run(
+            git + ["rev-list", new, f"^{old}"],
+            cwd=cache_dir,
+            capture_output=True,
+            encoding="utf8",
+            check=True,
+        ).stdout
+    except subprocess.CalledProcessError:
+        # one of them is not in the cache (yet): the tips alone then
+        return shas
+    return shas + [x for x in out.split() if x not in shas]
+
+
+def _serve_from_partial_cache(cache_dir, main_repo, repo_yml, relpath):
+    """Make a partial cache able to serve the checkout of a submodule.
+
+    The blobs of the commits to check out, and of those between the recorded
+    gitlink and the pin, come into the cache in one batch (the same prefetch
+    as for integrated repos). The clone in .git/modules then is a partial
+    clone of the cache and finds all files of the checkout locally; the
+    cache's upload-pack gets the options that allows per call
+    (_serve_options), its config stays as it is. Returns False if that did
+    not work out - then the submodule is fetched from its remote as before.
+    """
+    shas = _commits_between(cache_dir, _checkout_shas(main_repo, repo_yml, relpath))
+    try:
+        # a fetch into the golden entry like any other, see cache_lock
+        with cache_lock(cache_dir):
+            count = hydrate(cache_dir, shas, jobs=max(_prefetch_jobs(), 1))
+    except subprocess.CalledProcessError as ex:
+        click.secho(
+            f"Partial cache {cache_dir} cannot serve {relpath}, fetching from "
+            f"{repo_yml.url} instead: {(ex.stderr or '').strip()}",
+            fg="yellow",
+        )
+        return False
+    if count:
+        verbose(f"Fetched {count} file(s) into partial cache {cache_dir}")
+    return True
+
+
+def _serve_options(cache_dir):
+    """git options for a fetch or clone from `cache_dir`.
+
+    A partial cache only serves a filtered clone and objects by sha with
+    uploadpack.allowFilter and allowAnySHA1InWant. They go on the command
+    line of that one upload-pack (remote.origin.uploadpack), so the entry's
+    own config never allows it to anyone else.
+    """
+    from .cachemaint import _LOCAL_UPLOAD_PACK
+
+    if cache_dir and is_partial_clone(cache_dir):
+        return ["-c", f"remote.origin.uploadpack={_LOCAL_UPLOAD_PACK}"]
+    return []
+
+
+def _update_options(cache_dir):
+    """Extra `submodule update` options for the clone from `cache_dir`."""
+    reference = _reference_for(cache_dir)
+    if reference:
+        return ["--reference", str(reference)]
+    if cache_dir and is_partial_clone(cache_dir):
+        return ["--filter=blob:none"]
+    return []
+
+
+def _reference_for(cache_dir):
+    """The cache entry a submodule clone may borrow objects from, or None.
+
+    With `submodule_reference` in ~/.gimera (or GIMERA_SUBMODULE_REFERENCE=1)
+    the clone in .git/modules gets an alternate to the golden cache instead
+    of a copy of every object - 60 projects, one copy of the history. Not
+    from a partial cache (it lacks the blobs) and not from a shallow
+    snapshot of a no_cache repo (it is not kept for long enough).
+    """
+    if not cache_dir or not submodule_reference():
+        return None
+    cache_dir = Path(cache_dir)
+    if cache_dir.parent != cache_root() or is_partial_clone(cache_dir):
+        return None
+    return cache_dir
+
+
+def _register_borrower(cache_dir, submodule_path):
+    """Remember the clone, so that it gets its own objects before the cache
+    entry is evicted or rewritten - see cachedir.dissociate_borrowers."""
+    from .cacheindex import record_borrower
+
+    gitdir = Repo(submodule_path).out(
+        *(git + ["rev-parse", "--absolute-git-dir"])
+    ).strip()
+    record_borrower(cache_dir, gitdir)
+
+
 def _make_sure_subrepo_is_checked_out(working_dir, main_repo, repo_yml, common_vars):
     """
     Could be, that git submodule update was not called yet.
@@ -203,7 +345,23 @@ def _make_sure_subrepo_is_checked_out(working_dir, main_repo, repo_yml, common_v
     repo = Repo(state["parent_repo"])
     with _temporary_switch_remote_to_cachedir(
         repo, repo_yml, state["parent_repo_relpath"]
-    ):
+    ) as cache_dir:
+        options = _update_options(cache_dir)
+        if options:
+            # not together with --recursive: nested submodules are other
+            # repos and must neither borrow from nor be filtered like this
+            # entry
+            repo.X(
+                *(
+                    git
+                    + _serve_options(cache_dir)
+                    + ["submodule", "update", "--init"]
+                    + options
+                    + [state["parent_repo_relpath"]]
+                )
+            )
+            if "--reference" in options:
+                _register_borrower(cache_dir, path)
         repo.X(
             *(
                 git
@@ -287,7 +445,12 @@ def __add_submodule(root_dir, working_dir, repo, config, all_config, common_vars
         rmtree(repo.path / relpath)
 
     with _get_cache_dir(repo, config) as cache_dir:
-        repo.submodule_add(config.branch, str(cache_dir), relpath)
+        reference = _reference_for(cache_dir)
+        repo.submodule_add(
+            config.branch, str(cache_dir), relpath, reference=reference
+        )
+        if reference:
+            _register_borrower(reference, repo.path / relpath)
         repo.X(*(git + ["submodule", "set-url", relpath, config.url]))
         repo.X(*(git + ["add", ".gitmodules"]))
         click.secho(f"Added submodule {relpath} pointing to {config.url}", fg="yellow")
@@ -7,6 +7,8 @@ import shutil
 import tempfile
 from pathlib import Path
 
+from .tools import make_origin
+
 
 @pytest.fixture(autouse=True)
 def set_env_vars(monkeypatch):
@@ -52,3 +54,9 @@ def cleangimera_cache(tmp_path):
     os.environ.pop("GIMERA_CACHE_DIR", None)
     if cache_dir.exists():
         shutil.rmtree(cache_dir)
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """See tools.make_origin. Not autouse: import it by name."""
+    return make_origin(tmp_path / "origin")
@@ -164,3 +164,53 @@ def test_clone_falls_back_when_the_filter_is_rejected(tmp_path, monkeypatch):
     assert "--filter=blob:none" not in calls[1]
     assert is_partial_clone(dest) is False
     assert (dest / "HEAD").exists()
+
+
+def _origin_with_files(tmp_path, count):
+    origin = _make_origin(tmp_path)
+    for i in range(count):
+        (origin / f"file{i}.txt").write_text(f"content {i}")
+    _git(origin, "add", ".")
+    _git(origin, "commit", "-qm", "many")
+    return origin
+
+
+def test_prefetch_fetches_the_snapshot_in_batches(tmp_path, monkeypatch, capsys):
+    from .. import cachedir
+
+    origin = _origin_with_files(tmp_path, 10)
+    cache = _clone_partial(origin, tmp_path / "cache")
+    assert len(cachedir.missing_blobs(cache, ["HEAD"])) == 11
+    monkeypatch.setattr(cachedir, "PREFETCH_BATCH", 3)
+    monkeypatch.setenv("GIMERA_PREFETCH_JOBS", "2")
+
+    cachedir.prefetch(cache, "HEAD", "addons/origin")
+
+    assert cachedir.missing_blobs(cache, ["HEAD"]) == []
+    # the older snapshot stays without its file
+    assert len(cachedir.missing_blobs(cache, ["HEAD~2"])) == 1
+    assert "prefetched 11 file(s)" in capsys.readouterr().out
+
+
+def test_prefetch_can_be_turned_off(tmp_path, monkeypatch):
+    from .. import cachedir
+
+    origin = _origin_with_files(tmp_path, 2)
+    cache = _clone_partial(origin, tmp_path / "cache")
+    monkeypatch.setenv("GIMERA_PREFETCH_JOBS", "0")
+
+    cachedir.prefetch(cache, "HEAD", "addons/origin")
+
+    assert len(cachedir.missing_blobs(cache, ["HEAD"])) == 3
+
+
+def test_failed_prefetch_leaves_it_to_git_archive(tmp_path, capsys):
+    from .. import cachedir
+
+    origin = _origin_with_files(tmp_path, 2)
+    cache = _clone_partial(origin, tmp_path / "cache")
+    _git(cache, "config", "remote.origin.url", f"file://{tmp_path}/nothing")
+
+    cachedir.prefetch(cache, "HEAD", "addons/origin")
+
+    assert "prefetch of addons/origin failed" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+"""Cache entries travel as bundles: gimera cache export / import."""
+
+import pytest
+
+from .. import cachebundle
+from ..cachedir import _make_cache_path
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    return make_origin(tmp_path / "origin")
+
+
+def _entry(origin, tmp_path, partial=False):
+    url = f"file://{origin}"
+    path = _make_cache_path(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    args = ["clone", "-q", "--bare"] + (["--filter=blob:none"] if partial else [])
+    git_out(tmp_path, *args, url, str(path))
+    return path
+
+
+def test_round_trip(setup, tmp_path):
+    entry = _entry(setup, tmp_path)
+    export_dir = tmp_path / "export"
+
+    assert cachebundle.export(export_dir) == [entry.name]
+    other = tmp_path / "other-cache"
+    assert cachebundle.import_(export_dir, root=other) == [entry.name]
+
+    imported = other / entry.name
+    assert git_out(imported, "rev-parse", "main") == git_out(entry, "rev-parse", "main")
+    assert git_out(imported, "symbolic-ref", "HEAD") == "refs/heads/main"
+    assert git_out(imported, "config", "remote.origin.url") == f"file://{setup}"
+
+
+def test_second_export_is_incremental(setup, tmp_path):
+    entry = _entry(setup, tmp_path)
+    export_dir = tmp_path / "export"
+    cachebundle.export(export_dir)
+
+    assert cachebundle.export(export_dir) == []
+
+    sha = commit_file(setup, "two", name="b.txt")
+    git_out(entry, "fetch", "-q", "origin", "main:main")
+    assert cachebundle.export(export_dir) == [entry.name]
+    exports = cachebundle.load_manifest(export_dir)["entries"][entry.name]["exports"]
+    assert len(exports) == 2
+    # the second bundle holds only the new commit and needs the first
+    verify = git_out(entry, "bundle", "verify", str(export_dir / exports[1]["bundle"]))
+    assert "requires this ref" in verify
+
+    other = tmp_path / "other-cache"
+    cachebundle.import_(export_dir, root=other)
+    assert git_out(other / entry.name, "rev-parse", "main") == sha
+
+
+def test_partial_entry_keeps_its_blobs_offline(setup, tmp_path):
+    entry = _entry(setup, tmp_path, partial=True)
+    git_out(entry, "cat-file", "-p", "main:file.txt")  # fetches the one blob
+    export_dir = tmp_path / "export"
+    cachebundle.export(export_dir)
+
+    other = tmp_path / "other-cache"
+    cachebundle.import_(export_dir, root=other)
+    imported = other / entry.name
+    # no way back to the remote: what is shown must be local
+    git_out(imported, "config", "remote.origin.url", "file:///nonexistent")
+
+    assert git_out(imported, "config", "remote.origin.promisor") == "true"
+    assert git_out(imported, "cat-file", "-p", "main:file.txt") == "one"
+
+
+def test_existing_entries_are_left_alone(setup, tmp_path):
+    entry = _entry(setup, tmp_path)
+    export_dir = tmp_path / "export"
+    cachebundle.export(export_dir)
+
+    assert cachebundle.import_(export_dir) == []
+    assert entry.exists()
@@ -0,0 +1,140 @@
+"""`gimera cached`: the daemon answers over a unix socket, and a client that
+cannot reach it does the work itself.
+
+The server runs in a thread of the test process - the protocol and the cache
+work are the same as in the real foreground process.
+"""
+
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from .. import cachedaemon
+from ..cachedir import _make_cache_path
+from .fixtures import origin
+from .tools import git_out
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    # unix socket paths are limited to ~100 chars; tmp_path can be longer
+    sockdir = Path(tempfile.mkdtemp(prefix="gimd"))
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv(cachedaemon.SOCKET_ENV, str(sockdir / "s"))
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.delenv("GIMERA_NO_DAEMON", raising=False)
+    (tmp_path / "cache").mkdir()
+
+    service = cachedaemon.CacheService(refresh_interval=3600)
+    server = cachedaemon._Server(str(sockdir / "s"), cachedaemon._Handler)
+    server.service = service
+    service.server = server
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield service
+    finally:
+        server.shutdown()
+        service.close()
+        server.server_close()
+        shutil.rmtree(sockdir)
+
+
+def _params(origin, sha=None):
+    return {
+        "url": f"file://{origin}",
+        "branch": "main",
+        "sha": sha,
+        "type": "submodule",
+        "path": "sub",
+    }
+
+
+def test_no_daemon_means_do_it_yourself(tmp_path, monkeypatch):
+    monkeypatch.setenv(cachedaemon.SOCKET_ENV, str(tmp_path / "nothing"))
+    assert cachedaemon.request("ping") is None
+    assert not cachedaemon.is_running()
+
+
+def test_a_daemon_that_does_not_answer_is_given_up(tmp_path, monkeypatch):
+    import socket
+
+    sockdir = Path(tempfile.mkdtemp(prefix="gimd"))
+    monkeypatch.setenv(cachedaemon.SOCKET_ENV, str(sockdir / "s"))
+    monkeypatch.setenv("GIMERA_GIT_IDLE_TIMEOUT", "0.2")
+    monkeypatch.delenv("GIMERA_NO_DAEMON", raising=False)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as hung:
+        hung.bind(str(sockdir / "s"))
+        hung.listen()
+        assert cachedaemon.request("ping") is None
+    shutil.rmtree(sockdir)
+
+
+def test_ping(daemon):
+    assert cachedaemon.is_running()
+
+
+def test_ensure_clones_into_the_cache(daemon, origin):
+    sha = git_out(origin, "rev-parse", "HEAD")
+
+    answer = cachedaemon.request("ensure", **_params(origin, sha))
+
+    path = _make_cache_path(f"file://{origin}")
+    assert answer["path"] == str(path)
+    assert answer["sha"] == sha
+    assert git_out(path, "cat-file", "-t", sha) == "commit"
+
+
+def test_fetch_brings_new_commits(daemon, origin):
+    cachedaemon.request("ensure", **_params(origin))
+    (origin / "file.txt").write_text("two")
+    git_out(origin, "commit", "-qam", "two")
+    sha = git_out(origin, "rev-parse", "HEAD")
+
+    answer = cachedaemon.request("fetch", minimal=True, **_params(origin, sha))
+
+    assert answer["fetched"] is True
+    path = _make_cache_path(f"file://{origin}")
+    assert git_out(path, "rev-parse", "main") == sha
+
+
+def test_minimal_fetch_skips_a_known_sha(daemon, origin):
+    sha = git_out(origin, "rev-parse", "HEAD")
+    cachedaemon.request("ensure", **_params(origin, sha))
+
+    answer = cachedaemon.request("fetch", minimal=True, **_params(origin, sha))
+
+    assert answer["fetched"] is False
+
+
+def test_fetch_of_an_unknown_entry_is_left_to_the_client(daemon, origin):
+    answer = cachedaemon.request("fetch", **_params(origin))
+    assert answer["path"] is None
+
+
+def test_an_error_is_reported_not_raised(daemon):
+    assert cachedaemon.request("nonsense") is None
+
+
+def test_a_long_request_is_kept_alive(daemon, monkeypatch):
+    monkeypatch.setattr(cachedaemon, "KEEPALIVE_SECONDS", 0.05)
+    monkeypatch.setenv("GIMERA_GIT_IDLE_TIMEOUT", "0.3")
+    daemon.op_slow = lambda data: time.sleep(1) or {"slept": True}
+
+    assert cachedaemon.request("slow")["slept"]
+
+
+def test_served_entries_are_pinned_per_request_only(daemon, origin, monkeypatch):
+    from .. import cachedir
+    from ..cachemaint import entries_in_use
+
+    monkeypatch.setattr(cachedir, "_in_use_here", set())
+    cachedaemon.request("ensure", **_params(origin))
+    cachedaemon.request("fetch", **_params(origin))
+
+    assert entries_in_use(cachedir.cache_root()) == set()
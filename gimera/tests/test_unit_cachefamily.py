@@ -0,0 +1,155 @@
+"""Forks of one repo share their objects through the pool of their family."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from ..cachedir import _clone_or_restore
+from ..cachedir import _make_cache_path
+from ..cachedir import shares_layer
+from ..cachefamily import join
+from ..cachefamily import maintain_pools
+from ..cachefamily import members
+from ..cachefamily import pool_path
+from ..repo import Repo
+from ..tools import rmtree
+from ..userconfig import load_user_config
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
+
+
+def _commit(repo, name, lines):
+    content = "\n".join(str(x) for x in range(lines))
+    return commit_file(repo, content, name=name, message=name)
+
+
+def _objects_in_pack(path):
+    stats = dict(
+        line.split(": ") for line in git_out(path, "count-objects", "-v").splitlines()
+    )
+    return int(stats["in-pack"]) + int(stats["count"])
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    config = tmp_path / "gimera.json"
+    config.write_text(json.dumps({"families": {"demo": ["upstream", "fork"]}}))
+    monkeypatch.setenv("GIMERA_CONFIG", str(config))
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    load_user_config.cache_clear()
+
+    upstream = init_repo(tmp_path / "upstream")
+    git_out(upstream, "config", "uploadpack.allowFilter", "true")
+    for i in range(5):
+        _commit(upstream, f"file{i}", 1000 + i)
+    fork = tmp_path / "fork"
+    git_out(tmp_path, "clone", "-q", str(upstream), str(fork))
+    _commit(fork, "custom", 10)
+    git_out(fork, "config", "uploadpack.allowFilter", "true")
+
+    yield SimpleNamespace(
+        tmp_path=tmp_path,
+        upstream=f"file://{upstream}",
+        fork=f"file://{fork}",
+        pool=pool_path("demo"),
+    )
+    load_user_config.cache_clear()
+
+
+def _create(setup, url, partial=False):
+    golden_path = _make_cache_path(url)
+    golden_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = golden_path.with_name(golden_path.name + ".tmp")
+    _clone_or_restore(Repo(setup.tmp_path), url, golden_path, tmp, partial=partial)
+    tmp.rename(golden_path)
+    return golden_path
+
+
+@pytest.mark.parametrize("partial", [False, True])
+def test_members_share_the_pool(setup, partial):
+    upstream = _create(setup, setup.upstream, partial)
+    assert join(upstream, setup.upstream)
+    fork = _create(setup, setup.fork, partial)
+    assert join(fork, setup.fork)
+
+    assert members(setup.pool) == sorted([upstream.name, fork.name])
+    for entry in (upstream, fork):
+        assert shares_layer(entry)
+        git_out(entry, "fsck", "--connectivity-only")
+    # the fork's clone started from the pool: it holds only its own commit
+    # (commit and tree, and its blob unless partial)
+    assert _objects_in_pack(fork) <= 3
+    assert _objects_in_pack(upstream) == 0
+    assert git_out(fork, "log", "--format=%s", "-1") == "custom"
+
+
+def test_a_full_entry_stays_out_of_a_partial_pool(setup):
+    upstream = _create(setup, setup.upstream, partial=True)
+    assert join(upstream, setup.upstream)
+    fork = _create(setup, setup.fork, partial=False)
+
+    assert not join(fork, setup.fork)
+    assert not shares_layer(fork)
+
+
+def test_repos_without_family_are_left_alone(setup):
+    url = f"file://{setup.tmp_path}/other"
+    git_out(setup.tmp_path, "clone", "-q", "--bare", setup.upstream, "other")
+    entry = _create(setup, url)
+
+    assert not join(entry, url)
+    assert not setup.pool.exists()
+
+
+def test_maintain_forgets_members_that_left(setup):
+    upstream = _create(setup, setup.upstream)
+    join(upstream, setup.upstream)
+    fork = _create(setup, setup.fork)
+    join(fork, setup.fork)
+
+    rmtree(fork)
+    assert maintain_pools() == {"demo": [fork.name]}
+
+    assert members(setup.pool) == [upstream.name]
+    git_out(upstream, "fsck", "--connectivity-only")
+
+
+def test_a_pinned_commit_no_branch_holds_survives_the_repack(setup):
+    from ..cacheindex import record_pin
+
+    entry = _create(setup, setup.upstream)
+    origin = setup.tmp_path / "upstream"
+    git_out(origin, "checkout", "-qb", "gone")
+    sha = _commit(origin, "hotfix", 3)
+    git_out(origin, "checkout", "-q", "main")
+    git_out(entry, "fetch", "-q", "--no-write-fetch-head", "origin", sha)
+    git_out(origin, "branch", "-qD", "gone")
+    record_pin(setup.upstream, sha, setup.tmp_path, "odoo")
+
+    assert join(entry, setup.upstream)
+    git_out(entry, "prune", "--expire=now")
+
+    assert git_out(entry, "cat-file", "-t", sha) == "commit"
+    assert git_out(
+        setup.pool, "rev-parse", f"refs/families/{entry.name}/gimera/pins/{sha}"
+    ) == sha
+
+
+def test_the_pool_counts_towards_the_budget(setup):
+    from ..cachemaint import enforce_budget
+    from ..cachemaint import iter_entries
+
+    upstream = _create(setup, setup.upstream)
+    join(upstream, setup.upstream)
+    fork = _create(setup, setup.fork)
+    join(fork, setup.fork)
+    own = sum(x["size"] for x in iter_entries(recorded_sizes=True))
+
+    # the members alone fit, with the pool they do not
+    freed = enforce_budget(budget=own + 1)
+    # evicting them frees their own bytes, not the pool's: that stays until
+    # the next maintain
+    assert 0 < freed <= own
+    assert setup.pool.exists()
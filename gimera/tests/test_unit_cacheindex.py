@@ -0,0 +1,128 @@
+"""The cache index answers `cache list` without walking the entries."""
+
+import pytest
+
+from .. import cacheindex
+from .. import cachemaint
+from ..cachemaint import iter_entries
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def cache(tmp_path):
+    root = tmp_path / "cache"
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def bare_entry(tmp_path, cache):
+    work = init_repo(tmp_path / "work")
+    commit_file(work, "x" * 10000, message="one")
+    path = cache / "file----work"
+    git_out(tmp_path, "clone", "-q", "--bare", str(work), str(path))
+    return path
+
+
+def test_entry_size_is_close_to_a_walk(bare_entry):
+    walked = cachemaint.dir_size(bare_entry)
+    # count-objects reports in KiB, so it rounds up per pack
+    assert abs(cacheindex.entry_size(bare_entry) - walked) < 16 * 1024
+
+
+def test_record_write_and_read(bare_entry, cache):
+    cacheindex.record_read(bare_entry, "file:///work", used_as_submodule=True)
+    cacheindex.record_write(bare_entry)
+
+    row = cacheindex.rows(cache)[bare_entry.name]
+    assert row["url"] == "file:///work"
+    assert row["size"] > 0
+    assert row["partial"] == 0
+    assert row["used_as_submodule"] == 1
+    assert row["last_read"] and row["last_write"]
+
+
+def test_listing_does_not_walk_known_entries(bare_entry, cache, monkeypatch):
+    cacheindex.record_read(bare_entry, "file:///work")
+    cacheindex.record_write(bare_entry)
+
+    def walk(path):
+        raise AssertionError(f"walked {path}")
+
+    monkeypatch.setattr(cachemaint, "dir_size", walk)
+    entries = list(iter_entries(cache))
+
+    assert entries[0]["url"] == "file:///work"
+    assert entries[0]["size"] == cacheindex.rows(cache)[bare_entry.name]["size"]
+
+
+def test_unknown_entries_are_walked_once(bare_entry, cache, monkeypatch):
+    first = list(iter_entries(cache))
+    assert first[0]["url"] is None
+    assert cacheindex.rows(cache)[bare_entry.name]["size"] == first[0]["size"]
+
+    monkeypatch.setattr(cachemaint, "dir_size", lambda path: 1 / 0)
+    assert list(iter_entries(cache))[0]["size"] == first[0]["size"]
+
+
+def test_forget(bare_entry, cache):
+    cacheindex.record_write(bare_entry)
+    cacheindex.forget(bare_entry)
+    assert bare_entry.name not in cacheindex.rows(cache)
+
+
+def test_a_broken_index_fails_nothing(bare_entry, cache):
+    cacheindex.index_path(cache).write_text("this is no database")
+
+    cacheindex.record_write(bare_entry)
+
+    assert cacheindex.rows(cache) == {}
+    assert [x["name"] for x in iter_entries(cache)] == [bare_entry.name]
+
+
+def test_repacked_entries_are_measured_again(bare_entry, cache, monkeypatch):
+    cacheindex.record_write(bare_entry)
+    size = cacheindex.rows(cache)[bare_entry.name]["size"]
+    (bare_entry / "file.txt").write_text("unrelated")  # not under objects/
+
+    measured = []
+    real = cacheindex.entry_size
+    monkeypatch.setattr(
+        cacheindex, "entry_size", lambda path: measured.append(path) or real(path)
+    )
+    assert list(iter_entries(cache))[0]["size"] == size
+    assert measured == []
+
+    # a gc outside gimera replaces the packs
+    git_out(bare_entry, "repack", "-a", "-d", "-f", "-q")
+    git_out(bare_entry, "prune-packed")
+    (bare_entry / "objects" / "pack" / "extra.keep").write_text("")
+
+    list(iter_entries(cache))
+    assert measured == [bare_entry]
+    row = cacheindex.rows(cache)[bare_entry.name]
+    assert row["size_stamp"] == cacheindex.size_stamp(bare_entry)
+
+
+def test_an_index_without_stamps_gets_the_column(bare_entry, cache):
+    import sqlite3
+
+    conn = sqlite3.connect(str(cacheindex.index_path(cache)))
+    # as the first gimera with an index wrote it
+    conn.execute(
+        "CREATE TABLE entries (name TEXT PRIMARY KEY, url TEXT, path TEXT, "
+        "partial INTEGER, size INTEGER, last_read REAL, last_write REAL, "
+        "used_as_submodule INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute(
+        "INSERT INTO entries (name, size) VALUES (?, 1)", (bare_entry.name,)
+    )
+    conn.commit()
+    conn.close()
+
+    entries = list(iter_entries(cache))
+
+    assert entries[0]["size"] > 1
+    assert cacheindex.rows(cache)[bare_entry.name]["size_stamp"]
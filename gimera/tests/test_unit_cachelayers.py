@@ -0,0 +1,79 @@
+"""Cache entries borrow their history from read-only cache layers."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from ..cachedir import _clone_or_restore
+from ..cachedir import _make_cache_path
+from ..cachedir import shares_layer
+from ..cachemaint import compact
+from ..repo import Repo
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    origin = make_origin(tmp_path / "origin")
+    url = f"file://{origin}"
+
+    # the shared layer, filled by some other machine
+    shared = tmp_path / "shared"
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(shared))
+    layer_entry = _make_cache_path(url)
+    layer_entry.parent.mkdir(parents=True)
+    git_out(tmp_path, "clone", "-q", "--bare", url, str(layer_entry))
+
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "local"))
+    monkeypatch.setenv("GIMERA_CACHE_LAYERS", str(shared))
+    golden_path = _make_cache_path(url)
+    golden_path.parent.mkdir(parents=True)
+    return SimpleNamespace(
+        origin=origin, url=url, layer_entry=layer_entry, golden_path=golden_path,
+        tmp_path=tmp_path,
+    )
+
+
+def _create(setup):
+    _clone_or_restore(
+        Repo(setup.tmp_path), setup.url, setup.golden_path, setup.golden_path
+    )
+
+
+def test_entry_borrows_from_the_layer(setup):
+    _create(setup)
+
+    assert shares_layer(setup.golden_path)
+    assert git_out(setup.golden_path, "config", "remote.origin.url") == setup.url
+    assert git_out(setup.golden_path, "rev-parse", "main") == git_out(
+        setup.layer_entry, "rev-parse", "main"
+    )
+    # the history stayed where it was
+    assert not list((setup.golden_path / "objects" / "pack").glob("*.pack"))
+
+
+def test_fetches_land_in_the_own_layer(setup):
+    _create(setup)
+    sha = commit_file(setup.origin, "two")
+
+    git_out(setup.golden_path, "fetch", "-q", "origin", "main:main")
+
+    assert git_out(setup.golden_path, "rev-parse", "main") == sha
+    assert git_out(setup.layer_entry, "rev-parse", "main") != sha
+
+
+def test_without_a_layer_entry_it_clones(setup, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_LAYERS", str(setup.tmp_path / "empty"))
+    _create(setup)
+
+    assert not shares_layer(setup.golden_path)
+    assert git_out(setup.golden_path, "rev-parse", "main")
+
+
+def test_compact_leaves_shared_entries_alone(setup):
+    _create(setup)
+
+    assert compact(names=[setup.golden_path.name], force=True) == []
@@ -13,6 +13,9 @@ from ..cachemaint import clean
 from ..cachemaint import format_size
 from ..cachemaint import iter_entries
 from ..cachemaint import stray_tarballs
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
 
 
 def _entry(root, name, size=10, with_tar=0):
@@ -147,3 +150,375 @@ class TestFormatSize:
     )
     def test_readable(self, value, expected):
         assert format_size(value) == expected
+
+
+class TestMaintain:
+    def _bare_cache(self, cache, commits=3):
+        work = init_repo(cache.parent / "work")
+        path = cache / "github.com-odoo-odoo"
+        git_out(cache, "init", "-q", "--bare", str(path))
+        git_out(path, "config", "receive.unpackLimit", "1")
+        for i in range(commits):
+            commit_file(work, str(i))
+            # one push per commit, like weekly fetches: one pack each
+            git_out(work, "push", "-q", str(path), "main")
+        return path
+
+    def test_writes_graph_and_folds_packs(self, cache):
+        from ..cachemaint import maintain
+
+        path = self._bare_cache(cache)
+        packs = len(list((path / "objects" / "pack").glob("*.pack")))
+
+        reports = maintain(cache, prune_refs=False)
+
+        assert len(reports) == 1
+        assert reports[0]["errors"] == []
+        assert (path / "objects" / "info" / "commit-graph").exists()
+        assert (path / "objects" / "pack" / "multi-pack-index").exists()
+        assert reports[0]["packs_after"] <= packs
+
+    def test_maintenance_does_not_count_as_use(self, cache):
+        from ..cachemaint import last_used
+        from ..cachemaint import maintain
+
+        path = self._bare_cache(cache)
+        long_ago = time.time() - 400 * 86400
+        _age(path, long_ago)
+        for name in ["HEAD", "refs", "packed-refs"]:
+            if (path / name).exists():
+                __import__("os").utime(path / name, (long_ago, long_ago))
+        before = last_used(path)
+
+        maintain(cache, prune_refs=False)
+
+        assert last_used(path) == before
+
+    def test_lock_is_released(self, cache):
+        from ..cachemaint import maintain
+
+        path = self._bare_cache(cache, commits=1)
+
+        maintain(cache, prune_refs=False)
+
+        assert not (cache / f"{path.name}.lock").exists()
+
+
+class TestCompact:
+    def _full_cache(self, cache, commits=3):
+        work = init_repo(cache.parent / "work")
+        for i in range(commits):
+            commit_file(work, f"version {i}", message=str(i))
+        path = cache / "file----work"
+        git_out(cache, "clone", "-q", "--bare", f"file://{work}", str(path))
+        return path
+
+    def test_keeps_head_and_drops_history(self, cache):
+        from ..cachedir import is_partial_clone
+        from ..cachedir import missing_blobs
+        from ..cacheindex import record_read
+        from ..cacheindex import rows
+        from ..cachemaint import compact
+
+        path = self._full_cache(cache)
+        upstream = git_out(path, "config", "remote.origin.url")
+        record_read(path, upstream)
+
+        reports = compact(cache)
+
+        assert len(reports) == 1
+        assert is_partial_clone(path)
+        assert missing_blobs(path, ["HEAD"]) == []
+        assert len(missing_blobs(path, ["HEAD~2"])) == 1
+        assert git_out(path, "config", "remote.origin.url") == upstream
+        assert not git_out(path, "config", "--default=", "remote.origin.uploadpack")
+        git_out(path, "fsck", "--connectivity-only")
+        assert rows(cache)[path.name]["partial"] == 1
+        assert not list(cache.glob("*.compact-*"))
+
+    def test_keep(self, cache):
+        from ..cachedir import missing_blobs
+        from ..cachemaint import compact
+
+        path = self._full_cache(cache)
+        compact(cache, keep=["HEAD~1"], force=True)
+
+        assert missing_blobs(path, ["HEAD~1"]) == []
+        assert len(missing_blobs(path, ["HEAD~2"])) == 1
+
+    def test_pinned_snapshots_keep_their_files(self, cache, tmp_path, monkeypatch):
+        from ..cachedir import _make_cache_path
+        from ..cachedir import missing_blobs
+        from ..cacheindex import record_pin
+        from ..cachemaint import compact
+
+        monkeypatch.setenv("GIMERA_CACHE_DIR", str(cache))
+        path = self._full_cache(cache)
+        url = f"file://{cache.parent / 'work'}"
+        path = path.rename(_make_cache_path(url))
+        sha = git_out(path, "rev-parse", "HEAD~1")
+        record_pin(url, sha, tmp_path, "addons/work")
+
+        compact(cache, force=True)
+
+        assert missing_blobs(path, [sha]) == []
+        assert len(missing_blobs(path, ["HEAD~2"])) == 1
+
+    def test_submodule_entries_stay_full(self, cache):
+        from ..cachedir import is_partial_clone
+        from ..cacheindex import record_read
+        from ..cachemaint import compact
+
+        path = self._full_cache(cache)
+        record_read(path, "file:///work", used_as_submodule=True)
+
+        assert compact(cache, force=True) == []
+        assert not is_partial_clone(path)
+
+    def test_unknown_entries_need_force(self, cache):
+        from ..cachedir import is_partial_clone
+        from ..cachemaint import compact
+
+        path = self._full_cache(cache)
+
+        assert compact(cache) == []
+        assert not is_partial_clone(path)
+
+
+class TestGc:
+    @pytest.fixture
+    def partial(self, cache, monkeypatch):
+        from ..cachedir import _make_cache_path
+        from ..cachedir import hydrate
+
+        monkeypatch.setenv("GIMERA_CACHE_DIR", str(cache))
+        work = init_repo(cache.parent / "work")
+        for key in ["uploadpack.allowFilter", "uploadpack.allowAnySHA1InWant"]:
+            git_out(work, "config", key, "true")
+        for i in range(3):
+            commit_file(work, f"version {i}", message=str(i))
+        url = f"file://{work}"
+        path = _make_cache_path(url)
+        git_out(cache, "clone", "-q", "--bare", "--filter=blob:none", url, str(path))
+        # two snapshots that some apply once extracted
+        hydrate(path, ["HEAD", "HEAD~2"])
+        return path, url
+
+    def test_drops_blobs_of_snapshots_nobody_pins(self, partial, cache, tmp_path):
+        from ..cachedir import is_partial_clone
+        from ..cachedir import missing_blobs
+        from ..cacheindex import record_pin
+        from ..cachemaint import gc
+
+        path, url = partial
+        assert missing_blobs(path, ["HEAD", "HEAD~2"]) == []
+        record_pin(url, git_out(path, "rev-parse", "HEAD"), tmp_path, "addons/work")
+
+        reports = gc(cache, days=30)
+
+        assert len(reports) == 1
+        assert is_partial_clone(path)
+        assert missing_blobs(path, ["HEAD"]) == []
+        assert len(missing_blobs(path, ["HEAD~2"])) == 1
+
+    def test_old_pins_do_not_count(self, partial, cache, tmp_path):
+        from ..cacheindex import connect
+        from ..cacheindex import pins
+        from ..cacheindex import record_pin
+
+        path, url = partial
+        record_pin(url, git_out(path, "rev-parse", "HEAD"), tmp_path, "addons/work")
+        with connect(cache) as conn:
+            conn.execute("UPDATE pins SET last_seen = 0")
+
+        assert pins(cache, since=time.time() - 86400) == []
+
+    def test_pins_of_vanished_projects_are_dropped(self, partial, cache, tmp_path):
+        from ..cacheindex import pins
+        from ..cacheindex import record_pin
+
+        path, url = partial
+        sha = git_out(path, "rev-parse", "HEAD")
+        record_pin(url, sha, tmp_path / "gone", "addons/work")
+
+        assert pins(cache) == []
+
+    def test_a_new_pin_replaces_the_old_one(self, partial, cache, tmp_path):
+        from ..cacheindex import pins
+        from ..cacheindex import record_pin
+
+        path, url = partial
+        record_pin(url, git_out(path, "rev-parse", "HEAD~2"), tmp_path, "addons/work")
+        record_pin(url, git_out(path, "rev-parse", "HEAD"), tmp_path, "addons/work")
+
+        assert [x["sha"] for x in pins(cache)] == [git_out(path, "rev-parse", "HEAD")]
+
+    def test_entries_without_pins_are_left_alone(self, partial, cache):
+        from ..cachedir import missing_blobs
+        from ..cachemaint import gc
+
+        path, url = partial
+
+        assert gc(cache) == []
+        assert missing_blobs(path, ["HEAD~2"]) == []
+
+
+class TestBudget:
+    def test_nothing_happens_without_a_budget(self, cache):
+        from ..cachemaint import enforce_budget
+
+        path = _entry(cache, "a", size=100)
+
+        assert enforce_budget(cache, budget=0) == 0
+        assert path.exists()
+
+    def test_least_recently_used_goes_first(self, cache):
+        from ..cachemaint import enforce_budget
+
+        old = _entry(cache, "old", size=100)
+        new = _entry(cache, "new", size=100)
+        now = time.time()
+        _age(old, now - 10 * 86400)
+        _age(new, now)
+
+        freed = enforce_budget(cache, budget=150)
+
+        assert freed == 100
+        assert not old.exists()
+        assert new.exists()
+
+    def test_access_record_beats_fetch_markers(self, cache):
+        """A pin that did not move is read, never fetched - still in use."""
+        from ..cacheindex import record_read
+        from ..cachemaint import enforce_budget
+
+        read_only = _entry(cache, "read-only", size=100)
+        fetched = _entry(cache, "fetched", size=100)
+        now = time.time()
+        _age(read_only, now - 30 * 86400)
+        _age(fetched, now - 86400)
+        record_read(read_only, "git@github.com:a/read-only")
+
+        enforce_budget(cache, budget=150)
+
+        assert read_only.exists()
+        assert not fetched.exists()
+
+    def test_entries_pinned_by_a_running_apply_stay(self, cache):
+        from ..cachemaint import enforce_budget
+
+        pinned = _entry(cache, "pinned", size=100)
+        other = _entry(cache, "other", size=100)
+        now = time.time()
+        _age(pinned, now - 10 * 86400)
+        _age(other, now)
+        (cache / ".in-use").mkdir()
+        # pid 1 is always alive
+        (cache / ".in-use" / "1").write_text("pinned\n")
+
+        enforce_budget(cache, budget=150)
+
+        assert pinned.exists()
+        assert not other.exists()
+
+    def test_pins_of_dead_processes_are_dropped(self, cache):
+        from ..cachemaint import entries_in_use
+
+        (cache / ".in-use").mkdir()
+        (cache / ".in-use" / "999999999").write_text("gone\n")
+
+        assert entries_in_use(cache) == set()
+        assert not (cache / ".in-use" / "999999999").exists()
+
+    def test_locked_entries_stay(self, cache):
+        from ..cachemaint import enforce_budget
+
+        locked = _entry(cache, "locked", size=100)
+        (cache / "locked.lock").write_text("")
+        _entry(cache, "other", size=100)
+        _age(locked, time.time() - 10 * 86400)
+
+        enforce_budget(cache, budget=150)
+
+        assert locked.exists()
+
+    def test_bookkeeping_dirs_are_no_entries(self, cache):
+        (cache / ".trash").mkdir()
+        (cache / ".in-use").mkdir()
+        _entry(cache, "real", size=1)
+
+        assert [x["name"] for x in iter_entries(cache)] == ["real"]
+
+    def test_clones_in_progress_are_no_entries(self, cache):
+        from ..cachemaint import enforce_budget
+
+        uid = "0b5c4c8e-3c1d-4c47-9a8e-2f1d0c6e9a11"
+        building = [
+            _entry(cache, f"real.{uid}", size=100),
+            _entry(cache, f"real.compact-{uid}", size=100),
+            _entry(cache, f"real.import-{uid}", size=100),
+        ]
+        _entry(cache, "real", size=1)
+        _entry(cache, "real.git", size=1)
+
+        assert [x["name"] for x in iter_entries(cache)] == ["real", "real.git"]
+        enforce_budget(cache, budget=1)
+        assert all(x.exists() for x in building)
+
+    def test_recorded_sizes_are_not_measured_again(self, cache, monkeypatch):
+        from .. import cachemaint
+        from ..cacheindex import record_size
+
+        path = _entry(cache, "a", size=100)
+        record_size(path, 100)
+        # the packs changed since: `cache list` measures it, the budget not
+        (path / "objects" / "pack2").write_bytes(b"x")
+
+        def no_walk(path):
+            raise AssertionError("measured")
+
+        monkeypatch.setattr(cachemaint, "_measure", no_walk)
+        assert cachemaint.enforce_budget(cache, budget=1000) == 0
+
+
+class TestTrash:
+    def _spawned(self, monkeypatch):
+        from .. import cachemaint
+
+        started = []
+
+        class Proc:
+            pid = 1  # always alive
+
+        def popen(cmd, **kwargs):
+            started.append(cmd[-1])
+            return Proc()
+
+        monkeypatch.setattr(cachemaint.subprocess, "Popen", popen)
+        return started
+
+    def test_one_removal_per_item(self, cache, monkeypatch):
+        from ..cachemaint import _empty_trash
+
+        started = self._spawned(monkeypatch)
+        (cache / ".trash" / "a.1").mkdir(parents=True)
+
+        _empty_trash(cache)
+        _empty_trash(cache)
+
+        assert started == [str(cache / ".trash" / "a.1.deleting")]
+        assert not (cache / ".trash" / "a.1").exists()
+
+    def test_a_killed_removal_is_started_again(self, cache, monkeypatch):
+        from ..cachemaint import _empty_trash
+
+        started = self._spawned(monkeypatch)
+        trash = cache / ".trash"
+        (trash / "a.1.deleting").mkdir(parents=True)
+        (trash / "a.1.deleting.pid").write_text("999999999")
+        (trash / "b.2.deleting.pid").write_text("999999999")
+
+        _empty_trash(cache)
+
+        assert started == [str(trash / "a.1.deleting")]
+        assert not (trash / "b.2.deleting.pid").exists()
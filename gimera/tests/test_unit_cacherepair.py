@@ -0,0 +1,107 @@
+"""A failed cache fetch is repaired in tiers; a reclone only for corruption."""
+
+import os
+import time
+
+import pytest
+
+from .. import cacherepair
+from ..fetch import _fetch_and_verify
+from ..repo import Repo
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    origin = make_origin(tmp_path / "origin")
+    path = tmp_path / "cache"
+    git_out(tmp_path, "clone", "-q", "--bare", str(origin), str(path))
+    return path
+
+
+def _refetch(path, errors):
+    return lambda: _fetch_and_verify(Repo(path), "origin", "main", errors=errors)
+
+
+def _age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def _recover(path, errors):
+    return cacherepair.recover(path, _refetch(path, errors), "main", errors=errors)
+
+
+def test_stale_lock_is_removed(cache):
+    lock = cache / "refs" / "heads" / "main.lock"
+    lock.touch()
+    _age(lock, cacherepair.STALE_LOCK_AGE + 60)
+    errors = []
+    assert not _refetch(cache, errors)()
+
+    assert _recover(cache, errors) == "stale locks"
+    assert not lock.exists()
+
+
+def test_fresh_lock_is_left_alone(cache):
+    lock = cache / "refs" / "heads" / "main.lock"
+    lock.touch()
+
+    assert not cacherepair.remove_stale_locks(cache)
+    assert lock.exists()
+
+
+def test_broken_ref_is_dropped(cache):
+    (cache / "refs" / "heads" / "main").write_text("garbage\n")
+    errors = []
+    assert not _refetch(cache, errors)()
+
+    assert _recover(cache, errors) == "broken refs"
+    assert git_out(cache, "rev-parse", "main")
+
+
+def test_corrupt_store_asks_for_a_reclone(cache):
+    errors = [f"fatal: loose object {'1' * 40} (stored in x) is corrupt\n"]
+
+    assert cacherepair.recover(cache, lambda: False, "main", errors=errors) is None
+
+
+def test_intact_store_is_kept(cache):
+    sha = git_out(cache, "rev-parse", "main")
+    errors = ["error: cannot lock ref 'refs/heads/main': is at 1 but expected 2\n"]
+
+    with pytest.raises(Exception, match="cache is kept"):
+        cacherepair.recover(cache, lambda: False, "main", errors=errors)
+    # the branch that was dropped for the refetch is back
+    assert git_out(cache, "rev-parse", "main") == sha
+
+
+def test_remote_failures_touch_nothing(cache, monkeypatch):
+    def no_repair(*args, **kwargs):
+        raise AssertionError("repaired the cache")
+
+    monkeypatch.setattr(
+        cacherepair, "TIERS", [(x[0], x[1], no_repair) for x in cacherepair.TIERS]
+    )
+    errors = ["fatal: Could not read from remote repository.\n"]
+
+    with pytest.raises(Exception, match="not because of the cache"):
+        cacherepair.recover(cache, lambda: False, "main", errors=errors)
+
+
+def test_commit_graph_stays_unless_git_complains(cache):
+    git_out(cache, "commit-graph", "write", "--reachable")
+    graph = cache / "objects" / "info" / "commit-graph"
+    assert graph.exists()
+    errors = ["fatal: bad object refs/heads/main\n"]
+
+    with pytest.raises(Exception, match="cache is kept"):
+        cacherepair.recover(cache, lambda: False, "main", errors=errors)
+    assert graph.exists()
+
+    errors.append("fatal: commit-graph has incorrect fanout values\n")
+    with pytest.raises(Exception, match="cache is kept"):
+        cacherepair.recover(cache, lambda: False, "main", errors=errors)
+    assert not graph.exists()
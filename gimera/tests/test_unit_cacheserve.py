@@ -0,0 +1,143 @@
+"""Peers serve their cache over HTTP; a local server stands in for them."""
+
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from ..cachedir import _clone_or_restore
+from ..cachedir import _ensure_sha
+from ..cachedir import _make_cache_path
+from ..cacheserve import make_server
+from ..repo import Repo
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def peer(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    origin = make_origin(tmp_path / "origin")
+    url = f"file://{origin}"
+
+    peer_root = tmp_path / "peer"
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(peer_root))
+    peer_entry = _make_cache_path(url)
+    peer_entry.parent.mkdir(parents=True)
+    git_out(tmp_path, "clone", "-q", "--bare", url, str(peer_entry))
+    # only the peer has this branch: proof of where a clone came from
+    git_out(peer_entry, "branch", "peer-only", "main")
+
+    server = make_server(port=0, root=peer_root)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    address = f"http://127.0.0.1:{server.server_address[1]}"
+
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "local"))
+    monkeypatch.setenv("GIMERA_CACHE_PEERS", address)
+    golden_path = _make_cache_path(url)
+    golden_path.parent.mkdir(parents=True)
+    yield SimpleNamespace(
+        origin=origin,
+        url=url,
+        address=address,
+        peer_entry=peer_entry,
+        golden_path=golden_path,
+        tmp_path=tmp_path,
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def _create(peer, partial=False):
+    _clone_or_restore(
+        Repo(peer.tmp_path),
+        peer.url,
+        peer.golden_path,
+        peer.golden_path,
+        partial=partial,
+    )
+
+
+def test_clone_comes_from_the_peer(peer):
+    _create(peer)
+
+    assert git_out(peer.golden_path, "rev-parse", "--verify", "peer-only")
+    assert git_out(peer.golden_path, "config", "remote.origin.url") == peer.url
+
+
+def test_what_the_peer_lacks_comes_from_upstream(peer, capsys):
+    _create(peer)
+    sha = commit_file(peer.origin, "two")
+    repo_yml = SimpleNamespace(url=peer.url, sha=sha, branch="main", path="x")
+
+    assert _ensure_sha(repo_yml, peer.golden_path, update=False)
+
+    assert "by sha" in capsys.readouterr().out
+
+
+def test_pinned_sha_from_the_peer(peer, capsys):
+    _create(peer)
+    sha = commit_file(peer.origin, "two")
+    git_out(peer.peer_entry, "fetch", "-q", "origin", "main:main")
+    repo_yml = SimpleNamespace(url=peer.url, sha=sha, branch="main", path="x")
+
+    assert _ensure_sha(repo_yml, peer.golden_path, update=False)
+
+    assert f"by peer {peer.address}" in capsys.readouterr().out
+
+
+def test_partial_clone_from_the_peer(peer):
+    _create(peer, partial=True)
+
+    assert git_out(peer.golden_path, "config", "remote.origin.promisor") == "true"
+
+
+def test_unknown_entry_falls_through(peer, monkeypatch):
+    peer.peer_entry.rename(peer.peer_entry.with_name("elsewhere"))
+    _create(peer)
+
+    assert git_out(peer.golden_path, "rev-parse", "main")
+    with pytest.raises(subprocess.CalledProcessError):
+        git_out(peer.golden_path, "rev-parse", "--verify", "peer-only")
+
+
+def test_pushes_are_refused(peer):
+    work = peer.tmp_path / "work"
+    served = f"{peer.address}/{peer.peer_entry.name}"
+    git_out(peer.tmp_path, "clone", "-q", served, str(work))
+    git_out(work, "config", "user.email", "t@t.t")
+    git_out(work, "config", "user.name", "t")
+    commit_file(work, "evil")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        git_out(work, "push", "origin", "main")
+
+
+def test_an_entry_is_pinned_only_while_it_is_served(peer, monkeypatch):
+    from .. import cachedir
+    from .. import cacheserve
+
+    monkeypatch.setattr(cachedir, "_in_use_here", set())
+    pins = cachedir.in_use_dir() / str(os.getpid())
+    seen = []
+    real = cachedir.in_use_while
+
+    @contextmanager
+    def watching(name):
+        with real(name):
+            seen.append(pins.read_text().split())
+            yield
+
+    monkeypatch.setattr(cacheserve, "in_use_while", watching)
+    served = f"{peer.address}/{peer.peer_entry.name}"
+    git_out(peer.tmp_path, "clone", "-q", served, str(peer.tmp_path / "work"))
+
+    assert seen and all(x == [peer.peer_entry.name] for x in seen)
+    assert not pins.exists()
@@ -0,0 +1,66 @@
+"""A missing pinned sha is fetched the cheapest way the server allows."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from ..cachedir import _ensure_sha
+from ..repo import Repo
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    origin = make_origin(tmp_path / "origin")
+    cache = tmp_path / "cache"
+    git_out(tmp_path, "clone", "-q", "--bare", f"file://{origin}", str(cache))
+    return SimpleNamespace(origin=origin, cache=cache)
+
+
+def _repo_yml(sha):
+    return SimpleNamespace(
+        url="git@github.com:o/x.git", sha=sha, branch="main", path="addons/x"
+    )
+
+
+def test_exact_sha_first(setup, capsys):
+    git_out(setup.origin, "checkout", "-qb", "feature")
+    sha = commit_file(setup.origin, "two")
+    git_out(setup.origin, "checkout", "-q", "main")
+
+    assert _ensure_sha(_repo_yml(sha), setup.cache, update=False)
+
+    assert Repo(setup.cache).contain_commit(sha)
+    assert f"{sha[:10]} for addons/x by sha" in capsys.readouterr().out
+    # nothing else came along, and a ref keeps it from the next gc
+    refs = git_out(setup.cache, "for-each-ref", "--format=%(objectname) %(refname)")
+    assert "feature" not in refs
+    assert f"{sha} refs/gimera/pins/{sha}" in refs.splitlines()
+    git_out(setup.cache, "gc", "-q", "--prune=now")
+    assert Repo(setup.cache).contain_commit(sha)
+
+
+def test_falls_back_to_the_branch(setup, capsys):
+    # protocol v0 without allowReachableSHA1InWant refuses unadvertised shas
+    git_out(setup.cache, "config", "protocol.version", "0")
+    sha = commit_file(setup.origin, "two")
+    commit_file(setup.origin, "three")
+
+    assert _ensure_sha(_repo_yml(sha), setup.cache, update=False)
+
+    assert "by branch main" in capsys.readouterr().out
+
+
+def test_present_sha_fetches_nothing(setup):
+    sha = git_out(setup.origin, "rev-parse", "HEAD")
+    assert not _ensure_sha(_repo_yml(sha), setup.cache, update=False)
+
+
+def test_unknown_sha_is_an_error(setup):
+    with pytest.raises(Exception, match="was not found"):
+        _ensure_sha(_repo_yml("1" * 40), setup.cache, update=False)
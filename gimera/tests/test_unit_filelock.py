@@ -6,6 +6,9 @@ from pathlib import Path
 import pytest
 
 from ..filelock import FileLock, FileLockException
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
 
 
 @pytest.fixture
@@ -138,3 +141,94 @@ def test_stale_lock_is_cleaned_up_instead_of_blocking(tmp_path, monkeypatch):
 
     assert time.time() - started < 30, "blocked on a lock it should have cleared"
     assert not index_lock.exists()
+
+
+def test_cache_lock_is_taken_again_by_the_same_thread_only(tmp_path):
+    import threading
+
+    from ..cachedir import cache_lock
+
+    entry = tmp_path / "entry"
+    other = []
+    with cache_lock(entry):
+        with cache_lock(entry):
+            pass
+        assert Path(f"{entry}.lock").exists(), "the inner one did not release"
+
+        def take():
+            try:
+                with cache_lock(entry, timeout=0.2):
+                    other.append("got it")
+            except FileLockException:
+                other.append("waited")
+
+        thread = threading.Thread(target=take)
+        thread.start()
+        thread.join()
+    assert other == ["waited"]
+    assert not Path(f"{entry}.lock").exists()
+
+
+def test_cache_lock_of_a_live_holder_is_not_broken(tmp_path):
+    """An hour-long fetch in another process keeps its lock, whatever the timeout."""
+    import socket
+
+    from ..cachedir import cache_lock
+
+    entry = tmp_path / "entry"
+    lockfile = Path(f"{entry}.lock")
+    lockfile.write_text(f"{os.getpid()} {socket.gethostname()}\n")
+    old = time.time() - 2 * 3600
+    os.utime(lockfile, (old, old))
+
+    with pytest.raises(FileLockException):
+        with cache_lock(entry, timeout=0.2):
+            pass
+    assert lockfile.exists()
+
+
+def test_cache_lock_of_a_dead_holder_is_removed(tmp_path):
+    import socket
+
+    from ..cachedir import cache_lock
+
+    entry = tmp_path / "entry"
+    lockfile = Path(f"{entry}.lock")
+    lockfile.write_text(f"999999999 {socket.gethostname()}\n")
+
+    with cache_lock(entry, timeout=1):
+        assert lockfile.read_text().split()[0] != "999999999"
+    assert not lockfile.exists()
+
+
+def test_a_fetch_waits_for_maintenance(tmp_path, monkeypatch):
+    """Compaction swaps the entry under cache_lock; a fetch in between was lost."""
+    import threading
+    from types import SimpleNamespace
+
+    from ..fetch import _set_url_and_fetch
+    from ..repo import Repo
+
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    origin = make_origin(tmp_path / "origin")
+    entry = tmp_path / "entry"
+    git_out(tmp_path, "clone", "-q", "--bare", f"file://{origin}", str(entry))
+    commit_file(origin, "two")
+    repo_yml = SimpleNamespace(
+        url=f"file://{origin}", sha=None, branch="main", path="x"
+    )
+    done = threading.Event()
+
+    def fetch():
+        _set_url_and_fetch(Repo(entry), repo_yml, "origin", repo_yml.url)
+        done.set()
+
+    # held by another process, as `gimera cache compact` does
+    with FileLock(str(entry), timeout=1, delay=0.01):
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        assert not done.wait(0.5)
+    thread.join(30)
+
+    assert done.is_set()
+    assert git_out(entry, "rev-parse", "main") == git_out(origin, "rev-parse", "main")
@@ -0,0 +1,107 @@
+"""Network git commands are killed when they stall instead of hanging."""
+
+import os
+import subprocess
+import time
+
+import pytest
+
+from .. import tools
+from ..tools import GitTimeout
+from ..tools import X
+
+
+@pytest.fixture
+def fake_git(tmp_path, monkeypatch):
+    """A `git` that runs the given shell script instead."""
+    monkeypatch.setenv("GIMERA_GIT_RETRIES", "0")
+    monkeypatch.setenv("GIMERA_GIT_IDLE_TIMEOUT", "0.5")
+    monkeypatch.delenv("GIMERA_GIT_TIMEOUT", raising=False)
+    path = tmp_path / "git"
+
+    def make(script):
+        path.write_text("#!/bin/sh\n" + script)
+        path.chmod(0o755)
+        return str(path)
+
+    return make
+
+
+def _alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # a zombie is dead, only not reaped yet
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_stalled_fetch_is_killed(fake_git):
+    git = fake_git("sleep 30\n")
+
+    begin = time.time()
+    with pytest.raises(GitTimeout, match="no progress"):
+        X(git, "fetch", "origin", "main")
+    assert time.time() - begin < 10
+
+
+def test_progress_keeps_it_alive(fake_git):
+    git = fake_git(
+        'for i in 1 2 3 4 5 6; do printf "Receiving objects: $i\\r" >&2; '
+        "sleep 0.2; done\necho done\n"
+    )
+
+    assert X(git, "fetch", "origin", "main", output=True) == "done"
+
+
+def test_total_timeout(fake_git, monkeypatch):
+    monkeypatch.setenv("GIMERA_GIT_TIMEOUT", "0.5")
+    git = fake_git('while true; do echo "still here" >&2; sleep 0.1; done\n')
+
+    with pytest.raises(GitTimeout, match="longer than"):
+        X(git, "clone", "url", "dir")
+
+
+def test_whole_process_group_goes(fake_git, tmp_path):
+    pidfile = tmp_path / "child.pid"
+    git = fake_git(f"sleep 30 &\necho $! > {pidfile}\nwait\n")
+
+    with pytest.raises(GitTimeout):
+        X(git, "fetch", "origin")
+
+    pid = int(pidfile.read_text())
+    for _ in range(50):
+        if not _alive(pid):
+            break
+        time.sleep(0.1)
+    assert not _alive(pid)
+
+
+def test_retried_after_a_stall(fake_git, tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_GIT_RETRIES", "1")
+    monkeypatch.setattr(tools.time, "sleep", lambda seconds: None)
+    counter = tmp_path / "attempts"
+    git = fake_git(
+        f"echo x >> {counter}\n"
+        f'[ "$(wc -l < {counter})" -gt 1 ] && {{ echo ok; exit 0; }}\n'
+        "sleep 30\n"
+    )
+
+    assert X(git, "fetch", "origin", output=True) == "ok"
+    assert len(counter.read_text().splitlines()) == 2
+
+
+def test_failure_is_a_called_process_error(fake_git):
+    git = fake_git("echo 'fatal: repository not found' >&2\nexit 128\n")
+
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        X(git, "fetch", "origin", output=True)
+    assert "repository not found" in ex.value.stderr
+    assert X(git, "fetch", "origin", output=True, allow_error=True) == ""
+
+
+def test_only_network_commands_are_supervised():
+    assert tools._network_git(["git", "-c", "a=b", "fetch", "origin"]) == 3
+    assert tools._network_git(["git", "-C", "x", "submodule", "update", "p"]) == 4
+    assert tools._network_git(["git", "status"]) is None
+    assert tools._network_git(["rsync", "fetch"]) is None
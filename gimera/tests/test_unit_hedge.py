@@ -0,0 +1,105 @@
+"""Hedged fetches: the other protocol starts when the first one hangs."""
+
+import subprocess
+import time
+
+import pytest
+
+from .. import hedge
+
+
+@pytest.fixture(autouse=True)
+def _cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(hedge, "_answered", {})
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """url -> shell command standing in for `git ls-remote`."""
+    started = []
+    commands = {}
+
+    def probe(url, branch):
+        started.append(url)
+        return subprocess.Popen(
+            ["sh", "-c", commands[url]], start_new_session=True
+        )
+
+    monkeypatch.setattr(hedge, "_probe", probe)
+    return commands, started
+
+
+def test_other_protocol_wins_when_the_first_hangs(probes):
+    commands, started = probes
+    commands.update({"slow": "sleep 30", "fast": "true"})
+
+    begin = time.time()
+    assert hedge.race(["slow", "fast"], "main", delay=0.2) == "fast"
+    assert time.time() - begin < 5
+
+
+def test_quick_answer_starts_nothing_else(probes):
+    commands, started = probes
+    commands.update({"fast": "true", "other": "true"})
+
+    assert hedge.race(["fast", "other"], "main", delay=5) == "fast"
+    assert started == ["fast"]
+
+
+def test_failure_starts_the_next_right_away(probes):
+    commands, started = probes
+    commands.update({"broken": "false", "other": "true"})
+
+    begin = time.time()
+    assert hedge.race(["broken", "other"], "main", delay=30) == "other"
+    assert time.time() - begin < 5
+
+
+def test_nobody_answers(probes):
+    commands, started = probes
+    commands.update({"a": "false", "b": "false"})
+
+    assert hedge.race(["a", "b"], "main", delay=0.1) is None
+
+
+def test_the_winner_goes_first_next_time():
+    ssh = "git@github.com:odoo/odoo.git"
+    https = "https://github.com/odoo/odoo.git"
+    assert hedge.candidates(ssh) == [ssh, https]
+
+    hedge.remember(https)
+
+    assert hedge.candidates(ssh) == [https, ssh]
+    assert hedge.candidates(https) == [https, ssh]
+
+
+def test_local_urls_are_not_hedged():
+    assert hedge.candidates("file:///tmp/repo") == ["file:///tmp/repo"]
+
+
+def test_a_remembered_protocol_that_hangs_costs_only_the_delay(probes):
+    commands, started = probes
+    ssh = "git@github.com:odoo/odoo.git"
+    https = "https://github.com/odoo/odoo.git"
+    commands.update({https: "sleep 30", ssh: "true"})
+    hedge.remember(https)
+
+    begin = time.time()
+    assert hedge.pick_url(ssh, "main", delay=0.2) == ssh
+    assert time.time() - begin < 5
+    assert started == [https, ssh]
+
+
+def test_a_host_is_raced_once_per_run(probes):
+    commands, started = probes
+    ssh = "git@github.com:odoo/odoo.git"
+    https = "https://github.com/odoo/odoo.git"
+    commands.update({https: "true", ssh: "true"})
+    hedge.remember(https)
+
+    assert hedge.pick_url(ssh, "main", delay=5) == https
+    assert hedge.pick_url("git@github.com:OCA/web.git", "main", delay=5) == (
+        "https://github.com/OCA/web.git"
+    )
+    assert started == [https]
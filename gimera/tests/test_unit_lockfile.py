@@ -0,0 +1,205 @@
+"""gimera.lock records what an apply produced; --frozen only compares."""
+
+import shutil
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from .. import lockfile
+from ..apply import _apply
+from ..config import Config
+from ..repo import Repo
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("GIMERA_WRITE_LOCK", raising=False)
+
+    upstream = init_repo(tmp_path / "upstream")
+    sha = commit_file(upstream, "print('hello')\n", name="module.py", message="one")
+
+    main = init_repo(tmp_path / "main")
+    (main / ".gitignore").write_text(".gimera\n")
+    (main / "gimera.yml").write_text(
+        yaml.dump(
+            {
+                "repos": [
+                    {
+                        "url": f"file://{upstream}",
+                        "branch": "main",
+                        "path": "vendor/lib",
+                        "type": "integrated",
+                        "sha": sha,
+                        "patches": ["patches/lib"],
+                    }
+                ]
+            }
+        )
+    )
+    (main / "vendor" / "lib").mkdir(parents=True)
+    (main / "vendor" / "lib" / "module.py").write_text("print('hello')\n")
+    (main / "patches" / "lib").mkdir(parents=True)
+    (main / "patches" / "lib" / "0001-fix.patch").write_text("a patch\n")
+    git_out(main, "add", ".")
+    git_out(main, "commit", "-qm", "vendored")
+    monkeypatch.chdir(main)
+    return SimpleNamespace(main=main, sha=sha)
+
+
+def _lock(project):
+    config = Config()
+    lockfile.write(Repo(project.main), config, config.repos, project.main)
+    return config
+
+
+def test_records_the_applied_state(project):
+    _lock(project)
+
+    locked = lockfile.load(Config())["vendor/lib"]
+    assert locked["sha"] == project.sha
+    assert locked["tree"] == git_out(project.main, "rev-parse", "HEAD:vendor/lib")
+    assert list(locked["patches"]) == ["patches/lib/0001-fix.patch"]
+    # the real index is left alone
+    assert git_out(project.main, "status", "--porcelain") == "?? gimera.lock"
+
+
+def test_frozen_passes_without_touching_anything(project, monkeypatch):
+    _lock(project)
+    head = git_out(project.main, "rev-parse", "HEAD")
+
+    def no_fetch(*args, **kwargs):
+        raise AssertionError("frozen apply fetched")
+
+    monkeypatch.setattr("gimera.apply._fetch_repos_in_parallel", no_fetch)
+    _apply([], None, frozen=True)
+
+    assert git_out(project.main, "rev-parse", "HEAD") == head
+
+
+@pytest.mark.parametrize(
+    "change, reason",
+    [
+        (lambda main: (main / "patches/lib/0002.patch").write_text("p\n"), "patch"),
+        (
+            lambda main: (main / "gimera.yml").write_text(
+                (main / "gimera.yml").read_text().replace("main", "dev")
+            ),
+            "gimera.yml changed",
+        ),
+    ],
+)
+def test_frozen_fails_on_drift(project, change, reason):
+    _lock(project)
+    change(project.main)
+
+    with pytest.raises(Exception, match=reason):
+        _apply([], None, frozen=True)
+
+
+def _edit_and_commit(main):
+    (main / "vendor/lib/module.py").write_text("x\n")
+    git_out(main, "commit", "-qam", "edited")
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        _edit_and_commit,
+        # fresh checkout: the directory is not committed, so it is not there
+        lambda main: shutil.rmtree(main / "vendor"),
+    ],
+)
+def test_frozen_applies_the_locked_sha_where_files_differ(
+    project, monkeypatch, change
+):
+    _lock(project)
+    # follows its branch: the sha is only in the lock
+    (project.main / "gimera.yml").write_text(
+        (project.main / "gimera.yml").read_text().replace(project.sha, "null")
+    )
+    git_out(project.main, "commit", "-qam", "follow the branch")
+    change(project.main)
+    applied = []
+    monkeypatch.setattr(
+        "gimera.apply._internal_apply",
+        lambda repos, update, *args, **kwargs: applied.append(
+            (repos, update, kwargs["no_patches"], kwargs["locked_shas"])
+        ),
+    )
+
+    _apply([], True, frozen=True)
+
+    assert applied == [
+        (["vendor/lib"], False, True, {"vendor/lib": project.sha})
+    ]
+
+
+def test_frozen_does_not_overwrite_local_edits(project, monkeypatch):
+    _lock(project)
+    (project.main / "vendor/lib/module.py").write_text("x\n")
+    monkeypatch.setattr(
+        "gimera.apply._internal_apply",
+        lambda *args, **kwargs: pytest.fail("applied over the edit"),
+    )
+
+    with pytest.raises(Exception, match="module.py"):
+        _apply([], None, frozen=True)
+
+
+def test_frozen_keeps_the_budget_with_nothing_to_do(project, monkeypatch):
+    _lock(project)
+    kept = []
+    monkeypatch.setattr("gimera.apply._enforce_cache_budget", lambda: kept.append(1))
+
+    _apply([], None, frozen=True)
+
+    assert kept == [1]
+
+
+def test_unchanged_entries_are_kept_without_looking(project, monkeypatch):
+    _lock(project)
+
+    def no_entry(*args):
+        raise AssertionError("looked at the cache and the directory")
+
+    monkeypatch.setattr(lockfile, "entry", no_entry)
+    config = Config()
+    assert not lockfile.write(Repo(project.main), config, config.repos, project.main)
+
+
+def test_frozen_needs_a_lock_file(project):
+    with pytest.raises(Exception, match="--lock"):
+        _apply([], None, frozen=True)
+
+
+def test_files_written_by_running_the_code_do_not_count(project):
+    (project.main / ".gitignore").write_text(".gimera\nvendor/\n")
+    git_out(project.main, "rm", "-rq", "--cached", "vendor")
+    git_out(project.main, "commit", "-qam", "untrack vendor")
+    _lock(project)
+
+    cache = project.main / "vendor" / "lib" / "__pycache__"
+    cache.mkdir()
+    (cache / "module.cpython-311.pyc").write_bytes(b"\0")
+
+    _apply([], None, frozen=True)
+
+
+def test_committed_with_the_project(project, monkeypatch):
+    monkeypatch.setenv("GIMERA_WRITE_LOCK", "1")
+    config = Config()
+    assert lockfile.wanted(config)
+    _lock(project)
+
+    lockfile.commit(config)
+
+    message = git_out(project.main, "log", "-1", "--format=%s")
+    assert message == "gimera: update gimera.lock"
+    assert git_out(project.main, "status", "--porcelain") == ""
@@ -0,0 +1,170 @@
+"""The manifest tells, by a stat pass, whether an untracked vendored dir changed."""
+
+import os
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from .. import manifest
+from .. import patches
+from ..consts import REPO_TYPE_INT
+from ..integrated import _dest_matches_commit
+from ..repo import Repo
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def extracted(tmp_path):
+    upstream = init_repo(tmp_path / "upstream")
+    (upstream / "module.py").write_text("print('hello')\n")
+    (upstream / "views").mkdir()
+    (upstream / "views" / "view.xml").write_text("<odoo/>\n")
+    git_out(upstream, "add", ".")
+    git_out(upstream, "commit", "-qm", "one")
+    sha = git_out(upstream, "rev-parse", "HEAD")
+
+    main = init_repo(tmp_path / "main")
+    dest = main / "enterprise"
+    dest.mkdir()
+    archive = subprocess.run(
+        ["git", "-C", str(upstream), "archive", sha], capture_output=True, check=True
+    ).stdout
+    subprocess.run(["tar", "x", "-C", str(dest)], input=archive, check=True)
+
+    repo = Repo(upstream)
+    snapshot = manifest.snapshot(repo, sha, dest)
+    tree = git_out(upstream, "rev-parse", "HEAD^{tree}")
+    manifest.write(Repo(main), dest, sha, tree, snapshot)
+    return SimpleNamespace(
+        upstream=repo, main=Repo(main), dest=dest, sha=sha, tree=tree
+    )
+
+
+def _changed(extracted):
+    return manifest.changed_files(
+        manifest.load(extracted.main, extracted.dest), extracted.dest
+    )
+
+
+def test_blobs_are_gits(extracted):
+    recorded = manifest.load(extracted.main, extracted.dest)["files"]
+
+    assert recorded["module.py"][3] == git_out(
+        extracted.upstream.path, "rev-parse", "HEAD:module.py"
+    )
+    assert manifest._blob_hash(extracted.dest / "module.py") == recorded["module.py"][3]
+    assert manifest.manifest_path(extracted.main, extracted.dest).parts[-3:] == (
+        ".gimera",
+        "manifests",
+        "enterprise.json",
+    )
+
+
+def test_unchanged_after_running_the_code(extracted):
+    cache = extracted.dest / "__pycache__"
+    cache.mkdir()
+    (cache / "module.cpython-311.pyc").write_bytes(b"\0")
+    # touched, same content
+    os.utime(extracted.dest / "views" / "view.xml")
+
+    assert _changed(extracted) == []
+    assert manifest.matches(extracted.main, extracted.dest, extracted.tree)
+    assert _dest_matches_commit(
+        extracted.upstream,
+        extracted.main,
+        extracted.dest,
+        extracted.sha,
+        main_repo=extracted.main,
+        keep_out=True,
+    )
+
+
+def test_local_changes_are_found(extracted):
+    (extracted.dest / "module.py").write_text("print('HELLO')\n")
+    (extracted.dest / "views" / "view.xml").unlink()
+    (extracted.dest / "new.py").write_text("")
+
+    assert _changed(extracted) == ["module.py", "new.py", "views/view.xml"]
+    assert not _dest_matches_commit(
+        extracted.upstream,
+        extracted.main,
+        extracted.dest,
+        extracted.sha,
+        main_repo=extracted.main,
+        keep_out=True,
+    )
+
+
+def test_other_tree_or_patches_do_not_match(extracted):
+    assert not manifest.matches(extracted.main, extracted.dest, "0" * 40)
+    assert not manifest.matches(
+        extracted.main, extracted.dest, extracted.tree, patches={"p.patch": "x"}
+    )
+    manifest.forget(extracted.main, extracted.dest)
+    assert not manifest.matches(extracted.main, extracted.dest, extracted.tree)
+
+
+def test_patched_files_are_hashed_anew(extracted):
+    snapshot = manifest.snapshot(extracted.upstream, extracted.sha, extracted.dest)
+    (extracted.dest / "module.py").write_text("print('patched')\n")
+
+    manifest.write(
+        extracted.main,
+        extracted.dest,
+        extracted.sha,
+        extracted.tree,
+        snapshot,
+        patches={"p.patch": "x"},
+    )
+
+    assert _changed(extracted) == []
+    assert manifest.load(extracted.main, extracted.dest)["files"]["module.py"][
+        3
+    ] == manifest._blob_hash(extracted.dest / "module.py")
+
+
+def test_patched_dir_matches_with_its_patches_only(extracted):
+    snapshot = manifest.snapshot(extracted.upstream, extracted.sha, extracted.dest)
+    (extracted.dest / "module.py").write_text("print('patched')\n")
+    manifest.write(
+        extracted.main,
+        extracted.dest,
+        extracted.sha,
+        extracted.tree,
+        snapshot,
+        patches={"p.patch": "x"},
+    )
+
+    def matches(patches):
+        return _dest_matches_commit(
+            extracted.upstream,
+            extracted.main,
+            extracted.dest,
+            extracted.sha,
+            main_repo=extracted.main,
+            keep_out=True,
+            patches=patches,
+        )
+
+    assert matches({"p.patch": "x"})
+    assert not matches({"p.patch": "y"})
+    assert not matches(None)
+
+
+def test_make_patches_skips_an_unchanged_dir_without_a_temp_repo(
+    extracted, monkeypatch
+):
+    monkeypatch.delenv("GIMERA_NON_INTERACTIVE", raising=False)
+
+    def no_temp_repo(*args, **kwargs):
+        raise AssertionError("built the temp repo")
+
+    monkeypatch.setattr(patches, "_if_ignored_move_to_separate_dir", no_temp_repo)
+    repo_yml = SimpleNamespace(
+        type=REPO_TYPE_INT, path=Path("enterprise"), patches=["patches/enterprise"]
+    )
+
+    patches.make_patches(extracted.main.path, extracted.main, repo_yml, {})
@@ -0,0 +1,93 @@
+"""The golden cache is filled from a LAN mirror, and from the canonical URL
+where the mirror lags behind."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from ..cachedir import _clone_or_restore
+from ..cachedir import _ensure_sha
+from ..fetch import _set_url_and_fetch
+from ..repo import Repo
+from ..userconfig import load_user_config
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    origin = make_origin(tmp_path / "origin")
+    mirror = tmp_path / "mirror.git"
+    git_out(tmp_path, "clone", "-q", "--bare", str(origin), str(mirror))
+    # the mirror has a commit only it knows, so it is visibly the source
+    git_out(mirror, "branch", "mirror-only", "main")
+
+    config = tmp_path / "gimera.json"
+    config.write_text(json.dumps({"mirrors": {"origin": f"file://{mirror}"}}))
+    monkeypatch.setenv("GIMERA_CONFIG", str(config))
+    load_user_config.cache_clear()
+    yield SimpleNamespace(
+        origin=origin, mirror=mirror, url=f"file://{origin}", tmp_path=tmp_path
+    )
+    load_user_config.cache_clear()
+
+
+def _cache(setup):
+    path = setup.tmp_path / "cache"
+    _clone_or_restore(Repo(setup.tmp_path), setup.url, setup.tmp_path / "x", path)
+    return path
+
+
+def test_cloned_from_the_mirror_but_keeps_the_canonical_url(setup):
+    cache = _cache(setup)
+
+    assert git_out(cache, "rev-parse", "--verify", "refs/heads/mirror-only")
+    assert git_out(cache, "config", "remote.origin.url") == setup.url
+
+
+def test_sha_the_mirror_lacks_comes_from_the_canonical_url(setup, capsys):
+    cache = _cache(setup)
+    sha = commit_file(setup.origin, "two")
+    repo_yml = SimpleNamespace(url=setup.url, sha=sha, branch="main", path="x")
+
+    assert _ensure_sha(repo_yml, cache, update=False)
+
+    assert "by sha" in capsys.readouterr().out
+
+
+def test_sha_on_the_mirror_comes_from_it(setup, capsys):
+    cache = _cache(setup)
+    sha = commit_file(setup.origin, "two")
+    git_out(setup.mirror, "fetch", "-q", str(setup.origin), "main:main")
+    repo_yml = SimpleNamespace(url=setup.url, sha=sha, branch="main", path="x")
+
+    assert _ensure_sha(repo_yml, cache, update=False)
+
+    assert "by mirror" in capsys.readouterr().out
+
+
+def test_branch_update_from_the_mirror(setup):
+    cache = _cache(setup)
+    commit_file(setup.origin, "two")
+    mirrored = git_out(setup.mirror, "rev-parse", "main")
+    repo_yml = SimpleNamespace(url=setup.url, sha=None, branch="main", path="x")
+
+    _set_url_and_fetch(Repo(cache), repo_yml, "origin", setup.url)
+
+    # a mirror that lags behind gives its own state, not an error
+    assert git_out(cache, "rev-parse", "main") == mirrored
+
+
+def test_update_does_not_stop_at_a_mirror_that_lags_behind(setup, capsys):
+    cache = _cache(setup)
+    head = commit_file(setup.origin, "two")
+    repo_yml = SimpleNamespace(url=setup.url, sha=None, branch="main", path="x")
+
+    _set_url_and_fetch(Repo(cache), repo_yml, "origin", setup.url, update=True)
+
+    assert git_out(cache, "rev-parse", "main") == head
+    assert "is behind, fetching from origin" in capsys.readouterr().out
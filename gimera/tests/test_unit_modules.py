@@ -4,6 +4,7 @@ config, repo. Uses small tmpdir git repos — no remote access required.
 import os
 import subprocess
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 import yaml
@@ -410,6 +411,25 @@ def test_no_tarball_is_written_any_more():
     assert not hasattr(cachedir, "_extract_tar_file")
 
 
+def test_record_use_writes_access_and_pin(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path))
+    from .. import cachedir
+    from ..cacheindex import rows
+
+    monkeypatch.setattr(cachedir, "_in_use_here", set())
+    repo_yml = SimpleNamespace(url="git@github.com:odoo/odoo", type="integrated")
+    cachedir._record_use(tmp_path / "github.com-odoo-odoo", repo_yml)
+
+    row = rows(tmp_path)["github.com-odoo-odoo"]
+    assert row["url"] == "git@github.com:odoo/odoo"
+    assert row["last_read"]
+    pins = tmp_path / ".in-use" / str(os.getpid())
+    assert pins.read_text().split() == ["github.com-odoo-odoo"]
+
+    cachedir._release_in_use()
+    assert not pins.exists()
+
+
 # ------------------------------------------------------------------
 # patches.py pure helpers
 # ------------------------------------------------------------------
@@ -445,6 +465,60 @@ def test_remove_file_from_patch_keeps_all_when_no_match():
     assert b"foo.txt" in res
 
 
+def test_technically_make_patch_leaves_index_and_history_alone(git_repo):
+    from ..patches import _apply_patchfile
+    from ..patches import _technically_make_patch
+    from ..repo import Repo
+
+    sub = git_repo / "sub"
+    sub.mkdir()
+    (sub / "a.txt").write_text("a\n")
+    (git_repo / "other.txt").write_text("staged elsewhere\n")
+    subprocess.check_call(git + ["add", "."], cwd=git_repo)
+    subprocess.check_call(git + ["commit", "-q", "-m", "sub"], cwd=git_repo)
+    (sub / "a.txt").write_text("b\n")
+    (sub / "ä.txt").write_text("new\n")
+    (git_repo / "other.txt").write_text("changed\n")
+    head = subprocess.check_output(git + ["rev-parse", "HEAD"], cwd=git_repo)
+    index = (git_repo / ".git" / "index").read_bytes()
+
+    patch = _technically_make_patch(Repo(git_repo), sub)
+
+    assert "other.txt" not in patch
+    assert subprocess.check_output(git + ["rev-parse", "HEAD"], cwd=git_repo) == head
+    assert (git_repo / ".git" / "index").read_bytes() == index
+
+    # the patch applies to the committed state and reproduces the edits
+    subprocess.check_call(git + ["stash", "-q", "-u"], cwd=git_repo)
+    patchfile = git_repo / "change.patch"
+    patchfile.write_text(patch)
+    assert _apply_patchfile(patchfile, sub)
+    assert (sub / "a.txt").read_text() == "b\n"
+    assert (sub / "ä.txt").read_text() == "new\n"
+
+
+def test_technically_make_patch_sees_same_size_edit_in_same_second(git_repo):
+    from ..patches import _technically_make_patch
+    from ..repo import Repo
+
+    sub = git_repo / "sub"
+    sub.mkdir()
+    past = int((git_repo / "README").stat().st_mtime) - 100
+    (sub / "a.txt").write_text("a\n")
+    os.utime(sub / "a.txt", (past, past))
+    subprocess.check_call(git + ["add", "."], cwd=git_repo)
+    subprocess.check_call(git + ["commit", "-q", "-m", "sub"], cwd=git_repo)
+    # same size and the recorded mtime, and the index is no newer than the
+    # file: only git's racy check tells this edit apart
+    (sub / "a.txt").write_text("b\n")
+    os.utime(sub / "a.txt", (past, past))
+    os.utime(git_repo / ".git" / "index", (past, past))
+
+    patch = _technically_make_patch(Repo(git_repo), sub)
+
+    assert "+b" in patch
+
+
 # ------------------------------------------------------------------
 # snapshot.py
 # ------------------------------------------------------------------
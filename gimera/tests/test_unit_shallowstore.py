@@ -0,0 +1,77 @@
+"""Shallow snapshots of no_cache repos survive the run that fetched them."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from .. import cachedir
+from .. import shallowstore
+from .tools import commit_file
+from .tools import git_out
+from .tools import make_origin
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    monkeypatch.setattr(cachedir, "_in_use_here", set())
+    path = make_origin(tmp_path / "origin")
+    commit_file(path, "two")
+    yield path
+    cachedir._release_in_use()
+
+
+def _repo_yml(origin, sha=None):
+    return SimpleNamespace(url=f"file://{origin}", branch="main", sha=sha)
+
+
+def test_fetches_exactly_the_pinned_commit(origin):
+    first = git_out(origin, "rev-parse", "HEAD~1")
+
+    with shallowstore.shallow_snapshot(_repo_yml(origin, first)) as path:
+        assert git_out(path, "rev-parse", "main") == first
+        assert git_out(path, "rev-list", "--count", "HEAD") == "1"
+        assert git_out(path, "show", "HEAD:file.txt") == "one"
+
+
+def test_reused_across_runs(origin, capsys):
+    sha = git_out(origin, "rev-parse", "HEAD")
+    with shallowstore.shallow_snapshot(_repo_yml(origin, sha)) as first:
+        pass
+    capsys.readouterr()
+
+    with shallowstore.shallow_snapshot(_repo_yml(origin, sha)) as second:
+        assert second == first
+    assert "Fetching" not in capsys.readouterr().out
+
+
+def test_update_takes_the_branch_head(origin):
+    old = git_out(origin, "rev-parse", "HEAD~1")
+    new = commit_file(origin, "three")
+
+    with shallowstore.shallow_snapshot(_repo_yml(origin, old), update=True) as path:
+        assert git_out(path, "rev-parse", "main") == new
+
+
+def test_least_recently_used_goes_over_budget(origin):
+    old = git_out(origin, "rev-parse", "HEAD~1")
+    with shallowstore.shallow_snapshot(_repo_yml(origin, old)) as old_path:
+        pass
+    cachedir._release_in_use()
+    with shallowstore.shallow_snapshot(_repo_yml(origin)) as new_path:
+        pass
+
+    shallowstore.enforce_budget(budget=1)
+
+    assert not old_path.exists()
+    # still pinned by this process
+    assert new_path.exists()
+
+
+def test_unknown_sha_is_an_error(origin):
+    with pytest.raises(Exception, match="Could not fetch"):
+        with shallowstore.shallow_snapshot(_repo_yml(origin, "1" * 40)):
+            pass
+    assert not list(shallowstore.store_root().glob("*@*/HEAD"))
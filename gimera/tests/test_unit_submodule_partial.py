@@ -0,0 +1,138 @@
+"""Submodules served from a partial cache entry instead of the network."""
+
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from .. import submodule
+from ..cachedir import is_partial_clone
+from ..cachedir import missing_blobs
+from ..consts import gitcmd as git
+from ..repo import Repo
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    origin = init_repo(tmp_path / "origin")
+    git_out(origin, "config", "uploadpack.allowFilter", "true")
+    sha = commit_file(origin, "tasks: []\n", name="role.yml", message="role")
+
+    cache = tmp_path / "cache" / "file----origin"
+    cache.parent.mkdir()
+    git_out(
+        tmp_path, "clone", "-q", "--bare", "--filter=blob:none",
+        f"file://{origin}", str(cache),
+    )
+
+    project = init_repo(tmp_path / "project")
+    git_out(project, "submodule", "add", "-q", f"file://{origin}", "roles/a")
+    git_out(project, "commit", "-qm", "sub")
+    # a fresh checkout of the project: the submodule is not cloned yet
+    git_out(project, "submodule", "deinit", "-q", "-f", "roles/a")
+    shutil.rmtree(project / ".git" / "modules")
+
+    @contextmanager
+    def fake_cache_dir(main_repo, repo_yml):
+        yield cache
+
+    monkeypatch.setattr(submodule, "_get_cache_dir", fake_cache_dir)
+    repo_yml = SimpleNamespace(url=f"file://{origin}", branch="main", sha=sha)
+    return SimpleNamespace(
+        origin=origin, cache=cache, project=project, repo_yml=repo_yml
+    )
+
+
+def _update(setup):
+    repo = Repo(setup.project)
+    with submodule._temporary_switch_remote_to_cachedir(
+        repo, setup.repo_yml, "roles/a"
+    ) as cache_dir:
+        options = submodule._update_options(cache_dir)
+        repo.X(
+            *(
+                git
+                + submodule._serve_options(cache_dir)
+                + ["submodule", "update", "--init"]
+                + options
+                + ["roles/a"]
+            )
+        )
+    return cache_dir
+
+
+def test_checkout_comes_from_the_partial_cache(setup):
+    assert missing_blobs(setup.cache, [setup.repo_yml.sha])
+
+    # the remote is gone: only the cache can have served the clone
+    setup.origin.rename(setup.origin.with_name("moved"))
+    moved = setup.origin.with_name("moved")
+    git_out(setup.cache, "config", "remote.origin.url", f"file://{moved}")
+    assert _update(setup) == setup.cache
+
+    sub = setup.project / "roles" / "a"
+    assert (sub / "role.yml").read_text() == "tasks: []\n"
+    assert git_out(sub, "rev-parse", "HEAD") == setup.repo_yml.sha
+    # the submodule points upstream again afterwards
+    assert git_out(sub, "config", "remote.origin.url") == setup.repo_yml.url
+    assert is_partial_clone(sub)
+
+
+def test_hydrates_only_the_commit_to_check_out(setup):
+    _update(setup)
+
+    assert missing_blobs(setup.cache, [setup.repo_yml.sha]) == []
+    # allowed for that one upload-pack, not in the entry's config
+    for key in ("uploadpack.allowFilter", "uploadpack.allowAnySHA1InWant"):
+        assert subprocess.run(
+            ["git", "-C", str(setup.cache), "config", key], capture_output=True
+        ).returncode
+
+
+def test_prefetches_the_commits_of_the_bump(setup):
+    for i in range(3):
+        (setup.origin / "role.yml").write_text(f"tasks: [{i}]\n")
+        git_out(setup.origin, "commit", "-qam", str(i))
+    git_out(setup.cache, "fetch", "-q", "origin", "+refs/heads/*:refs/heads/*")
+    old = setup.repo_yml.sha
+    setup.repo_yml.sha = git_out(setup.origin, "rev-parse", "HEAD")
+
+    _update(setup)
+
+    between = git_out(setup.origin, "rev-list", f"{old}..{setup.repo_yml.sha}")
+    assert missing_blobs(setup.cache, [old] + between.split()) == []
+
+
+def test_falls_back_to_the_remote(setup, monkeypatch):
+    def fail(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, "git", stderr="offline")
+
+    monkeypatch.setattr(submodule, "hydrate", fail)
+
+    assert _update(setup) is None
+    sub = setup.project / "roles" / "a"
+    assert (sub / "role.yml").exists()
+    assert not is_partial_clone(sub)
+
+
+def test_hydrates_under_the_cache_lock(setup, monkeypatch):
+    held = []
+    hydrate = submodule.hydrate
+
+    def watched(path, shas, **kwargs):
+        held.append(Path(f"{path}.lock").exists())
+        return hydrate(path, shas, **kwargs)
+
+    monkeypatch.setattr(submodule, "hydrate", watched)
+
+    _update(setup)
+
+    assert held == [True]
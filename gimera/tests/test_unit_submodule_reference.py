@@ -0,0 +1,99 @@
+"""Submodule clones that borrow from the golden cache via alternates, and
+get their own objects before the entry goes away."""
+
+from pathlib import Path
+
+import pytest
+
+from .. import cachedir
+from ..cacheindex import borrowers
+from ..cacheindex import record_borrower
+from ..cacheindex import record_read
+from ..repo import Repo
+from ..submodule import _reference_for
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def cache_entry(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("GIMERA_CONFIG", str(tmp_path / "no-config"))
+    work = init_repo(tmp_path / "work")
+    commit_file(work, "tasks: []\n", name="role.yml", message="role")
+    path = tmp_path / "cache" / "file----work"
+    path.parent.mkdir()
+    git_out(tmp_path, "clone", "-q", "--bare", str(work), str(path))
+    record_read(path, f"file://{work}", used_as_submodule=True)
+    return path
+
+
+@pytest.fixture
+def project(tmp_path):
+    path = init_repo(tmp_path / "project")
+    git_out(path, "commit", "-q", "--allow-empty", "-m", "init")
+    return path
+
+
+def _alternates(project, name):
+    return project / ".git" / "modules" / name / "objects" / "info" / "alternates"
+
+
+def test_off_by_default(cache_entry):
+    assert _reference_for(cache_entry) is None
+
+
+def test_never_from_outside_the_cache(cache_entry, tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_SUBMODULE_REFERENCE", "1")
+    assert _reference_for(cache_entry) == cache_entry
+    assert _reference_for(tmp_path / "work") is None
+
+
+def test_submodule_add_borrows(cache_entry, project, monkeypatch):
+    monkeypatch.setenv("GIMERA_SUBMODULE_REFERENCE", "1")
+
+    Repo(project).submodule_add(
+        "main", str(cache_entry), Path("roles/a"), reference=cache_entry
+    )
+
+    alternates = _alternates(project, "roles/a")
+    assert alternates.read_text().strip() == str(cache_entry / "objects")
+
+
+def test_eviction_dissociates_first(cache_entry, project):
+    from ..cachemaint import enforce_budget
+
+    Repo(project).submodule_add(
+        "main", str(cache_entry), Path("roles/a"), reference=cache_entry
+    )
+    gitdir = project / ".git" / "modules" / "roles" / "a"
+    record_borrower(cache_entry, gitdir)
+
+    enforce_budget(cache_entry.parent, budget=1)
+
+    assert not cache_entry.exists()
+    assert not _alternates(project, "roles/a").exists()
+    assert borrowers(cache_entry) == []
+    git_out(project / "roles" / "a", "fsck", "--no-dangling")
+    assert git_out(project / "roles" / "a", "show", "HEAD:role.yml") == "tasks: []"
+
+
+def test_vanished_borrowers_are_forgotten(cache_entry, tmp_path):
+    record_borrower(cache_entry, tmp_path / "gone")
+
+    assert cachedir.dissociate_borrowers(cache_entry)
+    assert borrowers(cache_entry) == []
+
+
+def test_a_borrowed_from_entry_is_not_cleared_if_dissociating_fails(
+    cache_entry, monkeypatch
+):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_CLEAR_CACHE", "1")
+    monkeypatch.setattr(cachedir, "dissociate_borrowers", lambda path: False)
+
+    with pytest.raises(Exception, match="still borrows"):
+        cachedir._invalidate_cache_if_needed(cache_entry)
+
+    assert (cache_entry / "objects").exists()
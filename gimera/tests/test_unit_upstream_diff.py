@@ -0,0 +1,122 @@
+"""Patches of untracked vendored dirs come from a diff against the cache."""
+
+import pytest
+import yaml
+
+from .. import patches
+from ..cachedir import _make_cache_path
+from ..config import Config
+from ..repo import Repo
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+
+    upstream = init_repo(tmp_path / "upstream")
+    (upstream / "a.py").write_text("a = 1\n")
+    (upstream / "b.py").write_text("b = 1\n")
+    git_out(upstream, "add", ".")
+    git_out(upstream, "commit", "-qm", "one")
+    sha = git_out(upstream, "rev-parse", "HEAD")
+    url = f"file://{upstream}"
+    cache = _make_cache_path(url)
+    git_out(tmp_path, "clone", "-q", "--bare", str(upstream), str(cache))
+
+    # the patch gimera.yml lists, and a vendored dir with it applied
+    (upstream / "a.py").write_text("a = 2\n")
+    patch = git_out(upstream, "diff") + "\n"
+    git_out(upstream, "checkout", "-q", "--", ".")
+
+    main = init_repo(tmp_path / "main")
+    (main / "patches").mkdir()
+    (main / "patches" / "0001-a.patch").write_text(patch)
+    (main / "gimera.yml").write_text(
+        yaml.dump(
+            {
+                "repos": [
+                    {
+                        "url": url,
+                        "branch": "main",
+                        "path": "vendor/lib",
+                        "type": "integrated",
+                        "sha": sha,
+                        "patches": ["patches"],
+                        "dont_commit": True,
+                    }
+                ]
+            }
+        )
+    )
+    git_out(main, "add", ".")
+    git_out(main, "commit", "-qm", "config")
+    lib = main / "vendor" / "lib"
+    lib.mkdir(parents=True)
+    (lib / "a.py").write_text("a = 2\n")
+    (lib / "b.py").write_text("b = 1\n")
+    (lib / "__pycache__").mkdir()
+    (lib / "__pycache__" / "a.cpython-311.pyc").write_bytes(b"\0")
+    monkeypatch.chdir(main)
+    return main
+
+
+def _repo_yml():
+    return Config().repos[0]
+
+
+def test_only_local_changes_count(project):
+    (project / "vendor" / "lib" / "b.py").write_text("b = 3\n")
+    objects = _make_cache_path(_repo_yml().url) / "objects"
+    before = set(objects.rglob("*"))
+
+    changed, patch = patches._diff_against_upstream(Repo(project), _repo_yml())
+
+    assert [str(x) for x in changed] == ["vendor/lib/b.py"]
+    assert "+b = 3" in patch and "a.py" not in patch
+    # nothing was written into the golden cache
+    assert set(objects.rglob("*")) == before
+
+
+def test_unchanged_dir(project):
+    assert patches._diff_against_upstream(Repo(project), _repo_yml()) == ([], "")
+
+
+def test_patch_git_cannot_apply_falls_back(project):
+    (project / "patches" / "0002-b.patch").write_text("not a patch\n")
+
+    assert patches._diff_against_upstream(Repo(project), _repo_yml()) is None
+
+
+def test_make_patches_without_a_temp_repo(project, monkeypatch):
+    (project / "vendor" / "lib" / "b.py").write_text("b = 3\n")
+
+    def no_temp_repo(*args, **kwargs):
+        raise AssertionError("built the temp repo")
+
+    monkeypatch.setattr(patches, "_if_ignored_move_to_separate_dir", no_temp_repo)
+    patches.make_patches(project, Repo(project), _repo_yml(), {})
+
+    (written,) = set((project / "patches").glob("*.patch")) - {
+        project / "patches" / "0001-a.patch"
+    }
+    assert "+b = 3" in written.read_text()
+
+
+def test_ignore_patterns_of_the_main_repo_are_rebased(project):
+    (project / ".gitignore").write_text(
+        "/build/\nvendor/lib/local.cfg\n*.log\n/vendor/lib\n"
+    )
+    lib = project / "vendor" / "lib"
+    (lib / "build").mkdir()
+    (lib / "build" / "c.py").write_text("c = 1\n")
+    (lib / "local.cfg").write_text("")
+    (lib / "debug.log").write_text("")
+
+    changed, patch = patches._diff_against_upstream(Repo(project), _repo_yml())
+
+    # /build/ is the main repo's build dir, not the module's
+    assert [str(x) for x in changed] == ["vendor/lib/build/c.py"]
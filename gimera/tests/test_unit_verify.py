@@ -0,0 +1,123 @@
+"""gimera verify hashes the vendored directories and compares, nothing else."""
+
+import json
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from .. import lockfile
+from .. import verify
+from ..cachedir import _make_cache_path
+from ..config import Config
+from ..repo import Repo
+from .tools import commit_file
+from .tools import git_out
+from .tools import init_repo
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    monkeypatch.setenv("GIMERA_NON_INTERACTIVE", "1")
+    monkeypatch.setenv("GIMERA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("GIMERA_WRITE_LOCK", raising=False)
+
+    upstream = init_repo(tmp_path / "upstream")
+    sha = commit_file(upstream, "print('hello')\n", name="module.py", message="one")
+
+    main = init_repo(tmp_path / "main")
+    (main / ".gitignore").write_text(".gimera\n")
+    repos = []
+    for name, patches in [("patched", ["patches/patched"]), ("plain", [])]:
+        repos.append(
+            {
+                "url": f"file://{upstream}",
+                "branch": "main",
+                "path": f"vendor/{name}",
+                "type": "integrated",
+                "sha": sha,
+                "patches": patches,
+            }
+        )
+        (main / "vendor" / name).mkdir(parents=True)
+        (main / "vendor" / name / "module.py").write_text("print('hello')\n")
+    (main / "patches" / "patched").mkdir(parents=True)
+    (main / "gimera.yml").write_text(yaml.dump({"repos": repos}))
+    git_out(main, "add", ".")
+    git_out(main, "commit", "-qm", "vendored")
+    monkeypatch.chdir(main)
+    return SimpleNamespace(main=main, upstream=upstream, sha=sha)
+
+
+def _verify():
+    config = Config()
+    results = verify.verify(Repo(config.config_file.parent), config, config.repos)
+    return {x["path"]: x for x in results}
+
+
+def test_without_lock_or_cache_nothing_is_known(project):
+    results = _verify()
+
+    assert {x["status"] for x in results.values()} == {verify.UNKNOWN}
+    assert not verify.report(results.values())
+    # only looked: nothing was cloned to find out
+    assert not _make_cache_path(f"file://{project.upstream}").exists()
+
+
+def test_unpatched_repo_is_checked_against_the_cache(project):
+    cache = _make_cache_path(f"file://{project.upstream}")
+    subprocess.run(
+        ["git", "clone", "-q", "--bare", str(project.upstream), str(cache)],
+        check=True,
+    )
+
+    results = _verify()
+
+    assert results["vendor/plain"]["status"] == verify.OK
+    assert results["vendor/plain"]["expected_from"] == "upstream"
+    # patched: the upstream tree says nothing about it
+    assert results["vendor/patched"]["status"] == verify.UNKNOWN
+
+
+def test_checked_against_the_lock(project):
+    config = Config()
+    lockfile.write(Repo(project.main), config, config.repos, project.main)
+    (project.main / "vendor" / "patched" / "module.py").write_text("x\n")
+    subprocess.run(["rm", "-rf", str(project.main / "vendor" / "plain")], check=True)
+
+    results = _verify()
+
+    assert results["vendor/patched"]["status"] == verify.MODIFIED
+    assert results["vendor/patched"]["expected_from"] == lockfile.LOCKFILE
+    assert results["vendor/plain"]["status"] == verify.MISSING
+    # nothing was staged or written
+    assert git_out(project.main, "diff", "--cached", "--name-only") == ""
+
+
+def test_json_lines(project, capsys):
+    config = Config()
+    lockfile.write(Repo(project.main), config, config.repos, project.main)
+
+    assert verify.report(_verify().values(), as_json=True)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(x)["status"] for x in lines] == [verify.OK, verify.OK]
+
+
+def test_untracked_dir_is_hashed_without_writing_objects(project):
+    tree = git_out(project.main, "rev-parse", "HEAD:vendor/plain")
+    (project.main / ".gitignore").write_text(".gimera\nvendor/\n")
+    git_out(project.main, "rm", "-rq", "--cached", "vendor")
+    git_out(project.main, "commit", "-qam", "untrack vendor")
+    repo_yml = Config().repos[1]
+
+    assert lockfile.vendored_tree(Repo(project.main), repo_yml, project.main) == tree
+
+    (project.main / "vendor" / "plain" / "new.py").write_text("new = 1\n")
+    assert lockfile.vendored_tree(Repo(project.main), repo_yml, project.main) != tree
+    blob = git_out(project.main, "hash-object", "vendor/plain/new.py")
+    assert subprocess.run(
+        ["git", "-C", str(project.main), "cat-file", "-e", blob]
+    ).returncode
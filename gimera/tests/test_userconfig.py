@@ -96,3 +96,73 @@ def test_broken_json_aborts_loudly(monkeypatch):
 def test_normalize():
     assert _normalize("git@github.com:odoo/odoo.git") == "github.com/odoo/odoo"
     assert _normalize("https://github.com/Odoo/Odoo") == "github.com/odoo/odoo"
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [(None, None), (1000, 1000), ("1K", 1024), ("500G", 500 * 1024**3), ("2gb", 2 * 1024**3)],
+)
+def test_cache_max_bytes(value, expected):
+    from ..userconfig import cache_max_bytes
+
+    _write_config({} if value is None else {"cache_max_bytes": value})
+    assert cache_max_bytes() == expected
+
+
+def test_cache_max_bytes_rejects_nonsense(monkeypatch):
+    from ..userconfig import cache_max_bytes
+
+    monkeypatch.setenv("GIMERA_EXCEPTION_THAN_SYSEXIT", "1")
+    _write_config({"cache_max_bytes": "lots"})
+    with pytest.raises(Exception):
+        cache_max_bytes()
+
+
+def test_no_cache_max_bytes_has_a_default():
+    from ..userconfig import DEFAULT_NO_CACHE_MAX_BYTES
+    from ..userconfig import no_cache_max_bytes
+
+    _write_config({})
+    assert no_cache_max_bytes() == DEFAULT_NO_CACHE_MAX_BYTES
+    _write_config({"no_cache_max_bytes": "2G"})
+    assert no_cache_max_bytes() == 2 * 1024**3
+
+
+def test_hedge_delay_is_off_by_default(monkeypatch):
+    from ..userconfig import hedge_delay
+
+    monkeypatch.delenv("GIMERA_HEDGE_DELAY", raising=False)
+    _write_config({})
+    assert hedge_delay() is None
+    _write_config({"hedge_delay": 3})
+    assert hedge_delay() == 3
+    monkeypatch.setenv("GIMERA_HEDGE_DELAY", "0")
+    assert hedge_delay() is None
+
+
+def test_mirrors_match_like_no_cache():
+    from ..userconfig import mirror_url
+
+    _write_config(
+        {
+            "mirrors": {
+                "odoo/odoo": "git@lan:odoo.git",
+                "github.com/oca/": "https://lan/oca/",
+            }
+        }
+    )
+    assert mirror_url("git@github.com:odoo/odoo.git") == "git@lan:odoo.git"
+    assert mirror_url("https://github.com/odoo/odoo") == "git@lan:odoo.git"
+    assert mirror_url("https://github.com/OCA/web.git") == "https://lan/oca/web"
+    assert mirror_url("git@github.com:odoo/enterprise.git") is None
+    assert mirror_url("https://github.com/oca2/web") is None
+
+
+def test_families_match_like_no_cache():
+    from ..userconfig import family_of
+
+    _write_config({"families": {"odoo": ["odoo/odoo", "github.com/acme/odoo"]}})
+    assert family_of("git@github.com:odoo/odoo.git") == "odoo"
+    assert family_of("https://github.com/acme/odoo") == "odoo"
+    assert family_of("https://gitlab.com/acme/odoo") is None
+    assert family_of("https://github.com/odoo/enterprise") is None
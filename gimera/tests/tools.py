@@ -38,6 +38,44 @@ def clone_and_commit(repopath, branch, checkout_options=None, commit=True):
         shutil.rmtree(path)
 
 
+def git_out(path, *args):
+    """Run git in `path`; its output, stripped. Fails on an error."""
+    return subprocess.run(
+        git + ["-C", str(path), *args],
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    ).stdout.strip()
+
+
+def init_repo(path):
+    """An empty repo on branch main that can commit."""
+    path.mkdir(parents=True, exist_ok=True)
+    git_out(path, "init", "-q", "-b", "main")
+    git_out(path, "config", "user.email", "t@t.t")
+    git_out(path, "config", "user.name", "t")
+    return path
+
+
+def commit_file(repo, content, name="file.txt", message=None):
+    """Commit `content` as `name`; returns the new sha."""
+    (repo / name).write_text(content)
+    git_out(repo, "add", name)
+    git_out(repo, "commit", "-qm", message or content)
+    return git_out(repo, "rev-parse", "HEAD")
+
+
+def make_origin(path):
+    """The upstream of a cache entry: one commit ("one" in file.txt) on main.
+
+    Serves filtered clones too, for the tests of partial caches.
+    """
+    init_repo(path)
+    git_out(path, "config", "uploadpack.allowFilter", "true")
+    commit_file(path, "one")
+    return path
+
+
 def _make_remote_repo(path):
     path.mkdir(parents=True)
     subprocess.check_call(["git", "init", "--bare", "--initial-branch=main"], cwd=path)
@@ -28,6 +28,218 @@ def yieldlist(method):
     return wrapper
 
 
+# git commands that talk to a remote: on a flaky link they can stall
+# forever, so they run supervised (see _run_supervised)
+_NETWORK_COMMANDS = {"fetch", "clone", "pull", "push", "ls-remote"}
+# those that report progress on stderr when asked to; "update" is
+# `git submodule update`, which clones
+_PROGRESS_COMMANDS = {"fetch", "clone", "pull", "push", "update"}
+
+
+class GitTimeout(subprocess.CalledProcessError):
+    """A network git command that stalled or ran too long and was killed.
+
+    A CalledProcessError, so every caller that handles a failed fetch
+    handles this one too.
+    """
+
+    def __str__(self):
+        # the last line of stderr says what happened to which command
+        return self.stderr.splitlines()[-1]
+
+
+def _network_git(params):
+    """Index of the subcommand if `params` is a network git call, else None."""
+    if not params or Path(str(params[0])).name != "git":
+        return None
+    i = 1
+    while i < len(params):
+        param = str(params[i])
+        if param in ("-c", "-C"):
+            i += 2
+            continue
+        if param.startswith("-"):
+            i += 1
+            continue
+        if param in _NETWORK_COMMANDS:
+            return i
+        if param == "submodule" and "update" in params[i + 1 :]:
+            return params.index("update", i)
+        return None
+    return None
+
+
+def _git_limits():
+    """(total timeout, idle timeout, retries) from the environment.
+
+    GIMERA_GIT_TIMEOUT - seconds a network git command may take at all
+    (default: no limit); GIMERA_GIT_IDLE_TIMEOUT - seconds it may go without
+    any output, progress included (default 600); GIMERA_GIT_RETRIES - how
+    often a killed command is started again (default 1). 0 turns a limit off.
+    """
+
+    def number(name, default):
+        try:
+            return float(os.getenv(name) or default)
+        except ValueError:
+            return float(default)
+
+    return (
+        number("GIMERA_GIT_TIMEOUT", 0) or None,
+        number("GIMERA_GIT_IDLE_TIMEOUT", 600) or None,
+        int(number("GIMERA_GIT_RETRIES", 1)),
+    )
+
+
+def _without_progress(text):
+    # "Receiving objects:  10% ...\rReceiving objects:  20% ..." -> the last
+    return "\n".join(line.split("\r")[-1] for line in text.split("\n"))
+
+
+def _terminate(proc, own_group):
+    """SIGTERM (git clone removes its half-made directory), then SIGKILL -
+    to the whole process group, so ssh and git-remote-https go too."""
+    import signal
+
+    def send(sig):
+        try:
+            if own_group:
+                os.killpg(proc.pid, sig)
+            else:
+                proc.send_signal(sig)
+        except OSError:
+            pass
+
+    if proc.poll() is not None:
+        return
+    send(signal.SIGTERM)
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        send(signal.SIGKILL)
+        proc.wait()
+
+
+def _run_supervised(params, cwd, env, output, timeout, idle_timeout):
+    """Run a network git command; kill it if it stalls or takes too long.
+
+    git is asked for --progress; every byte it writes counts as a sign of
+    life, so a slow but moving clone of odoo/odoo is fine while a connection
+    that silently hangs is killed after `idle_timeout`. Without a terminal
+    (CI) git gets its own process group, which is killed as a whole. With a
+    terminal it stays in ours, so ssh can still ask for a passphrase.
+    Returns (returncode, stdout, stderr).
+    """
+    import threading
+
+    own_group = not sys.stdin.isatty()
+    relay_raw = sys.stderr.isatty()
+    proc = subprocess.Popen(
+        params,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE if output else None,
+        stderr=subprocess.PIPE,
+        start_new_session=own_group,
+    )
+    last_activity = [time.time()]
+    chunks = {"stdout": [], "stderr": []}
+
+    def pump(stream, name, relay):
+        pending = b""
+        while True:
+            chunk = stream.read1(65536)
+            if not chunk:
+                break
+            last_activity[0] = time.time()
+            chunks[name].append(chunk)
+            if not relay:
+                continue
+            if relay_raw:
+                sys.stderr.write(chunk.decode("utf-8", "replace"))
+                sys.stderr.flush()
+                continue
+            # no terminal: complete lines only, without the progress meter
+            pending += chunk
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                sys.stderr.write(line.split(b"\r")[-1].decode("utf-8", "replace") + "\n")
+        if relay and pending and not relay_raw:
+            sys.stderr.write(pending.split(b"\r")[-1].decode("utf-8", "replace"))
+
+    # what git would have written to the terminal itself; GIMERA_QUIET asks
+    # for nothing but errors, and those are in the exception
+    relay = not output and not {"--quiet", "-q"} & set(map(str, params))
+    pumps = [threading.Thread(target=pump, args=(proc.stderr, "stderr", relay))]
+    if output:
+        pumps.append(threading.Thread(target=pump, args=(proc.stdout, "stdout", False)))
+    for thread in pumps:
+        thread.daemon = True
+        thread.start()
+
+    started = time.time()
+    reason = None
+    try:
+        while True:
+            try:
+                proc.wait(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            now = time.time()
+            if timeout and now - started > timeout:
+                reason = f"took longer than {timeout:g}s"
+            elif idle_timeout and now - last_activity[0] > idle_timeout:
+                reason = f"made no progress for {idle_timeout:g}s"
+            if reason:
+                _terminate(proc, own_group)
+                break
+    except BaseException:
+        _terminate(proc, own_group)
+        raise
+    for thread in pumps:
+        thread.join(timeout=5)
+
+    stdout = b"".join(chunks["stdout"]).decode("utf-8", "replace")
+    stderr = _without_progress(b"".join(chunks["stderr"]).decode("utf-8", "replace"))
+    if reason:
+        raise GitTimeout(
+            returncode=proc.returncode,
+            cmd=params,
+            output=stdout,
+            stderr=f"{stderr.rstrip()}\n{' '.join(map(str, params))} {reason}".strip(),
+        )
+    return proc.returncode, stdout, stderr
+
+
+def _supervised_X(params, subcommand, cwd, env, output, allow_error):
+    timeout, idle_timeout, retries = _git_limits()
+    if str(params[subcommand]) in _PROGRESS_COMMANDS:
+        params = params[: subcommand + 1] + ["--progress"] + params[subcommand + 1 :]
+    for attempt in range(retries + 1):
+        try:
+            returncode, stdout, stderr = _run_supervised(
+                params, cwd, env, output, timeout, idle_timeout
+            )
+            break
+        except GitTimeout as ex:
+            click.secho(str(ex), fg="yellow")
+            if attempt == retries:
+                if allow_error:
+                    return "" if output else None
+                raise
+            pause = min(60, 5 * 2**attempt)
+            click.secho(f"Trying again in {pause}s", fg="yellow")
+            time.sleep(pause)
+    if returncode:
+        if allow_error:
+            return "" if output else None
+        raise subprocess.CalledProcessError(
+            returncode=returncode, cmd=params, output=stdout, stderr=stderr
+        )
+    return stdout.rstrip() if output else returncode
+
+
 def X(*params, output=False, cwd=None, allow_error=False, env=None):
     """
     Catching output error and stderr
@@ -35,6 +247,9 @@ def X(*params, output=False, cwd=None, allow_error=False, env=None):
         stdout = X(output=True, .....)
     except subprocess.CalledProcessError as ex:
         stderr = ex.stderr
+
+    Network git commands (fetch, clone, ...) run supervised and raise
+    GitTimeout when they stall - see _git_limits.
     """
     params = list(filter(lambda x: x is not None, list(params)))
     env2 = {k: v for k, v in os.environ.items()}
@@ -42,6 +257,9 @@ def X(*params, output=False, cwd=None, allow_error=False, env=None):
     if params and params[0] == 'git' and os.getenv("GIMERA_QUIET") == "1":
         if any(x in params for x in ["commit", "push"]):
             params.append("--quiet")
+    subcommand = _network_git(params)
+    if subcommand is not None:
+        return _supervised_X(params, subcommand, cwd, env2, output, allow_error)
     if output:
         ret = subprocess.run(
             params,
@@ -8,7 +8,15 @@ developer machine very much does.
 Format (JSON so it stays easy to extend):
 
     {
-      "no_cache": ["odoo/odoo", "github.com/odoo/enterprise"]
+      "no_cache": ["odoo/odoo", "github.com/odoo/enterprise"],
+      "cache_max_bytes": "200G",
+      "no_cache_max_bytes": "10G",
+      "submodule_reference": true,
+      "hedge_delay": 3,
+      "mirrors": {"odoo/odoo": "git@git.office.lan:mirror/odoo.git"},
+      "cache_layers": ["/mnt/shared/gimera-cache"],
+      "peers": ["http://build-2:9419"],
+      "families": {"odoo": ["odoo/odoo", "oca/ocb", "acme/odoo"]}
     }
 
 Unknown keys are ignored on purpose - an older gimera should not refuse to
@@ -17,6 +25,7 @@ run because a newer one writes a key it does not know yet.
 
 import json
 import os
+import re
 from functools import lru_cache
 from pathlib import Path
 
@@ -106,9 +115,187 @@ def is_no_cache(url):
     return False
 
 
+def mirror_url(url):
+    """The URL of a mirror to fetch `url` from, or None.
+
+    `mirrors` maps repos to mirror URLs. A key matches like a `no_cache`
+    entry (normalized, suffix on path boundaries); a key ending in "/" is a
+    prefix instead, and the rest of the path is appended to its mirror URL -
+    "github.com/": "https://git.office.lan/github/" mirrors a whole host.
+    The golden cache entry stays the one of `url`; see cachedir.
+    """
+    mirrors = load_user_config().get("mirrors") or {}
+    if not isinstance(mirrors, dict):
+        _raise_error(f"{config_path()}: 'mirrors' must map repo names to URLs.")
+        return None
+    target = _normalize(url)
+    for pattern, mirror in mirrors.items():
+        if not mirror:
+            continue
+        prefix = _normalize(pattern)
+        if not prefix:
+            continue
+        if pattern.endswith("/"):
+            if target.startswith(prefix + "/"):
+                return mirror.rstrip("/") + "/" + target[len(prefix) + 1 :]
+        elif target == prefix or target.endswith("/" + prefix):
+            return mirror
+    return None
+
+
 def explain_no_cache(url):
     click.secho(
         f"{url}: shallow checkout, no cache "
         f"(no_cache in {config_path()} or GIMERA_NO_CACHE=1)",
         fg="yellow",
     )
+
+
+_SIZE_SUFFIXES = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def _size_setting(key):
+    """A size from the config: bytes, or "500G", "800M" etc.; None if unset.
+
+    Suffixes are accepted because nobody wants to count zeros in a config
+    file.
+    """
+    value = load_user_config().get(key)
+    if value in (None, "", 0):
+        return None
+    if isinstance(value, bool):
+        value = None
+    elif isinstance(value, (int, float)):
+        return int(value)
+    elif isinstance(value, str):
+        text = value.strip().upper().rstrip("B")
+        factor = _SIZE_SUFFIXES.get(text[-1:], 1)
+        if factor != 1:
+            text = text[:-1]
+        try:
+            return int(float(text) * factor)
+        except ValueError:
+            pass
+    _raise_error(
+        f"{config_path()}: '{key}' must be a number of bytes "
+        f"or a size like '500G', got {value!r}."
+    )
+    return None
+
+
+def cache_max_bytes():
+    """Byte budget of the golden cache, or None for no limit."""
+    return _size_setting("cache_max_bytes")
+
+
+# A handful of odoo snapshots; more than that is what the golden cache is for.
+DEFAULT_NO_CACHE_MAX_BYTES = 10 * 1024**3
+
+
+def no_cache_max_bytes():
+    """Byte budget of the shallow snapshots of no_cache repos."""
+    value = _size_setting("no_cache_max_bytes")
+    return DEFAULT_NO_CACHE_MAX_BYTES if value is None else value
+
+
+def submodule_reference():
+    """Whether submodules borrow their objects from the golden cache.
+
+    GIMERA_SUBMODULE_REFERENCE=1/0 overrides `submodule_reference` in the
+    config, so one CI job can try it without touching the machine.
+    """
+    env = os.getenv("GIMERA_SUBMODULE_REFERENCE", "")
+    if env:
+        return env == "1"
+    return bool(load_user_config().get("submodule_reference"))
+
+
+def hedge_delay():
+    """Seconds after which a fetch also tries the other protocol, or None.
+
+    GIMERA_HEDGE_DELAY overrides `hedge_delay` in the config; 0 or nothing
+    leaves the hedged fetch off.
+    """
+    value = os.getenv("GIMERA_HEDGE_DELAY", "")
+    if value == "":
+        value = load_user_config().get("hedge_delay")
+    if value in (None, "", False):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        _raise_error(
+            f"'hedge_delay' must be a number of seconds, got {value!r}."
+        )
+        return None
+    return value if value > 0 else None
+
+
+def cache_layers():
+    """Read-only cache roots below the own one, searched in this order.
+
+    GIMERA_CACHE_LAYERS (paths separated by ":") overrides `cache_layers`
+    in the config.
+    """
+    env = os.getenv("GIMERA_CACHE_LAYERS", "")
+    if env:
+        paths = env.split(os.pathsep)
+    else:
+        paths = load_user_config().get("cache_layers") or []
+        if isinstance(paths, str):
+            paths = [paths]
+        if not isinstance(paths, list):
+            _raise_error(f"{config_path()}: 'cache_layers' must be a list of paths.")
+            return []
+    return [Path(os.path.expanduser(x)) for x in paths if x]
+
+
+def cache_peers():
+    """Base URLs of other machines' `gimera cache serve`, tried in order.
+
+    GIMERA_CACHE_PEERS (separated by spaces or commas) overrides `peers` in
+    the config.
+    """
+    env = os.getenv("GIMERA_CACHE_PEERS", "")
+    if env:
+        return env.replace(",", " ").split()
+    peers = load_user_config().get("peers") or []
+    if isinstance(peers, str):
+        peers = [peers]
+    if not isinstance(peers, list):
+        _raise_error(f"{config_path()}: 'peers' must be a list of URLs.")
+        return []
+    return [x for x in peers if x]
+
+
+def family_of(url):
+    """The name of the fork family `url` belongs to, or None.
+
+    `families` maps a family name to its repos, each matched like a
+    `no_cache` entry. The entries of one family share an object pool in the
+    cache - see cachefamily.
+    """
+    families = load_user_config().get("families") or {}
+    if not isinstance(families, dict):
+        _raise_error(
+            f"{config_path()}: 'families' must map family names to lists of "
+            "repo names."
+        )
+        return None
+    target = _normalize(url)
+    for family, patterns in families.items():
+        if not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]*", family):
+            _raise_error(
+                f"{config_path()}: family name {family!r} may only contain "
+                "letters, digits, '.', '_' and '-'."
+            )
+            return None
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        for pattern in patterns or []:
+            pattern = _normalize(pattern)
+            if not pattern:
+                continue
+            if target == pattern or target.endswith("/" + pattern):
+                return family
+    return None
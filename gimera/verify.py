@@ -0,0 +1,100 @@
+"""gimera verify: is every vendored directory still what gimera put there?
+
+Re-applying answers that, at the price of a fetch and an extract per repo.
+Here the tree of every directory as it is on disk is hashed - through a copy
+of the index, or the manifest of a directory that is not committed, so only
+the files whose stat data changed are read - and compared against the tree
+it should have. Nothing is written, neither to the repo nor to the cache:
+
+  * from gimera.lock, if the repo is in there and its entry in gimera.yml
+    did not change since; that one covers patches and directories that are
+    not committed
+  * otherwise, for a repo without patches, the tree of its pinned sha, if
+    the golden cache has it already
+  * otherwise it is unknown
+
+The repos are hashed side by side. With --json every repo is one line of
+JSON, for monitoring a production deployment.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from . import lockfile
+
+OK = "ok"
+MODIFIED = "modified"
+MISSING = "missing"
+UNKNOWN = "unknown"
+
+
+def expected_tree(main_repo, repo_yml, working_dir, locked):
+    """(tree, where it comes from); (None, None) if nothing says."""
+    if locked and locked.get("tree") and not lockfile.config_drift(repo_yml, locked):
+        return locked["tree"], lockfile.LOCKFILE
+    if repo_yml.sha and not repo_yml.patches:
+        tree = lockfile._upstream_tree(main_repo, repo_yml, working_dir)
+        if tree:
+            return tree, "upstream"
+    return None, None
+
+
+def verify_repo(main_repo, repo_yml, working_dir, locked):
+    started = time.time()
+    expected, source = expected_tree(main_repo, repo_yml, working_dir, locked)
+    actual = lockfile.vendored_tree(main_repo, repo_yml, working_dir)
+    if actual is None:
+        # a submodule with local changes has no tree to compare either
+        exists = (working_dir / repo_yml.path).exists()
+        status = MODIFIED if exists else MISSING
+    elif expected is None:
+        status = UNKNOWN
+    else:
+        status = OK if actual == expected else MODIFIED
+    return {
+        "path": str(repo_yml.path),
+        "type": repo_yml.type,
+        "sha": repo_yml.sha,
+        "status": status,
+        "expected": expected,
+        "expected_from": source,
+        "actual": actual,
+        "seconds": round(time.time() - started, 3),
+    }
+
+
+def verify(main_repo, config, repos, jobs=4):
+    """One result per repo, in the order of `repos`."""
+    locked = lockfile.load(config) or {}
+    working_dir = config.config_file.parent
+    repos = [x for x in repos if x.enabled]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(
+            pool.map(
+                lambda repo_yml: verify_repo(
+                    main_repo, repo_yml, working_dir, locked.get(str(repo_yml.path))
+                ),
+                repos,
+            )
+        )
+
+
+_COLORS = {OK: "green", MODIFIED: "red", MISSING: "red", UNKNOWN: "yellow"}
+
+
+def report(results, as_json=False):
+    """Print the results; True if every repo is as expected."""
+    for result in results:
+        if as_json:
+            click.echo(json.dumps(result, sort_keys=True))
+            continue
+        line = f"{result['status']:>8}  {result['path']}"
+        if result["status"] == UNKNOWN:
+            line += " (not in gimera.lock, and patched or not pinned)"
+        elif result["expected_from"]:
+            line += f" (against {result['expected_from']})"
+        click.secho(line, fg=_COLORS[result["status"]])
+    return all(x["status"] == OK for x in results)